@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from . import metrics
+        metrics.configure(settings.METRICS_DIR)
+
+        if settings.LOG_ASYNC:
+            from .log import start_async_logging
+            start_async_logging()
@@ -0,0 +1,127 @@
+# backend/chat/log.py
+"""
+Logging helpers for the request pipeline
+
+Full payloads (context window, history, model response) are only logged for a
+sampled share of requests and truncated, and with async logging enabled the
+records are formatted and written by a listener thread instead of the
+request thread.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# Whether the current request dumps its full payloads, decided once per request
+_payload_sampled = contextvars.ContextVar('payload_sampled', default=None)
+
+_listener = None
+
+
+class Truncated:
+    """Log argument that truncates its text only when the record is actually formatted"""
+    
+    __slots__ = ('text', 'limit')
+    
+    def __init__(self, text, limit=None):
+        self.text = text
+        self.limit = limit
+    
+    def __str__(self):
+        limit = settings.LOG_PAYLOAD_MAX_CHARS if self.limit is None else self.limit
+        if not limit or len(self.text) <= limit:
+            return self.text
+        return f"{self.text[:limit]}... [{len(self.text) - limit} more chars]"
+
+
+def sample_payloads():
+    """Decide whether the current request logs its full payloads"""
+    rate = settings.LOG_PAYLOAD_SAMPLE_RATE
+    sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+    _payload_sampled.set(sampled)
+    return sampled
+
+
+def log_payload(logger, title, text):
+    """
+    Log a full payload at INFO if the current request is sampled
+    
+    Args:
+        logger: The logger to write to
+        title: What the payload is, e.g. "Context window"
+        text: The payload, truncated to LOG_PAYLOAD_MAX_CHARS when written
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    sampled = _payload_sampled.get()
+    if sampled is None:
+        sampled = sample_payloads()
+    if sampled:
+        logger.info("%s (%d chars):\n%s", title, len(text), Truncated(text), extra={'payload': title})
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including any `extra` fields"""
+    
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread"""
+    
+    def prepare(self, record):
+        return record
+
+
+def start_async_logging(logger_names=('chat',)):
+    """
+    Move the handlers of the given loggers behind a queue served by a listener thread
+    
+    Args:
+        logger_names: Loggers whose handlers are moved
+        
+    Returns:
+        The running QueueListener (the same one on repeated calls)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    
+    log_queue = queue.SimpleQueue()
+    handlers = []
+    for name in logger_names:
+        target = logging.getLogger(name)
+        handlers.extend(target.handlers)
+        for handler in list(target.handlers):
+            target.removeHandler(handler)
+        target.addHandler(DeferredQueueHandler(log_queue))
+    
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_async_logging)
+    return _listener
+
+
+def stop_async_logging():
+    """Flush the queue and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
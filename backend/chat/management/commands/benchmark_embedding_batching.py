@@ -0,0 +1,70 @@
+# backend/chat/management/commands/benchmark_embedding_batching.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chat.mock_openai import MockOpenAIServer
+from chat.services import EmbeddingBatcher, EmbeddingService
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark query embedding throughput and latency with and without "
+        "micro-batching against a local stand-in for the embeddings API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help="Concurrent callers (default: 32)")
+        parser.add_argument('--requests', type=int, default=512, help="Total embedding requests (default: 512)")
+        parser.add_argument('--window-ms', type=float, default=5, help="Batch window (default: 5)")
+        parser.add_argument('--batch-size', type=int, default=32, help="Maximum batch size (default: 32)")
+        parser.add_argument('--latency-ms', type=float, default=50, help="Stand-in API latency per call (default: 50)")
+        parser.add_argument('--api-concurrency', type=int, default=8,
+                            help="Calls the stand-in serves at once, emulating rate limits (default: 8)")
+
+    def handle(self, *args, **options):
+        with MockOpenAIServer(
+            latency_ms=options['latency_ms'],
+            max_concurrency=options['api_concurrency']
+        ) as server:
+            service = EmbeddingService()
+            service.base_url = server.base_url
+            service.embedding_model = service.embedding_model or 'benchmark'
+
+            self.stdout.write(
+                f"{options['requests']} requests from {options['concurrency']} callers, "
+                f"stand-in latency {options['latency_ms']:.0f} ms, "
+                f"{options['api_concurrency']} concurrent API calls\n"
+            )
+            self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'API calls':>11}")
+
+            results = {}
+            for mode, batcher in [
+                ('unbatched', None),
+                ('batched', EmbeddingBatcher(options['window_ms'] / 1000, options['batch_size'])),
+            ]:
+                service.batcher = batcher
+                server.reset_stats()
+                results[mode] = self._run(service, options['requests'], options['concurrency'])
+                throughput, latencies = results[mode]
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                self.stdout.write(
+                    f"{mode:<12}{throughput:>10.1f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{server.calls:>11}"
+                )
+
+            added_ms = np.median(results['batched'][1]) - np.median(results['unbatched'][1])
+            speedup = results['batched'][0] / results['unbatched'][0]
+            self.stdout.write(f"\nThroughput x{speedup:.1f}, median latency {added_ms:+.1f} ms with batching")
+
+    def _run(self, service, total, concurrency):
+        def embed(i):
+            start = time.perf_counter()
+            service.create_embedding(f"benchmark query number {i}")
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(embed, range(total)))
+        return total / (time.perf_counter() - start), latencies
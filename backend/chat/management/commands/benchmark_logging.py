@@ -0,0 +1,120 @@
+# backend/chat/management/commands/benchmark_logging.py
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from openai import OpenAI
+
+from chat.log import DeferredQueueHandler
+from chat.mock_openai import MockOpenAIServer, fake_embedding
+from chat.models import Document
+from chat.services import RAGService
+
+MODES = ['off', 'verbose-sync', 'sampled-async']
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request overhead of pipeline logging: off, verbose "
+        "synchronous logging, and sampled async logging"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per mode (default: 200)")
+        parser.add_argument('--documents', type=int, default=20, help="Documents to search (default: 20)")
+        parser.add_argument('--rounds', type=int, default=5,
+                            help="Rounds the modes are interleaved in, to spread out drift (default: 5)")
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f"logging-benchmark-{os.getpid()}")
+        log_file = tempfile.NamedTemporaryFile(suffix='.log', delete=False)
+        log_file.close()
+        chat_logger = logging.getLogger('chat')
+        saved_handlers, saved_level = list(chat_logger.handlers), chat_logger.level
+
+        try:
+            Document.objects.bulk_create([
+                Document(
+                    title=f"Benchmark document {i}",
+                    content=f"Section {i}. " + "Benchmark content about fees, limits and opening hours. " * 25,
+                    embedding=fake_embedding(f"document {i}"),
+                    is_active=True,
+                    user=user
+                )
+                for i in range(options['documents'])
+            ])
+
+            with MockOpenAIServer(latency_ms=0, per_item_ms=0) as server:
+                rag = RAGService()
+                rag.vector_search.embedding_service.base_url = server.base_url
+                rag.vector_search.embedding_service.embedding_model = 'benchmark'
+                rag.llm_service.client = OpenAI(api_key='benchmark', base_url=server.base_url)
+
+                self.stdout.write(f"{options['requests']} requests per mode, {options['documents']} documents\n")
+                self.stdout.write(f"{'mode':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'log KB':>10}")
+
+                results = {mode: ([], 0) for mode in MODES}
+                per_round = max(options['requests'] // options['rounds'], 1)
+                for _ in range(options['rounds']):
+                    for mode in MODES:
+                        latencies, log_bytes = self._run_mode(mode, rag, user, log_file.name, per_round)
+                        results[mode][0].extend(latencies)
+                        results[mode] = (results[mode][0], results[mode][1] + log_bytes)
+
+                baseline = None
+                for mode in MODES:
+                    latencies, log_bytes = results[mode]
+                    mean = np.mean(latencies)
+                    baseline = baseline if baseline is not None else mean
+                    p50, p95 = np.percentile(latencies, [50, 95])
+                    self.stdout.write(
+                        f"{mode:<16}{mean:>10.2f}{p50:>10.2f}{p95:>10.2f}{log_bytes / 1024:>10.1f}"
+                        f"   ({mean - baseline:+.2f} ms/request)"
+                    )
+        finally:
+            chat_logger.handlers, chat_logger.level = saved_handlers, saved_level
+            user.delete()
+            os.unlink(log_file.name)
+
+    def _run_mode(self, mode, rag, user, log_path, requests):
+        chat_logger = logging.getLogger('chat')
+        open(log_path, 'w').close()
+        file_handler = logging.FileHandler(log_path)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        listener = None
+
+        if mode == 'off':
+            chat_logger.handlers = [file_handler]
+            chat_logger.setLevel(logging.WARNING)
+            log_settings = {}
+        elif mode == 'verbose-sync':
+            chat_logger.handlers = [file_handler]
+            chat_logger.setLevel(logging.INFO)
+            log_settings = {'LOG_PAYLOAD_SAMPLE_RATE': 1.0, 'LOG_PAYLOAD_MAX_CHARS': 0}
+        else:
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, file_handler)
+            listener.start()
+            chat_logger.handlers = [DeferredQueueHandler(log_queue)]
+            chat_logger.setLevel(logging.INFO)
+            log_settings = {'LOG_PAYLOAD_SAMPLE_RATE': 0.01, 'LOG_PAYLOAD_MAX_CHARS': 2000}
+
+        latencies = []
+        with override_settings(**log_settings):
+            for i in range(requests + 2):
+                start = time.perf_counter()
+                rag.process_query(f"What are the fees for request {i}?", None, user=user)
+                if i >= 2:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        if listener:
+            listener.stop()
+        file_handler.close()
+        return latencies, os.path.getsize(log_path)
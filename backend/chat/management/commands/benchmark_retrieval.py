@@ -0,0 +1,220 @@
+# backend/chat/management/commands/benchmark_retrieval.py
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from chat.mock_openai import StubEmbeddingService, fake_embedding
+from chat.models import Document
+from chat.services import VectorSearchService
+from chat.timing import start_request_timer, stop_request_timer
+
+WORDS = (
+    "account billing invoice refund order shipping delivery warranty return policy "
+    "password login security profile settings subscription plan upgrade support ticket "
+    "contract payment schedule opening hours location store product manual install "
+    "update device network error report privacy data export customer service team"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark VectorSearchService.search_similar_documents on synthetic per-user "
+        "corpora with a stubbed embedding provider, writing the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000',
+                            help="Comma-separated corpus sizes in chunks (default: 1000,10000; add "
+                                 "100000 for the full suite, which needs several GB of memory)")
+        parser.add_argument('--dimensions', type=int, default=1536, help="Embedding dimensions (default: 1536)")
+        parser.add_argument('--queries', type=int, default=20, help="Searches per corpus (default: 20)")
+        parser.add_argument('--top-k', type=int, default=3, help="Documents returned per search (default: 3)")
+        parser.add_argument('--topics', type=int, default=100, help="Topic clusters per corpus (default: 100)")
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+        parser.add_argument('--label', default='baseline', help="Name of the configuration being measured")
+        parser.add_argument('--compare', help="Previous results file to compare the latencies against")
+        parser.add_argument('--rebuild', action='store_true', help="Regenerate corpora that already exist")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the synthetic corpora afterwards")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+
+        embedding_service = StubEmbeddingService(options['dimensions'])
+        search_service = VectorSearchService(embedding_service=embedding_service)
+
+        results = []
+        for size in sizes:
+            user = self._corpus(size, options['dimensions'], options['topics'], options['rebuild'])
+            results.append(self._measure(search_service, user, size, options))
+            self.stderr.write(
+                f"{size:>7} chunks: p50 {results[-1]['latency_ms']['p50']:.1f} ms, "
+                f"p95 {results[-1]['latency_ms']['p95']:.1f} ms, "
+                f"{results[-1]['db_bytes_per_search'] / 1e6:.1f} MB from the database per search"
+            )
+            if options['cleanup']:
+                user.delete()
+
+        report = {
+            'benchmark': 'retrieval',
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'database': f"{connection.vendor} {connection.cursor().connection.info.server_version}"
+                    if connection.vendor == 'postgresql' else connection.vendor,
+            },
+            'config': {
+                'dimensions': options['dimensions'],
+                'queries': options['queries'],
+                'top_k': options['top_k'],
+                'topics': options['topics'],
+            },
+            'results': results,
+        }
+
+        if options['compare']:
+            self._compare(report, options['compare'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def _corpus(self, size, dimensions, topics, rebuild):
+        """
+        Benchmark user owning a synthetic corpus of `size` chunks
+
+        Chunks are noisy copies of topic centroids, and each centroid is the stub
+        embedding of "topic <n>", so searching for a topic finds its chunks.
+        """
+        user, created = User.objects.get_or_create(
+            username=f"benchmark-retrieval-{size}-{dimensions}", defaults={'password': make_password(None)}
+        )
+        # Benchmark users can't log in; anyone else with this name is a real account
+        if not created and user.has_usable_password():
+            raise CommandError(f"User {user.username} exists and was not created by this benchmark")
+        existing = Document.objects.filter(user=user, is_active=True, embedding__isnull=False).count()
+        if existing == size and not rebuild:
+            return user
+
+        Document.objects.filter(user=user).delete()
+        self.stderr.write(f"Generating {size} chunks of {dimensions} dimensions...")
+
+        rng = np.random.default_rng(size)
+        centroids = np.array([fake_embedding(f"topic {topic}", dimensions) for topic in range(topics)])
+        batch_size = 1000
+        for start in range(0, size, batch_size):
+            count = min(batch_size, size - start)
+            topic_ids = rng.integers(0, topics, count)
+            noise = rng.standard_normal((count, dimensions)) * rng.uniform(0.015, 0.04, (count, 1))
+            vectors = centroids[topic_ids] + noise
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            Document.objects.bulk_create([
+                Document(
+                    title=f"Synthetic chunk {start + i} (topic {topic_ids[i]})",
+                    # Around 800 characters, the size of a typical chunk
+                    content=" ".join(rng.choice(WORDS, 110)),
+                    embedding=vectors[i].astype(np.float32).tolist(),
+                    source='benchmark',
+                    is_active=True,
+                    user=user,
+                )
+                for i in range(count)
+            ])
+        return user
+
+    def _measure(self, search_service, user, size, options):
+        queries = [f"topic {i % options['topics']}" for i in range(options['queries'])]
+
+        # Warm-up so connection setup and imports are not measured
+        search_service.search_similar_documents(queries[0], top_k=options['top_k'], user=user)
+
+        latencies = []
+        db_queries = 0
+        db_ms = 0.0
+        candidates = 0
+        for query in queries:
+            timer, token = start_request_timer()
+            try:
+                with connection.execute_wrapper(timer.db_wrapper):
+                    start = time.perf_counter()
+                    search_service.search_similar_documents(query, top_k=options['top_k'], user=user)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            finally:
+                stop_request_timer(token)
+            db_queries += timer.db_queries
+            db_ms += timer.db_ms
+            candidates += timer.details.get('candidates', 0)
+
+        # Peak Python allocations of one search, measured separately as tracing slows it down
+        tracemalloc.start()
+        try:
+            search_service.search_similar_documents(queries[0], top_k=options['top_k'], user=user)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # Size of the rows the search loads, the data transferred from the database
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(SUM(pg_column_size(d.*)), 0) FROM chat_document d "
+                "WHERE d.user_id = %s AND d.is_active AND d.embedding IS NOT NULL",
+                [user.pk]
+            )
+            db_bytes = cursor.fetchone()[0]
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        searches = len(queries)
+        return {
+            'chunks': size,
+            'searches': searches,
+            'latency_ms': {
+                'mean': round(float(np.mean(latencies)), 3),
+                'p50': round(float(p50), 3),
+                'p95': round(float(p95), 3),
+                'p99': round(float(p99), 3),
+                'min': round(min(latencies), 3),
+                'max': round(max(latencies), 3),
+            },
+            'candidates_per_search': candidates / searches,
+            'db_queries_per_search': db_queries / searches,
+            'db_ms_per_search': round(db_ms / searches, 3),
+            'db_bytes_per_search': int(db_bytes),
+            'peak_memory_bytes': peak_memory,
+        }
+
+    def _compare(self, report, path):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        previous = {result['chunks']: result for result in baseline.get('results', [])}
+        self.stderr.write(f"\nCompared to {baseline.get('label')} ({baseline.get('created_at')}):")
+        for result in report['results']:
+            before = previous.get(result['chunks'])
+            if before is None:
+                continue
+            change = result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1
+            result['p50_change'] = round(change, 4)
+            self.stderr.write(
+                f"{result['chunks']:>7} chunks: p50 {before['latency_ms']['p50']:.1f} -> "
+                f"{result['latency_ms']['p50']:.1f} ms ({change:+.0%})"
+            )
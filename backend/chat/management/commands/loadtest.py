@@ -0,0 +1,304 @@
+# backend/chat/management/commands/loadtest.py
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import services
+from chat.mock_openai import MockOpenAIServer, fake_embedding
+from chat.models import Document
+
+QUESTIONS = [
+    "What are your opening hours?",
+    "How do I reset my password?",
+    "Can I get a refund for my last order?",
+    "How long does shipping take to Denmark?",
+    "What does the warranty cover?",
+    "How do I upgrade my subscription plan?",
+    "Where can I download the product manual?",
+    "How do I export my account data?",
+]
+
+TOPICS = [
+    "Our opening hours are 9 to 17 on weekdays and 10 to 14 on Saturdays.",
+    "Passwords can be reset from the login page with the 'Forgot password' link.",
+    "Refunds are issued within 14 days of receiving the returned product.",
+    "Shipping within the EU takes 2 to 5 business days.",
+    "The warranty covers manufacturing defects for two years from purchase.",
+    "Subscription plans can be upgraded at any time from the account settings.",
+    "Product manuals are available as PDF downloads on the support pages.",
+    "Account data can be exported as JSON from the privacy settings.",
+]
+
+ENDPOINTS = ('chat', 'settings', 'settings_update', 'upload')
+
+# Load test users are named <prefix><n> and can't log in with a password
+USER_PREFIX = 'loadtest-'
+
+# Chat answers the app sends with a 200 when the LLM call failed or timed out
+FALLBACK_PREFIXES = ("I'm sorry", "I couldn't generate")
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_pdf(lines, pages=1):
+    """PDF with the given lines of text on each of `pages` pages"""
+    text = " ".join(f"({line.replace('(', '').replace(')', '')}) '" for line in lines)
+    content = f"BT /F1 10 Tf 50 760 Td 14 TL {text} ET".encode('latin-1')
+    font = 3 + 2 * pages
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % (3 + 2 * page) for page in range(pages)), pages
+        ),
+    ]
+    for page in range(pages):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (4 + 2 * page, font)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the chat, PDF upload and settings endpoints at increasing concurrency "
+        "against a local stand-in for the OpenAI API, reporting throughput, latency "
+        "percentiles and error rates per level"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', default='1,4,16,32',
+                            help="Comma-separated concurrency levels (default: 1,4,16,32)")
+        parser.add_argument('--duration', type=float, default=20, help="Seconds per level (default: 20)")
+        parser.add_argument('--mix', default='chat=6,settings=3,settings_update=1,upload=1',
+                            help="Endpoint weights (default: chat=6,settings=3,settings_update=1,upload=1)")
+        parser.add_argument('--url',
+                            help="Base URL of an already running server (default: serve the app in-process). "
+                                 "Point its OPENAI_BASE_URL at the stand-in started on --mock-port")
+        parser.add_argument('--mock-port', type=int, default=0, help="Port of the OpenAI stand-in (default: any)")
+        parser.add_argument('--latency-ms', type=float, default=300, help="Median stand-in API latency (default: 300)")
+        parser.add_argument('--latency-sigma', type=float, default=0.5,
+                            help="Log-normal spread of the stand-in latency (default: 0.5)")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of failing API calls (default: 0)")
+        parser.add_argument('--error-status', type=int, default=500, help="Status of failing API calls (default: 500)")
+        parser.add_argument('--api-concurrency', type=int, default=0,
+                            help="Calls the stand-in serves at once, emulating rate limits (default: unlimited)")
+        parser.add_argument('--output', help="Also write the results as JSON to this file")
+        parser.add_argument('--keep-users', action='store_true', help="Keep the load test users and their data")
+        parser.add_argument('--reuse-users', action='store_true',
+                            help="Reuse the load test users kept by an earlier --keep-users run")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['levels'].split(',')]
+            mix = {name: float(weight) for name, weight in (item.split('=') for item in options['mix'].split(','))}
+        except ValueError:
+            raise CommandError("--levels must be integers and --mix name=weight pairs")
+        unknown = set(mix) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+        mock = MockOpenAIServer(
+            latency_ms=options['latency_ms'],
+            latency_sigma=options['latency_sigma'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            max_concurrency=options['api_concurrency'],
+            port=options['mock_port'],
+        )
+
+        users = self._create_users(max(levels), options['reuse_users'])
+        app_server = None
+        try:
+            with mock:
+                if options['url']:
+                    base_url = options['url'].rstrip('/')
+                    self.stderr.write(f"OpenAI stand-in listening on {mock.base_url}")
+                else:
+                    # Services read the API location when they are created, once per request
+                    services.OPENAI_BASE_URL = mock.base_url
+                    app_server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                    app_server.set_app(get_internal_wsgi_application())
+                    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+                    host, port = app_server.server_address
+                    base_url = f"http://{host}:{port}"
+
+                results = []
+                self.stdout.write(
+                    f"{'level':>6} {'endpoint':<16}{'requests':>9}{'req/s':>8}{'p50 ms':>9}"
+                    f"{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'shed':>7}"
+                )
+                for level in levels:
+                    mock.reset_stats()
+                    level_results = self._run_level(base_url, users[:level], mix, options['duration'])
+                    level_results['api_calls'] = mock.calls
+                    level_results['api_errors'] = mock.errors
+                    results.append(level_results)
+                    self._print_level(level_results)
+        finally:
+            if app_server:
+                app_server.shutdown()
+                app_server.server_close()
+            if not options['keep_users']:
+                User.objects.filter(pk__in=[user.pk for user, _ in users]).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'benchmark': 'loadtest',
+                    'config': {
+                        key: options[key] for key in
+                        ('levels', 'duration', 'mix', 'latency_ms', 'latency_sigma', 'error_rate',
+                         'error_status', 'api_concurrency')
+                    },
+                    'results': results,
+                }, f, indent=2)
+            self.stderr.write(f"Results written to {options['output']}")
+
+    def _create_users(self, count, reuse):
+        """One user per concurrent client, each with a small corpus and an access token"""
+        usernames = [f"{USER_PREFIX}{i}" for i in range(count)]
+        # Their documents are replaced and they are deleted afterwards, so
+        # never take over an account the load test did not create
+        for user in User.objects.filter(username__in=usernames):
+            if not reuse or user.has_usable_password():
+                raise CommandError(
+                    f"User {user.username} already exists. Delete it, or pass --reuse-users "
+                    f"if an earlier --keep-users run created it"
+                )
+
+        users = []
+        for username in usernames:
+            user, _ = User.objects.get_or_create(username=username, defaults={'password': make_password(None)})
+            Document.objects.filter(user=user).delete()
+            Document.objects.bulk_create([
+                Document(
+                    title=f"Load test document {n}",
+                    content=content,
+                    embedding=fake_embedding(content),
+                    source='loadtest',
+                    is_active=True,
+                    user=user,
+                )
+                for n, content in enumerate(TOPICS)
+            ])
+            users.append((user, str(AccessToken.for_user(user))))
+        return users
+
+    def _run_level(self, base_url, users, mix, duration):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        deadline = time.monotonic() + duration
+        samples = defaultdict(list)
+        lock = threading.Lock()
+
+        def client(user_index):
+            user, token = users[user_index]
+            session = requests.Session()
+            session.headers['Authorization'] = f"Bearer {token}"
+            rng = random.Random(user_index)
+            sent = 0
+            conversation = {}
+            while time.monotonic() < deadline:
+                endpoint = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    status, failed = self._send(session, base_url, endpoint, rng, conversation, sent)
+                except requests.RequestException:
+                    status, failed = 0, True
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                sent += 1
+                with lock:
+                    samples[endpoint].append((elapsed_ms, status, failed))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            list(executor.map(client, range(len(users))))
+        elapsed = time.perf_counter() - start
+
+        endpoints = {name: self._summarize(values, elapsed) for name, values in samples.items()}
+        endpoints['all'] = self._summarize([value for values in samples.values() for value in values], elapsed)
+        return {'concurrency': len(users), 'seconds': round(elapsed, 2), 'endpoints': endpoints}
+
+    def _send(self, session, base_url, endpoint, rng, conversation, sent):
+        """Send one request, returning its status and whether it failed"""
+        if endpoint == 'chat':
+            # Five turns per conversation, continuing with the ID the server returned
+            if conversation.get('turns', 0) >= 5:
+                conversation.clear()
+            response = session.post(f"{base_url}/api/chat/", json={
+                'message': f"{rng.choice(QUESTIONS)} ({sent})",
+                'conversation_id': conversation.get('id'),
+            }, timeout=120)
+            if response.status_code == 200:
+                data = response.json()
+                conversation['id'] = data['conversation_id']
+                conversation['turns'] = conversation.get('turns', 0) + 1
+                # A failed LLM call still answers 200, with an apology
+                if data['response'].startswith(FALLBACK_PREFIXES):
+                    return response.status_code, True
+        elif endpoint == 'settings':
+            response = session.get(f"{base_url}/api/settings/", timeout=60)
+        elif endpoint == 'settings_update':
+            response = session.post(f"{base_url}/api/settings/update/", json={
+                'welcomeMessage': f"Welcome! ({sent})",
+            }, timeout=60)
+        else:
+            pdf = synthetic_pdf(rng.sample(TOPICS, 4) * 3)
+            response = session.post(f"{base_url}/api/documents/upload-pdf/", files={
+                'pdf_file': ('loadtest.pdf', pdf, 'application/pdf'),
+            }, data={'title': f"Load test upload {sent}"}, timeout=120)
+        return response.status_code, response.status_code >= 500
+
+    def _summarize(self, values, elapsed):
+        if not values:
+            return {'requests': 0}
+        latencies = np.array([latency for latency, _, _ in values])
+        statuses = [status for _, status, _ in values]
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            'requests': len(values),
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(float(p50), 1),
+            'p95_ms': round(float(p95), 1),
+            'p99_ms': round(float(p99), 1),
+            'error_rate': round(sum(1 for _, _, failed in values if failed) / len(values), 4),
+            'shed_rate': round(statuses.count(429) / len(values), 4),
+        }
+
+    def _print_level(self, level_results):
+        for name, summary in sorted(level_results['endpoints'].items(), key=lambda item: item[0] == 'all'):
+            if not summary['requests']:
+                continue
+            self.stdout.write(
+                f"{level_results['concurrency']:>6} {name:<16}{summary['requests']:>9}"
+                f"{summary['throughput']:>8.1f}{summary['p50_ms']:>9.0f}{summary['p95_ms']:>9.0f}"
+                f"{summary['p99_ms']:>9.0f}{summary['error_rate']:>8.1%}{summary['shed_rate']:>7.1%}"
+            )
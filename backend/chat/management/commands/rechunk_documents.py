@@ -0,0 +1,50 @@
+# backend/chat/management/commands/rechunk_documents.py
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from chat.models import Document
+from chat.services import DocumentProcessingService
+
+
+class Command(BaseCommand):
+    help = (
+        "Split documents ingested before hierarchical chunking into small, "
+        "embedded child chunks linked to the original row as parent section"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only re-chunk documents of this username")
+        parser.add_argument('--dry-run', action='store_true', help="List the documents without changing them")
+
+    def handle(self, *args, **options):
+        # Legacy rows are top-level documents that still carry their own embedding
+        documents = Document.objects.filter(
+            parent__isnull=True,
+            embedding__isnull=False
+        ).order_by('id')
+
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+            documents = documents.filter(user=user)
+
+        total = documents.count()
+        self.stdout.write(f"Found {total} document(s) to re-chunk")
+
+        if options['dry_run']:
+            for document in documents:
+                self.stdout.write(f"  {document.id} - {document.title}")
+            return
+
+        processing_service = DocumentProcessingService()
+        child_count = 0
+        for i, document in enumerate(documents.iterator(), start=1):
+            children = processing_service.rechunk_document(document)
+            child_count += len(children)
+            self.stdout.write(f"  [{i}/{total}] {document.title}: {len(children)} chunks")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-chunked {total} document(s) into {child_count} child chunks"
+        ))
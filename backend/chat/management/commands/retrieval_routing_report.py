@@ -0,0 +1,33 @@
+# backend/chat/management/commands/retrieval_routing_report.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import RetrievalRoutingStat
+
+
+class Command(BaseCommand):
+    help = "Report the retrieval router's decisions and the embedding calls it avoided per day"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Number of days to report (default: 7)")
+
+    def handle(self, *args, **options):
+        since = timezone.localdate() - timedelta(days=options['days'] - 1)
+        stats = RetrievalRoutingStat.objects.filter(date__gte=since).order_by('date')
+
+        days = {}
+        for stat in stats:
+            days.setdefault(stat.date, {})[stat.decision] = stat.count
+
+        self.stdout.write(f"{'date':<12}{'retrieve':>10}{'reuse':>10}{'none':>10}{'avoided':>10}{'share':>8}")
+        for date, counts in days.items():
+            retrieve = counts.get('retrieve', 0)
+            avoided = counts.get('reuse', 0) + counts.get('none', 0)
+            total = retrieve + avoided
+            share = avoided / total if total else 0
+            self.stdout.write(
+                f"{date.isoformat():<12}{retrieve:>10}{counts.get('reuse', 0):>10}"
+                f"{counts.get('none', 0):>10}{avoided:>10}{share:>8.0%}"
+            )
@@ -0,0 +1,74 @@
+# backend/chat/management/commands/slow_request_report.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from chat.models import SlowRequest
+
+
+class Command(BaseCommand):
+    help = "Summarise the slow-request log: worst endpoints and users, and the slowest requests by stage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Number of days to report (default: 7)")
+        parser.add_argument('--limit', type=int, default=10, help="Rows per section (default: 10)")
+        parser.add_argument('--endpoint', help="Only report this endpoint (URL name)")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        slow_requests = SlowRequest.objects.filter(created_at__gte=since)
+        if options['endpoint']:
+            slow_requests = slow_requests.filter(endpoint=options['endpoint'])
+        limit = options['limit']
+
+        if not slow_requests.exists():
+            self.stdout.write("No slow requests recorded")
+            return
+
+        groups = (
+            slow_requests.values('endpoint', 'user__username')
+            .annotate(
+                count=Count('id'),
+                avg_ms=Avg('duration_ms'),
+                max_ms=Max('duration_ms'),
+                total_ms=Sum('duration_ms'),
+                avg_queries=Avg('db_queries'),
+            )
+            .order_by('-total_ms')[:limit]
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Worst endpoints and users (by total slow time)"))
+        self.stdout.write(f"{'endpoint':<20}{'user':<20}{'count':>7}{'avg ms':>10}{'max ms':>10}{'queries':>9}")
+        for group in groups:
+            self.stdout.write(
+                f"{group['endpoint']:<20}{(group['user__username'] or '-'):<20}{group['count']:>7}"
+                f"{group['avg_ms']:>10.0f}{group['max_ms']:>10.0f}{group['avg_queries']:>9.1f}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(self.style.MIGRATE_HEADING("Slowest requests"))
+        for slow_request in slow_requests.select_related('user').order_by('-duration_ms')[:limit]:
+            stages = ", ".join(
+                f"{stage}={ms:.0f}" for stage, ms in
+                sorted(slow_request.stages.items(), key=lambda item: item[1], reverse=True)
+            )
+            upstream = ", ".join(
+                f"{stage} {len(calls)}x max {max(calls):.0f}"
+                for stage, calls in slow_request.upstream_calls.items() if calls
+            )
+            self.stdout.write(
+                f"{slow_request.created_at:%Y-%m-%d %H:%M:%S} {slow_request.method} {slow_request.path} "
+                f"({slow_request.user.username if slow_request.user else '-'}) "
+                f"{slow_request.duration_ms:.0f}ms status={slow_request.status_code}"
+            )
+            self.stdout.write(f"    stages: {stages or '-'}")
+            self.stdout.write(
+                f"    db: {slow_request.db_queries} queries {slow_request.db_ms:.0f}ms, "
+                f"candidates: {slow_request.candidates}, prompt tokens: {slow_request.prompt_tokens}"
+                + (f", upstream: {upstream}" if upstream else "")
+            )
+            if slow_request.queries:
+                query = slow_request.queries[0]
+                self.stdout.write(f"    slowest query ({query['ms']:.1f}ms): {query['sql'][:160]}")
@@ -0,0 +1,408 @@
+# backend/chat/metrics.py
+"""
+In-process metrics registry with Prometheus text exposition
+
+Counters, gauges and fixed-bucket histograms are kept in a store shared by
+all threads of the process. With METRICS_DIR set, every worker process
+writes its values to its own memory-mapped file in that directory and the
+/metrics endpoint sums the files of all workers, so any worker can answer a
+scrape. Counter and histogram files outlive their process (totals never go
+backwards); gauge files are removed when the process exits.
+"""
+import atexit
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+# Registered metrics, in exposition order
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_HEADER = struct.Struct('i4x')
+_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+
+
+class _MemoryStore:
+    """Metric values of this process only"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+    
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+    
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+    
+    def close(self):
+        pass
+
+
+class _MmapStore:
+    """
+    Metric values in a memory-mapped file owned by one process
+    
+    The file starts with the number of bytes in use, followed by entries of
+    [key length][key, padded to 8 bytes][float64 value]. The used size is only
+    advanced after an entry is complete, so readers never see partial entries.
+    """
+    
+    INITIAL_SIZE = 64 * 1024
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < self.INITIAL_SIZE:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        
+        self._used = _HEADER.unpack_from(self._mmap, 0)[0] or _HEADER.size
+        self._positions = {key: position for key, _, position in _read_entries(self._mmap, self._used)}
+    
+    def inc(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key) or self._add_key(key)
+            _VALUE.pack_into(self._mmap, position, _VALUE.unpack_from(self._mmap, position)[0] + amount)
+    
+    def set(self, key, value):
+        with self._lock:
+            position = self._positions.get(key) or self._add_key(key)
+            _VALUE.pack_into(self._mmap, position, value)
+    
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _read_entries(self._mmap, self._used)]
+    
+    def close(self):
+        with self._lock:
+            self._mmap.close()
+            self._file.close()
+    
+    def _add_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (-(_LENGTH.size + len(encoded)) % 8)
+        entry_size = _LENGTH.size + len(padded) + _VALUE.size
+        
+        while self._used + entry_size > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        
+        _LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[self._used + _LENGTH.size:self._used + _LENGTH.size + len(padded)] = padded
+        position = self._used + _LENGTH.size + len(padded)
+        _VALUE.pack_into(self._mmap, position, 0.0)
+        
+        self._used += entry_size
+        _HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+        return position
+
+
+def _read_entries(data, used):
+    """Yield (key, value, value position) for every entry of a store file"""
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        key_start = position + _LENGTH.size
+        key = bytes(data[key_start:key_start + length]).decode('utf-8')
+        value_position = key_start + length + (-(_LENGTH.size + length) % 8)
+        yield key, _VALUE.unpack_from(data, value_position)[0], value_position
+        position = value_position + _VALUE.size
+
+
+class _Stores:
+    """The stores of the current process, reopened after a fork"""
+    
+    def __init__(self):
+        self.directory = None
+        self._pid = None
+        self._stores = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, directory):
+        with self._lock:
+            self._close()
+            self.directory = directory
+            self._pid = None
+    
+    def get(self, kind):
+        """Store for counters (and histograms) or gauges"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # Values of a parent process stay in the parent's files
+                    self._stores = {}
+                    self._pid = pid
+        
+        store = self._stores.get(kind)
+        if store is None:
+            with self._lock:
+                store = self._stores.get(kind)
+                if store is None:
+                    if self.directory:
+                        os.makedirs(self.directory, exist_ok=True)
+                        store = _MmapStore(os.path.join(self.directory, f"{kind}_{pid}.db"))
+                    else:
+                        store = _MemoryStore()
+                    self._stores[kind] = store
+        return store
+    
+    def collect(self):
+        """Values summed over all processes"""
+        if not self.directory:
+            totals = {}
+            for kind in ('counter', 'gauge'):
+                for key, value in self.get(kind).items():
+                    totals[key] = totals.get(key, 0.0) + value
+            return totals
+        
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            if len(data) < _HEADER.size:
+                continue
+            for key, value, _ in _read_entries(data, _HEADER.unpack_from(data, 0)[0]):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+    
+    def remove_gauges(self):
+        """Drop the gauge file of this process, called at exit"""
+        store = self._stores.get('gauge')
+        if store is not None and self._pid == os.getpid() and isinstance(store, _MmapStore):
+            store.close()
+            try:
+                os.remove(store.path)
+            except FileNotFoundError:
+                pass
+    
+    def _close(self):
+        for store in self._stores.values():
+            store.close()
+        self._stores = {}
+
+
+_stores = _Stores()
+atexit.register(_stores.remove_gauges)
+
+
+def configure(directory=None):
+    """Use a shared directory for the values of all worker processes (None = this process only)"""
+    _stores.configure(directory)
+
+
+class _Metric:
+    type = None
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+    
+    def _key(self, sample, labels, **extra):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        pairs = sorted((name, str(value)) for name, value in labels.items())
+        pairs.extend(extra.items())
+        return json.dumps([sample, pairs])
+    
+    def _samples(self, values):
+        """Exposition samples as (sample name, label pairs, value)"""
+        for key, value in values:
+            sample, pairs = json.loads(key)
+            yield sample, pairs, value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    type = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        _stores.get(self.kind).inc(self._key(self.name, labels), amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, summed over worker processes"""
+    
+    type = 'gauge'
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        _stores.get(self.kind).set(self._key(self.name, labels), value)
+    
+    def inc(self, amount=1, **labels):
+        _stores.get(self.kind).inc(self._key(self.name, labels), amount)
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+    
+    type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        store = _stores.get(self.kind)
+        # Buckets are stored non-cumulative and summed up at exposition time
+        bound = next((b for b in self.buckets if value <= b), math.inf)
+        store.inc(self._key(f"{self.name}_bucket", labels, le=_format_value(bound)), 1)
+        store.inc(self._key(f"{self.name}_sum", labels), value)
+        store.inc(self._key(f"{self.name}_count", labels), 1)
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def _samples(self, values):
+        buckets = {}
+        other = []
+        for sample, pairs, value in super()._samples(values):
+            if sample.endswith('_bucket'):
+                le = dict(pairs)['le']
+                label_pairs = tuple(tuple(pair) for pair in pairs if pair[0] != 'le')
+                buckets.setdefault(label_pairs, {})[le] = value
+            else:
+                other.append((sample, pairs, value))
+        
+        for label_pairs, counts in buckets.items():
+            cumulative = 0.0
+            for bound in self.buckets + (math.inf,):
+                cumulative += counts.get(_format_value(bound), 0.0)
+                yield f"{self.name}_bucket", list(label_pairs) + [('le', _format_value(bound))], cumulative
+        yield from other
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    values = _stores.collect()
+    by_name = {}
+    for key, value in values.items():
+        by_name.setdefault(json.loads(key)[0], []).append((key, value))
+    
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        own = [
+            item for suffix in ('', '_bucket', '_sum', '_count')
+            for item in by_name.get(metric.name + suffix, [])
+        ] if metric.type == 'histogram' else by_name.get(metric.name, [])
+        for sample, pairs, value in metric._samples(own):
+            labels = ",".join(f'{name}="{_escape(str(label))}"' for name, label in pairs)
+            lines.append(f"{sample}{{{labels}}} {_format_value(value)}" if labels else
+                         f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Pipeline metrics
+CHAT_STAGE_SECONDS = Histogram(
+    'chat_stage_seconds', "Time spent per chat pipeline stage", ['stage']
+)
+CHAT_REQUEST_SECONDS = Histogram(
+    'chat_request_seconds', "End-to-end chat pipeline latency"
+)
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    'embedding_request_seconds', "Latency of embeddings API calls"
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    'embedding_batch_size', "Query embeddings sent per micro-batched embeddings API call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_ERRORS = Counter(
+    'embedding_errors_total', "Failed embeddings API calls", ['reason']
+)
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_seconds', "Latency of chat completion API calls", ['model']
+)
+LLM_ERRORS = Counter(
+    'llm_errors_total', "Failed chat completion API calls", ['model', 'reason']
+)
+RETRIEVAL_CANDIDATES = Histogram(
+    'retrieval_candidates', "Documents scored per retrieval", ['source'],
+    buckets=(1, 5, 10, 20, 50, 100, 250, 500, 1000, 5000)
+)
+RETRIEVAL_REUSE_SAVED_SECONDS = Histogram(
+    'retrieval_reuse_saved_seconds', "Estimated full search time saved per reused conversation candidate set"
+)
+DEADLINE_HITS = Counter(
+    'chat_deadline_hits_total', "Missed pipeline stage deadlines, and hedged LLM requests, by stage", ['stage']
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', "Cache lookups by cache and result (hit or miss)", ['cache', 'result']
+)
+INGESTION_CHUNKS = Counter(
+    'ingestion_chunks_total', "Chunks created and embedded during ingestion"
+)
+INGESTION_SECONDS = Counter(
+    'ingestion_seconds_total', "Time spent ingesting documents"
+)
+HTTP_REQUESTS = Counter(
+    'http_requests_total', "HTTP requests by view and status code", ['view', 'status']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', "HTTP request latency by view", ['view']
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries per HTTP request by view", ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+DB_QUERY_SECONDS = Counter(
+    'db_query_seconds_total', "Time spent in database queries"
+)
+ADMISSION_RUNNING = Gauge(
+    'admission_running', "Requests holding an admission slot by endpoint", ['endpoint']
+)
+ADMISSION_QUEUED = Gauge(
+    'admission_queued', "Requests waiting for an admission slot by endpoint", ['endpoint']
+)
+ADMISSION_SHED = Counter(
+    'admission_shed_total', "Requests shed by admission control by endpoint and reason", ['endpoint', 'reason']
+)
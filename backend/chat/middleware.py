@@ -0,0 +1,396 @@
+# backend/chat/middleware.py
+import logging
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .profiling import DeterministicProfiler, ProfilerBusy, ProfileStore, SamplingProfiler
+from .timing import start_request_timer, stop_request_timer
+from .utils import error_response, StatsCounter
+
+logger = logging.getLogger(__name__)
+
+# Requests rejected by admission control, per endpoint and reason
+ADMISSION_SHED = StatsCounter()
+
+
+def jwt_user_id(request):
+    """User id from the request's JWT access token, validated without a database query"""
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(header[1]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class _Waiter:
+    """A request waiting for a slot"""
+    
+    __slots__ = ('user_key', 'admitted', 'enqueued_at')
+    
+    def __init__(self, user_key):
+        self.user_key = user_key
+        self.admitted = False
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Concurrency limiter for one endpoint with a bounded, per-user fair wait queue
+    
+    At most `concurrency` requests run at once, and one user holds at most
+    `max_per_user` of the slots. Freed slots go to the waiting user with the
+    fewest running requests, oldest request first. A request is shed when the
+    queue is full or its expected wait exceeds the target wait. Limits apply
+    per worker process; the running, queued and shed counts are exported as
+    metrics summed over all workers.
+    
+    Args:
+        name: Endpoint name, used in logs and stats
+        concurrency: Number of requests running at the same time
+        queue_size: Maximum number of waiting requests
+        target_wait: Longest acceptable queue wait in seconds
+        max_per_user: Slots a single user may hold
+    """
+    
+    # Smoothing of the observed service time used for wait estimates
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, name, concurrency, queue_size, target_wait, max_per_user):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.queue_size = queue_size
+        self.target_wait = target_wait
+        self.max_per_user = max(max_per_user, 1)
+        self.service_time = None
+        self._condition = threading.Condition()
+        self._running = 0
+        self._running_by_user = defaultdict(int)
+        self._waiting = []
+    
+    def expected_wait(self, position=None):
+        """Estimated seconds until a request at the given queue position gets a slot"""
+        if self.service_time is None:
+            return 0.0
+        if position is None:
+            position = len(self._waiting)
+        return (position // self.concurrency + 1) * self.service_time
+    
+    def acquire(self, user_key):
+        """
+        Wait for a slot
+        
+        Returns:
+            None when admitted, otherwise the number of seconds the client should
+            wait before retrying
+        """
+        with self._condition:
+            waiter = _Waiter(user_key)
+            self._waiting.append(waiter)
+            self._dispatch()
+            if waiter.admitted:
+                return None
+            
+            # Shed right away when waiting can't meet the target
+            position = len(self._waiting) - 1
+            expected_wait = self.expected_wait(position)
+            queued_by_user = sum(1 for other in self._waiting if other.user_key == user_key)
+            reason = None
+            if position >= self.queue_size:
+                reason = 'queue_full'
+            elif expected_wait > self.target_wait:
+                reason = 'wait_exceeds_target'
+            elif queued_by_user > self.max_per_user:
+                reason = 'user_limit'
+            
+            if reason is None:
+                self._condition.wait_for(lambda: waiter.admitted, timeout=self.target_wait)
+                if waiter.admitted:
+                    return None
+                reason = 'wait_timeout'
+            
+            self._waiting.remove(waiter)
+            self._update_gauges()
+            return self._shed(reason, self.expected_wait())
+    
+    def release(self, user_key, elapsed):
+        """Free a slot and hand it to the next waiter"""
+        with self._condition:
+            self._running -= 1
+            self._running_by_user[user_key] -= 1
+            if not self._running_by_user[user_key]:
+                del self._running_by_user[user_key]
+            
+            if self.service_time is None:
+                self.service_time = elapsed
+            else:
+                self.service_time = self.EWMA_ALPHA * elapsed + (1 - self.EWMA_ALPHA) * self.service_time
+            
+            self._dispatch()
+    
+    def stats(self):
+        """Current load of the endpoint"""
+        with self._condition:
+            return {
+                'running': self._running,
+                'queued': len(self._waiting),
+                'concurrency': self.concurrency,
+                'queue_size': self.queue_size,
+                'users_running': len(self._running_by_user),
+                'service_time_seconds': round(self.service_time, 3) if self.service_time is not None else None,
+                'oldest_wait_seconds': round(time.monotonic() - self._waiting[0].enqueued_at, 3)
+                if self._waiting else 0.0,
+            }
+    
+    def _admit(self, user_key):
+        self._running += 1
+        self._running_by_user[user_key] += 1
+    
+    def _dispatch(self):
+        """Admit waiters while slots are free, fewest running requests per user first"""
+        while self._running < self.concurrency:
+            eligible = [
+                waiter for waiter in self._waiting
+                if self._running_by_user[waiter.user_key] < self.max_per_user
+            ]
+            if not eligible:
+                break
+            waiter = min(eligible, key=lambda w: (self._running_by_user[w.user_key], w.enqueued_at))
+            self._waiting.remove(waiter)
+            self._admit(waiter.user_key)
+            waiter.admitted = True
+        self._update_gauges()
+        self._condition.notify_all()
+    
+    def _update_gauges(self):
+        metrics.ADMISSION_RUNNING.set(self._running, endpoint=self.name)
+        metrics.ADMISSION_QUEUED.set(len(self._waiting), endpoint=self.name)
+    
+    def _shed(self, reason, expected_wait):
+        total = ADMISSION_SHED.incr(f"{self.name}:{reason}")
+        metrics.ADMISSION_SHED.inc(endpoint=self.name, reason=reason)
+        logger.warning("Shedding %s request (%s, %d total), %d running, %d queued",
+                       self.name, reason, total, self._running, len(self._waiting))
+        return max(math.ceil(expected_wait), 1)
+
+
+# One controller per limited endpoint, shared by all requests of the process
+CONTROLLERS = {
+    name: AdmissionController(
+        name,
+        concurrency=limits['concurrency'],
+        queue_size=limits['queue_size'],
+        target_wait=settings.ADMISSION_TARGET_WAIT_SECONDS,
+        max_per_user=settings.ADMISSION_MAX_PER_USER
+    )
+    for name, limits in settings.ADMISSION_LIMITS.items()
+}
+
+
+class AdmissionControlMiddleware:
+    """Limit concurrency of expensive endpoints and shed load with 429 responses"""
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        controller = self._controller_for(request) if settings.ADMISSION_CONTROL_ENABLED else None
+        user_key = jwt_user_id(request) if controller else None
+        
+        # Unauthenticated requests are rejected cheaply by the view itself
+        if user_key is None:
+            return self.get_response(request)
+        
+        retry_after = controller.acquire(user_key)
+        if retry_after is not None:
+            response = error_response(
+                "The server is busy, please retry shortly",
+                status=429,
+                log_error=False
+            )
+            response['Retry-After'] = str(retry_after)
+            return response
+        
+        start_time = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            controller.release(user_key, time.monotonic() - start_time)
+    
+    def _controller_for(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        return CONTROLLERS.get(match.url_name)
+
+
+def record_slow_request(request, response, timer, view):
+    """
+    Store a slow request's breakdown, keeping only the newest SLOW_REQUEST_MAX_ROWS
+    
+    Args:
+        request: The Django request
+        response: Its response
+        timer: The request's RequestTimer
+        view: URL name of the view that handled it
+    """
+    from .models import SlowRequest
+    
+    try:
+        slow_request = SlowRequest.objects.create(
+            user_id=jwt_user_id(request),
+            endpoint=view,
+            method=request.method,
+            path=request.path[:255],
+            status_code=response.status_code,
+            duration_ms=timer.total_ms(),
+            stages={stage: round(ms, 1) for stage, ms in timer.stages.items()},
+            upstream_calls={
+                stage: [round(ms, 1) for ms in timer.calls[stage]]
+                for stage in ('embed', 'llm') if stage in timer.calls
+            },
+            db_queries=timer.db_queries,
+            db_ms=timer.db_ms,
+            queries=[{'sql': sql[:1000], 'ms': round(ms, 2)} for sql, ms in timer.slowest_queries()],
+            candidates=timer.details.get('candidates', 0),
+            prompt_tokens=timer.details.get('prompt_tokens', 0),
+        )
+        SlowRequest.objects.filter(pk__lte=slow_request.pk - settings.SLOW_REQUEST_MAX_ROWS).delete()
+    except Exception as e:
+        # e.g. the user was deleted during the request
+        logger.error("Could not record slow request %s: %s", request.path, e)
+        return
+    
+    logger.warning("Slow request: %s %s took %.0fms (%s)", request.method, request.path,
+                   slow_request.duration_ms, timer.header())
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request: add a Server-Timing header with stage durations,
+    report request latency as metrics, and record requests slower than
+    SLOW_REQUEST_MS
+    
+    Database queries are only wrapped and timed when the slow-request log or
+    the database metrics (METRICS_DB_ENABLED) use them.
+    """
+    
+    def __init__(self, get_response):
+        # Removed from the middleware chain entirely when all are disabled
+        if not (settings.SERVER_TIMING_ENABLED or settings.METRICS_ENABLED or settings.SLOW_REQUEST_MS > 0):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        # Only the slowest queries are kept, as they arrive
+        db_metrics = settings.METRICS_ENABLED and settings.METRICS_DB_ENABLED
+        record_db = settings.SLOW_REQUEST_MS > 0 or db_metrics
+        timer, token = start_request_timer(
+            max_queries=settings.SLOW_REQUEST_MAX_QUERIES if settings.SLOW_REQUEST_MS > 0 else 0
+        )
+        try:
+            with connection.execute_wrapper(timer.db_wrapper) if record_db else nullcontext():
+                response = self.get_response(request)
+        finally:
+            stop_request_timer(token)
+        
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = timer.header(db=record_db)
+            if settings.SERVER_TIMING_ALLOW_ORIGIN:
+                # Let cross-origin frontends read the timings in their devtools
+                response['Timing-Allow-Origin'] = settings.SERVER_TIMING_ALLOW_ORIGIN
+        
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        if settings.METRICS_ENABLED:
+            metrics.HTTP_REQUESTS.inc(view=view, status=response.status_code)
+            metrics.HTTP_REQUEST_SECONDS.observe(timer.total_ms() / 1000, view=view)
+        if db_metrics:
+            metrics.HTTP_REQUEST_DB_QUERIES.observe(timer.db_queries, view=view)
+            metrics.DB_QUERY_SECONDS.inc(timer.db_ms / 1000)
+        
+        if 0 < settings.SLOW_REQUEST_MS <= timer.total_ms():
+            record_slow_request(request, response, timer, view)
+        return response
+
+
+PROFILE_STORE = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests on demand and for a random sample of traffic
+    
+    Staff users can profile a request with the `X-Profile` header or the
+    `profile` query parameter: `sample` uses the sampling profiler, any other
+    value cProfile. PROFILING_SAMPLE_RATE additionally profiles that share of
+    all requests with the sampling profiler. cProfile runs one request at a
+    time; while it is busy, other requests are sampled instead.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        profiler, user_label = self._profiler_for(request)
+        if profiler is None:
+            return self.get_response(request)
+        
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            logger.info("Another request is being profiled with cProfile, sampling this one")
+            profiler = self._sampling_profiler()
+            profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        try:
+            response['X-Profile-Id'] = PROFILE_STORE.save(profiler, view, user_label)
+        except OSError as e:
+            logger.error("Could not store request profile: %s", e)
+        return response
+    
+    def _profiler_for(self, request):
+        requested = request.META.get('HTTP_X_PROFILE') or request.GET.get('profile')
+        if requested:
+            user_id = jwt_user_id(request)
+            if user_id is not None and self._is_staff(user_id):
+                if requested == 'sample':
+                    return self._sampling_profiler(), f"u{user_id}"
+                return DeterministicProfiler(), f"u{user_id}"
+        
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate > 0 and random.random() < rate:
+            user_id = jwt_user_id(request)
+            return self._sampling_profiler(), f"u{user_id}" if user_id is not None else "anonymous"
+        return None, None
+    
+    def _sampling_profiler(self):
+        return SamplingProfiler(settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+    
+    def _is_staff(self, user_id):
+        from django.contrib.auth.models import User
+        return User.objects.filter(pk=user_id, is_staff=True, is_active=True).exists()
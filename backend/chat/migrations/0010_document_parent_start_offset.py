@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_fix_prompt_is_active_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='chat.document'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='start_offset',
+            field=models.PositiveIntegerField(blank=True, help_text='Character offset of this chunk within its parent section', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_document_parent_start_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_last_message_id',
+            field=models.BigIntegerField(blank=True, help_text='ID of the newest message covered by the summary', null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:55
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_conversation_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_query', models.TextField()),
+                ('query_hash', models.CharField(db_index=True, max_length=64)),
+                ('query_embedding', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, help_text='Vector embedding of the normalized query', null=True, size=None)),
+                ('response', models.TextField()),
+                ('document_version', models.CharField(max_length=128)),
+                ('prompt_version', models.CharField(max_length=64)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reference_documents', models.ManyToManyField(blank=True, related_name='cached_in', to='chat.document')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cached_answers', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_chatrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prompt',
+            name='model_override',
+            field=models.CharField(blank=True, default='', help_text='LLM model to always use for this prompt (leave empty for automatic routing)', max_length=100),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-19 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_prompt_model_override'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetrievalRoutingStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('decision', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'decision')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:03
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_retrievalroutingstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='candidate_document_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='candidate_embeddings',
+            field=models.BinaryField(blank=True, help_text='Normalized float32 embeddings of the candidates, one row per document', null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0016_conversation_candidates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='cached_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='completion_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='timings',
+            field=models.JSONField(blank=True, help_text='Milliseconds per pipeline stage: embed, search, history, llm, persist', null=True),
+        ),
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cached_tokens', models.PositiveBigIntegerField(default=0)),
+                ('embed_ms', models.PositiveBigIntegerField(default=0)),
+                ('search_ms', models.PositiveBigIntegerField(default=0)),
+                ('history_ms', models.PositiveBigIntegerField(default=0)),
+                ('llm_ms', models.PositiveBigIntegerField(default=0)),
+                ('persist_ms', models.PositiveBigIntegerField(default=0)),
+                ('total_ms', models.PositiveBigIntegerField(default=0)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date', 'model')},
+            },
+        ),
+    ]
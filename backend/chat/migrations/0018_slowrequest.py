@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0017_usage_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=100)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('stages', models.JSONField(default=dict)),
+                ('upstream_calls', models.JSONField(default=dict)),
+                ('db_queries', models.PositiveIntegerField(default=0)),
+                ('db_ms', models.FloatField(default=0)),
+                ('queries', models.JSONField(default=list)),
+                ('candidates', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slow_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='chat_slowre_created_442aee_idx')],
+            },
+        ),
+    ]
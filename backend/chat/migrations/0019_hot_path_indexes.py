@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:44
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes, but
+    # cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('chat', '0018_slowrequest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='backgroundimage',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='background_user_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='conversation',
+            index=models.Index(fields=['user', 'created_at'], name='conversation_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='document',
+            index=models.Index(condition=models.Q(('embedding__isnull', False), ('is_active', True)), fields=['user'], name='document_user_searchable_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='document',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['user', '-created_at'], name='document_user_sections_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='document',
+            index=models.Index(fields=['user', 'source'], name='document_user_source_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='prompt',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='prompt_user_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='settings',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='settings_user_active_idx'),
+        ),
+    ]
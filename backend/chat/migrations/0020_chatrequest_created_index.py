@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:51
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('chat', '0019_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='chatrequest',
+            index=models.Index(fields=['created_at'], name='chatrequest_created_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-19 04:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The composite indexes starting with these columns cover the foreign key
+    # lookups. Only the indexes are dropped, concurrently: altering the fields
+    # would also drop and re-validate the foreign key constraints.
+    atomic = False
+
+    dependencies = [
+        ('chat', '0020_chatrequest_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX CONCURRENTLY IF EXISTS "chat_document_user_id_b45dd2a7"',
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "chat_document_user_id_b45dd2a7" '
+                    'ON "chat_document" ("user_id")',
+                ),
+                migrations.RunSQL(
+                    'DROP INDEX CONCURRENTLY IF EXISTS "chat_message_conversation_id_a1207bf4"',
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "chat_message_conversation_id_a1207bf4" '
+                    'ON "chat_message" ("conversation_id")',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='document',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='documents', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='conversation',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.conversation'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-19 04:52
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('chat', '0021_drop_redundant_fk_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='cachedanswer',
+            index=models.Index(fields=['created_at'], name='cachedanswer_created_idx'),
+        ),
+    ]
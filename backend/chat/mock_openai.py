@@ -0,0 +1,252 @@
+# backend/chat/mock_openai.py
+"""
+Local stand-in for the OpenAI API, used by the benchmark commands
+
+It answers the endpoints the services call with deterministic data after a
+configurable latency, so benchmarks measure our side of the calls without
+network noise or API costs. Point a service at `server.base_url` to use it,
+or use StubEmbeddingService to skip HTTP altogether.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text, dimensions=1536):
+    """Deterministic unit vector derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:4], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class MockAPIError(Exception):
+    """Error response injected by MockOpenAIServer"""
+    
+    def __init__(self, status):
+        super().__init__(f"Mock API error {status}")
+        self.status = status
+
+
+class StubEmbeddingService:
+    """
+    In-process replacement for EmbeddingService returning `fake_embedding` vectors
+    
+    For benchmarks and tests that exercise retrieval without any API calls.
+    """
+    
+    def __init__(self, dimensions=1536):
+        self.dimensions = dimensions
+        self.embedding_model = 'stub'
+        self.calls = 0
+    
+    def create_embedding(self, text, timeout=None):
+        self.calls += 1
+        return fake_embedding(text, self.dimensions)
+    
+    def create_embeddings(self, texts, timeout=None):
+        self.calls += 1
+        return [fake_embedding(text, self.dimensions) for text in texts]
+
+
+class MockOpenAIServer:
+    """
+    Threaded HTTP server emulating the OpenAI endpoints used by the app
+    
+    Args:
+        latency_ms: Median latency of every API call
+        per_item_ms: Extra latency per input of a batched call
+        max_concurrency: Number of calls served at the same time, emulating
+            the connection and rate limits of the real API (0 = unlimited)
+        dimensions: Size of the returned embeddings
+        response_chars: Length of the returned chat completions
+        latency_sigma: Spread of the log-normal latency distribution around
+            the median (0 = every call takes exactly latency_ms)
+        error_rate: Share of calls answered with an error_status error
+        error_status: HTTP status of the injected errors (500, 429, 503, ...)
+        stream_chunk_ms: Delay between the chunks of a streamed completion
+        port: Port to listen on (0 = any free port)
+    """
+    
+    def __init__(self, latency_ms=50.0, per_item_ms=0.5, max_concurrency=0, dimensions=1536,
+                 response_chars=600, latency_sigma=0.0, error_rate=0.0, error_status=500,
+                 stream_chunk_ms=10.0, port=0):
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunk_ms = stream_chunk_ms
+        self.dimensions = dimensions
+        self.response_chars = response_chars
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.calls = 0
+        self.inputs = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+    
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.inputs = 0
+            self.errors = 0
+    
+    def embeddings(self, payload):
+        inputs = payload['input']
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._simulate_call(len(inputs))
+        return {
+            'object': 'list',
+            'model': payload.get('model'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, self.dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            'usage': {'prompt_tokens': sum(len(text) // 4 for text in inputs), 'total_tokens': 0},
+        }
+    
+    def chat_completions(self, payload):
+        self._simulate_call(1)
+        prompt_chars = sum(len(message.get('content') or '') for message in payload.get('messages', []))
+        sentence = "This is a stand-in answer based on the retrieved documents. "
+        words = (sentence * (self.response_chars // len(sentence) + 1))[:self.response_chars]
+        if payload.get('stream'):
+            return self._stream_chunks(payload.get('model'), words)
+        return {
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': words},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_chars // 4,
+                'completion_tokens': len(words) // 4,
+                'total_tokens': (prompt_chars + len(words)) // 4,
+                'prompt_tokens_details': {'cached_tokens': 0},
+            },
+        }
+    
+    def _stream_chunks(self, model, text):
+        """Server-sent event chunks of a streamed completion, a few words each"""
+        words = text.split(' ')
+        for start in range(0, len(words), 4):
+            time.sleep(self.stream_chunk_ms / 1000)
+            content = ' '.join(words[start:start + 4]) + (' ' if start + 4 < len(words) else '')
+            yield {
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': content}, 'finish_reason': None}],
+            }
+        yield {
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }
+    
+    def _simulate_call(self, items):
+        """Wait out the call's latency, raising MockAPIError for an injected error"""
+        with self._lock:
+            self.calls += 1
+            self.inputs += items
+        
+        latency_ms = self.latency_ms
+        if self.latency_sigma:
+            latency_ms *= random.lognormvariate(0, self.latency_sigma)
+        
+        if self.slots:
+            self.slots.acquire()
+        try:
+            time.sleep((latency_ms + self.per_item_ms * items) / 1000)
+        finally:
+            if self.slots:
+                self.slots.release()
+        
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise MockAPIError(self.error_status)
+    
+    def _make_handler(self):
+        server = self
+        routes = {
+            '/v1/embeddings': self.embeddings,
+            '/v1/chat/completions': self.chat_completions,
+        }
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_POST(self):
+                route = routes.get(self.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    result = route(json.loads(self.rfile.read(length) or b'{}'))
+                except MockAPIError as e:
+                    self._send_json(e.status, {'error': {
+                        'message': 'Injected error from the mock API',
+                        'type': 'rate_limit_error' if e.status == 429 else 'server_error',
+                        'code': None,
+                    }})
+                    return
+                
+                if isinstance(result, dict):
+                    self._send_json(200, result)
+                    return
+                
+                # Streamed completion: server-sent events until the connection closes
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for chunk in result:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
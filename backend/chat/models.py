@@ -2,12 +2,19 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 import logging
 
+from .user_cache import bump_version
+
 logger = logging.getLogger(__name__)
 
+# Rendered static prompt prefixes by prompt id, as (updated_at, prefix). An
+# edit replaces the prompt's entry instead of adding one.
+_STATIC_PREFIX_CACHE = {}
+_STATIC_PREFIX_CACHE_SIZE = 1024
+
 class Document(models.Model):
     """Store documents and their vector embeddings for retrieval"""
 
@@ -23,16 +30,68 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=False)
     
+    # Hierarchical chunking: small child chunks carry the embeddings that are
+    # scored at query time, the parent section supplies the surrounding text
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='children',
+        null=True,
+        blank=True
+    )
+    start_offset = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Character offset of this chunk within its parent section"
+    )
 
+    # Covered by document_user_source_idx, which starts with the user
     user = models.ForeignKey(
         User, 
         on_delete=models.CASCADE, 
         related_name='documents',
-        null=True
+        null=True,
+        db_index=False
     )
+
+    class Meta:
+        indexes = [
+            # Candidate scan of vector search: a user's active, embedded chunks
+            models.Index(
+                fields=['user'],
+                name='document_user_searchable_idx',
+                condition=models.Q(is_active=True, embedding__isnull=False)
+            ),
+            # Document lists: a user's top-level sections, newest first
+            models.Index(
+                fields=['user', '-created_at'],
+                name='document_user_sections_idx',
+                condition=models.Q(parent__isnull=True)
+            ),
+            # Deleting a document deletes every section and chunk of its source
+            models.Index(fields=['user', 'source'], name='document_user_source_idx'),
+        ]
     
     def __str__(self):
         return self.title or f"Document {self.id}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_document_version(self.user_id)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_document_version(self.user_id)
+        return result
+
+def bump_document_version(user_id):
+    """
+    Invalidate the answers cached for a user's documents
+    
+    Document.save and delete call it; bulk creates and queryset updates or
+    deletes have to call it themselves. Documents without a user share 0.
+    """
+    bump_version('documents', user_id or 0)
 
 class Conversation(models.Model):
     """Track chat conversations"""
@@ -40,6 +99,25 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Rolling summary of the older messages, refreshed in the background
+    summary = models.TextField(blank=True, default='')
+    summary_last_message_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="ID of the newest message covered by the summary"
+    )
+    
+    # Top candidates of the last full retrieval, reused for follow-up questions
+    candidate_document_ids = ArrayField(
+        models.IntegerField(),
+        blank=True,
+        default=list
+    )
+    candidate_embeddings = models.BinaryField(
+        null=True,
+        blank=True,
+        help_text="Normalized float32 embeddings of the candidates, one row per document"
+    )
 
     user = models.ForeignKey(
         User, 
@@ -48,6 +126,9 @@ class Conversation(models.Model):
         null=True
     )
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'], name='conversation_user_created_idx')]
+
     def __str__(self):
         return f"Conversation {self.session_id}"
 
@@ -58,7 +139,8 @@ class Message(models.Model):
         ('assistant', 'Assistant'),
     ]
 
-    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
+    # Covered by message_conversation_time_idx, which starts with the conversation
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', db_index=False)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -68,13 +150,167 @@ class Message(models.Model):
         related_name='referenced_in',
         blank=True
     )
+    
+    # Usage ledger, recorded on assistant messages
+    model = models.CharField(max_length=100, blank=True, default='')
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached_tokens = models.PositiveIntegerField(null=True, blank=True)
+    timings = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Milliseconds per pipeline stage: embed, search, history, llm, persist"
+    )
 
     class Meta:
         ordering = ['timestamp']
+        # History is read per conversation in timestamp order
+        indexes = [models.Index(fields=['conversation', 'timestamp'], name='message_conversation_time_idx')]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}"
 
+class CachedAnswer(models.Model):
+    """Store generated answers so repeated questions can skip retrieval and the LLM"""
+    normalized_query = models.TextField()
+    query_hash = models.CharField(max_length=64, db_index=True)
+    query_embedding = ArrayField(
+        models.FloatField(),
+        null=True,
+        blank=True,
+        help_text="Vector embedding of the normalized query"
+    )
+    response = models.TextField()
+    reference_documents = models.ManyToManyField(
+        Document,
+        related_name='cached_in',
+        blank=True
+    )
+    
+    # An entry is only valid for the documents and prompt it was generated with
+    document_version = models.CharField(max_length=128)
+    prompt_version = models.CharField(max_length=64)
+    
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cached_answers',
+        null=True
+    )
+
+    class Meta:
+        # Expired entries are pruned by creation time
+        indexes = [models.Index(fields=['created_at'], name='cachedanswer_created_idx')]
+
+    def __str__(self):
+        return f"Cached answer: {self.normalized_query[:50]}"
+
+class ChatRequest(models.Model):
+    """Track chat requests so duplicates share one execution and can be replayed"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('completed', 'Completed'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    response_data = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='chat_requests',
+        null=True
+    )
+
+    class Meta:
+        # Expired records are pruned by creation time
+        indexes = [models.Index(fields=['created_at'], name='chatrequest_created_idx')]
+
+    def __str__(self):
+        return f"Chat request {self.key[:12]} ({self.status})"
+
+class UsageRollup(models.Model):
+    """Daily token usage and latency per user and model, maintained incrementally"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='usage_rollups',
+        null=True
+    )
+    date = models.DateField()
+    model = models.CharField(max_length=100, blank=True, default='')
+    
+    requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    cached_tokens = models.PositiveBigIntegerField(default=0)
+    
+    # Summed milliseconds per pipeline stage
+    embed_ms = models.PositiveBigIntegerField(default=0)
+    search_ms = models.PositiveBigIntegerField(default=0)
+    history_ms = models.PositiveBigIntegerField(default=0)
+    llm_ms = models.PositiveBigIntegerField(default=0)
+    persist_ms = models.PositiveBigIntegerField(default=0)
+    total_ms = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('user', 'date', 'model')]
+
+    def __str__(self):
+        return f"{self.user} {self.date} {self.model}: {self.requests} requests"
+
+class RetrievalRoutingStat(models.Model):
+    """Daily counts of the retrieval router's decisions"""
+    date = models.DateField()
+    decision = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('date', 'decision')]
+
+    def __str__(self):
+        return f"{self.date} {self.decision}: {self.count}"
+
+class SlowRequest(models.Model):
+    """A request that exceeded SLOW_REQUEST_MS, with its stage and query breakdown"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='slow_requests',
+        null=True
+    )
+    endpoint = models.CharField(max_length=100)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    
+    # Milliseconds per stage, and of each upstream call per stage
+    stages = models.JSONField(default=dict)
+    upstream_calls = models.JSONField(default=dict)
+    
+    db_queries = models.PositiveIntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    # Slowest queries as {"sql": ..., "ms": ...}
+    queries = models.JSONField(default=list)
+    
+    candidates = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.method} {self.path} {self.duration_ms:.0f}ms"
+
 class BackgroundImage(models.Model):
     """Store background images for different use cases"""
     name = models.CharField(max_length=255)
@@ -90,6 +326,12 @@ class BackgroundImage(models.Model):
         null=True
     )
 
+    class Meta:
+        # The active background of a user, read on every request
+        indexes = [
+            models.Index(fields=['user'], name='background_user_active_idx', condition=models.Q(is_active=True)),
+        ]
+
     def __str__(self):
         return self.name
         
@@ -101,6 +343,7 @@ class BackgroundImage(models.Model):
                 user=self.user
             ).exclude(id=self.id).update(is_active=False)
         super().save(*args, **kwargs)
+        bump_version('background', self.user_id)
 
 class Prompt(models.Model):
     """Store flexible prompt templates for the AI assistant"""
@@ -133,6 +376,14 @@ class Prompt(models.Model):
         blank=True
     )
     
+    # Per-tenant model choice, bypassing the latency-aware routing
+    model_override = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="LLM model to always use for this prompt (leave empty for automatic routing)"
+    )
+    
     # Fields for managing prompts
     is_active = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -146,23 +397,42 @@ class Prompt(models.Model):
         null=True
     )
 
+    class Meta:
+        # The active prompt of a user, read on every request
+        indexes = [
+            models.Index(fields=['user'], name='prompt_user_active_idx', condition=models.Q(is_active=True)),
+        ]
+
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
         self.is_active = True
         super().save(*args, **kwargs)
+        bump_version('prompt', self.user_id)
     
-    def generate_system_prompt(self, dynamic_context=""):
+    def generate_system_prompt(self, dynamic_context="", conversation_summary="", layout="classic"):
         """
         Generate the full system prompt by combining all sections
         
         Args:
             dynamic_context: The RAG-retrieved context to include
+            conversation_summary: Summary of the earlier conversation to include
+            layout: "classic" keeps the retrieved information between the static
+                sections, "cache_friendly" puts all static sections first so the
+                provider can reuse the cached prefix across requests
         
         Returns:
             The complete system prompt text
         """
+        if layout == "cache_friendly":
+            sections = [self.render_static_prefix()]
+            if dynamic_context:
+                sections.append(f"# Retrieved Information\n{dynamic_context}")
+            if conversation_summary:
+                sections.append(f"# Conversation Summary\n{conversation_summary}")
+            return "\n\n".join(sections)
+        
         sections = []
         
         # Add role definition
@@ -180,6 +450,10 @@ class Prompt(models.Model):
         if dynamic_context:
             sections.append(f"# Retrieved Information\n{dynamic_context}")
         
+        # Add the rolling summary of the earlier conversation if available
+        if conversation_summary:
+            sections.append(f"# Conversation Summary\n{conversation_summary}")
+        
         # Add response guidelines
         sections.append(f"# Response Guidelines\n{self.response_guidelines}")
         
@@ -189,6 +463,38 @@ class Prompt(models.Model):
         
         # Combine all sections with double newlines for clarity
         return "\n\n".join(sections)
+    
+    def render_static_prefix(self):
+        """
+        Render the sections that only change when the prompt is edited
+        
+        The sections are always rendered in the same order, so the prefix is
+        byte-identical for every request until the prompt is saved again. The
+        result is memoized per prompt, for its latest version (updated_at).
+        
+        Returns:
+            The static part of the system prompt
+        """
+        cached = _STATIC_PREFIX_CACHE.get(self.pk) if self.pk else None
+        if cached and cached[0] == self.updated_at:
+            return cached[1]
+        
+        sections = [f"# Role\n{self.assistant_role}"]
+        if self.website_context:
+            sections.append(f"# Website Information\n{self.website_context}")
+        if self.knowledge_context:
+            sections.append(f"# Background Knowledge\n{self.knowledge_context}")
+        sections.append(f"# Response Guidelines\n{self.response_guidelines}")
+        if self.restrictions:
+            sections.append(f"# Limitations and Restrictions\n{self.restrictions}")
+        prefix = "\n\n".join(sections)
+        
+        if self.pk:
+            if self.pk not in _STATIC_PREFIX_CACHE and len(_STATIC_PREFIX_CACHE) >= _STATIC_PREFIX_CACHE_SIZE:
+                _STATIC_PREFIX_CACHE.clear()
+            _STATIC_PREFIX_CACHE[self.pk] = (self.updated_at, prefix)
+        
+        return prefix
 
 class Settings(models.Model):
     """Store chat settings and appearance configuration"""
@@ -214,6 +520,12 @@ class Settings(models.Model):
         related_name='settings',
         null=True
     )
+
+    class Meta:
+        # The active settings of a user, read on every request
+        indexes = [
+            models.Index(fields=['user'], name='settings_user_active_idx', condition=models.Q(is_active=True)),
+        ]
     
     def __str__(self):
         return f"Settings: {self.chatName}"
@@ -226,6 +538,17 @@ class Settings(models.Model):
                 user=self.user
             ).exclude(id=self.id).update(is_active=False)
         super().save(*args, **kwargs)
+        bump_version('settings', self.user_id)
+
+def invalidate_deleted_user_data(sender, instance, **kwargs):
+    """Deletions, including cascades, bypass save() but invalidate the cache too"""
+    bump_version(CACHED_USER_DATA[sender], instance.user_id)
+
+# Connected per model, as a receiver for every sender would disable fast deletes
+CACHED_USER_DATA = {BackgroundImage: 'background', Prompt: 'prompt', Settings: 'settings'}
+post_delete.connect(invalidate_deleted_user_data, sender=BackgroundImage)
+post_delete.connect(invalidate_deleted_user_data, sender=Prompt)
+post_delete.connect(invalidate_deleted_user_data, sender=Settings)
 
 @receiver(post_save, sender=User)
 def create_user_defaults(sender, instance, created, **kwargs):
@@ -266,4 +589,4 @@ def create_user_defaults(sender, instance, created, **kwargs):
             is_active=True
         )
 
-        logger.info(f"Created default settings and prompt for new user: {instance.username}")
\ No newline at end of file
+        logger.info(f"Created default settings and prompt for new user: {instance.username}")
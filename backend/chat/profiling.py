@@ -0,0 +1,152 @@
+# backend/chat/profiling.py
+"""
+Request profilers and the on-disk ring buffer their results are stored in
+
+Deterministic profiles are cProfile pstats files (open with `pstats` or
+snakeviz). Sampled profiles are collapsed stacks, one `frame;frame;... count`
+line per stack, ready for flamegraph.pl or speedscope.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Profile file names: <timestamp>_<view>_<user>.<prof|collapsed>
+PROFILE_NAME = re.compile(r'^[0-9]{8}T[0-9]{6}_[0-9]{6}_[A-Za-z0-9_-]+\.(prof|collapsed)$')
+
+
+class ProfilerBusy(Exception):
+    """Raised when another deterministic profile is already running in this process"""
+
+
+class DeterministicProfiler:
+    """
+    cProfile of the process while a request runs
+    
+    Since Python 3.12 cProfile hooks the interpreter through a single
+    process-wide `sys.monitoring` slot: the profile includes whatever other
+    threads run at the same time, and only one can be enabled at once. A
+    lock serializes them, and `start` raises ProfilerBusy while it is held.
+    """
+    
+    extension = 'prof'
+    
+    _active = threading.Lock()
+    
+    def __init__(self):
+        self._profile = cProfile.Profile()
+    
+    def start(self):
+        if not DeterministicProfiler._active.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            self._profile.enable()
+        except ValueError as e:
+            # Another tool (a debugger, coverage) holds the monitoring slot
+            DeterministicProfiler._active.release()
+            raise ProfilerBusy() from e
+    
+    def stop(self):
+        try:
+            self._profile.disable()
+        finally:
+            DeterministicProfiler._active.release()
+    
+    def save(self, path):
+        self._profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """Low-overhead profiler sampling the request thread's stack from a background thread"""
+    
+    extension = 'collapsed'
+    
+    def __init__(self, interval_seconds=0.005):
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+    
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+    
+    def save(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """Bounded directory of profiles, oldest removed first"""
+    
+    def __init__(self, directory, max_files):
+        self.directory = str(directory)
+        self.max_files = max_files
+        self._lock = threading.Lock()
+    
+    def save(self, profiler, view, user_label):
+        """Write a profile and trim the ring buffer, returning the profile name"""
+        label = re.sub(r'[^A-Za-z0-9-]', '-', f"{view}_{user_label}")
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S_%f')}_{label}.{profiler.extension}"
+        
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.save(os.path.join(self.directory, name))
+            for old_name in self.list_names()[self.max_files:]:
+                try:
+                    os.remove(os.path.join(self.directory, old_name))
+                except FileNotFoundError:
+                    pass
+        return name
+    
+    def list_names(self):
+        """Profile names, newest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if PROFILE_NAME.match(name)]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+    
+    def list(self):
+        profiles = []
+        for name in self.list_names():
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({
+                'name': name,
+                'format': 'pstats' if name.endswith('.prof') else 'collapsed',
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            })
+        return profiles
+    
+    def path(self, name):
+        """Path of a stored profile, or None for unknown or invalid names"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
@@ -6,68 +6,284 @@ import logging
 import numpy as np
 import json
 import time
+import re
+import hashlib
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
 from typing import List, Dict, Any, Tuple, Optional
-from django.db import connection
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
 import PyPDF2
 from io import BytesIO
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pathlib import Path
 from django.conf import settings
+from django.core.cache import cache
+
+from .utils import estimate_tokens
+from .log import Truncated, log_payload, sample_payloads
+from .timing import RequestTimer, annotate, timed_stage
+from .user_cache import ACTIVE_PROMPT, BACKGROUND_RESPONSE, PROMPT_RESPONSE, SETTINGS_RESPONSE, get_version
+from . import metrics
 
 
 OPENAI_KEY = settings.OPENAI_KEY
 EMBEDDING_MODEL = settings.EMBEDDING_MODEL
 LLM_MODEL = settings.LLM_MODEL
+OPENAI_BASE_URL = settings.OPENAI_BASE_URL
+LLM_MODEL_TIERS = settings.LLM_MODEL_TIERS
+ROUTING_MAX_QUERY_TOKENS = settings.ROUTING_MAX_QUERY_TOKENS
+ROUTING_MIN_TOP_SCORE = settings.ROUTING_MIN_TOP_SCORE
+ROUTING_MIN_SCORE_MARGIN = settings.ROUTING_MIN_SCORE_MARGIN
+ROUTING_MAX_HISTORY_TOKENS = settings.ROUTING_MAX_HISTORY_TOKENS
+ROUTING_EWMA_ALPHA = settings.ROUTING_EWMA_ALPHA
+ROUTING_EXPLORE_RATE = settings.ROUTING_EXPLORE_RATE
+RETRIEVAL_REUSE_CANDIDATES = settings.RETRIEVAL_REUSE_CANDIDATES
+RETRIEVAL_REUSE_MIN_SCORE = settings.RETRIEVAL_REUSE_MIN_SCORE
+RETRIEVAL_ROUTER_ACKNOWLEDGEMENTS = settings.RETRIEVAL_ROUTER_ACKNOWLEDGEMENTS
+RETRIEVAL_ROUTER_CONFIRMATIONS = settings.RETRIEVAL_ROUTER_CONFIRMATIONS
+RETRIEVAL_ROUTER_REUSE_PHRASES = settings.RETRIEVAL_ROUTER_REUSE_PHRASES
+RETRIEVAL_ROUTER_ANAPHORA = settings.RETRIEVAL_ROUTER_ANAPHORA
+RETRIEVAL_ROUTER_QUESTION_WORDS = settings.RETRIEVAL_ROUTER_QUESTION_WORDS
 MAX_DOCUMENTS = settings.MAX_DOCUMENTS
+CHILD_CHUNK_SIZE = settings.CHILD_CHUNK_SIZE
+CHILD_CHUNK_OVERLAP = settings.CHILD_CHUNK_OVERLAP
+CONTEXT_WINDOW_CHARS = settings.CONTEXT_WINDOW_CHARS
+CONTEXT_COMPRESSION_ENABLED = settings.CONTEXT_COMPRESSION_ENABLED
+CONTEXT_COMPRESSION_RATIO = settings.CONTEXT_COMPRESSION_RATIO
+CONTEXT_COMPRESSION_MAX_TOKENS = settings.CONTEXT_COMPRESSION_MAX_TOKENS
+SENTENCE_EMBEDDING_CACHE_TTL_SECONDS = settings.SENTENCE_EMBEDDING_CACHE_TTL_SECONDS
+HISTORY_MAX_MESSAGES = settings.HISTORY_MAX_MESSAGES
+HISTORY_SUMMARY_TOKEN_THRESHOLD = settings.HISTORY_SUMMARY_TOKEN_THRESHOLD
+HISTORY_RECENT_MESSAGES = settings.HISTORY_RECENT_MESSAGES
+HISTORY_SUMMARY_FOLD_MESSAGES = settings.HISTORY_SUMMARY_FOLD_MESSAGES
+PROMPT_LAYOUT = settings.PROMPT_LAYOUT
+ANSWER_CACHE_ENABLED = settings.ANSWER_CACHE_ENABLED
+ANSWER_CACHE_SIMILARITY_THRESHOLD = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+ANSWER_CACHE_TTL_SECONDS = settings.ANSWER_CACHE_TTL_SECONDS
+ANSWER_CACHE_MAX_CANDIDATES = settings.ANSWER_CACHE_MAX_CANDIDATES
+CHAT_REPLAY_WINDOW_SECONDS = settings.CHAT_REPLAY_WINDOW_SECONDS
+CHAT_COALESCE_WAIT_SECONDS = settings.CHAT_COALESCE_WAIT_SECONDS
+CHAT_LATENCY_BUDGET_SECONDS = settings.CHAT_LATENCY_BUDGET_SECONDS
+EMBEDDING_TIMEOUT_SECONDS = settings.EMBEDDING_TIMEOUT_SECONDS
+LLM_TIMEOUT_SECONDS = settings.LLM_TIMEOUT_SECONDS
+LLM_HEDGE_DELAY_SECONDS = settings.LLM_HEDGE_DELAY_SECONDS
+LLM_HEDGE_MAX_WORKERS = settings.LLM_HEDGE_MAX_WORKERS
+EMBEDDING_BATCH_WINDOW_MS = settings.EMBEDDING_BATCH_WINDOW_MS
+EMBEDDING_BATCH_MAX_SIZE = settings.EMBEDDING_BATCH_MAX_SIZE
 
 
 # Configure enhanced logging
 logger = logging.getLogger(__name__)
 
+
+class StageTimeout(Exception):
+    """Raised when a pipeline stage misses its deadline"""
+    
+    def __init__(self, stage: str, timeout: float):
+        self.stage = stage
+        self.timeout = timeout
+        super().__init__(f"{stage} stage missed its {timeout:.2f}s deadline")
+
+
+class LatencyBudget:
+    """Request-level latency budget shared by the pipeline stages"""
+    
+    def __init__(self, total_seconds: float = CHAT_LATENCY_BUDGET_SECONDS):
+        self.total_seconds = total_seconds
+        self.expires_at = time.monotonic() + total_seconds
+    
+    def remaining(self) -> float:
+        """Seconds left in the budget"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+    
+    def stage_timeout(self, stage_limit: float) -> float:
+        """Deadline for a stage: its own limit, capped by the remaining budget"""
+        return min(stage_limit, self.remaining())
+
+
+def record_deadline_hit(stage: str):
+    """Count a missed deadline for a pipeline stage"""
+    metrics.DEADLINE_HITS.inc(stage=stage)
+    logger.warning(f"Deadline missed in {stage} stage")
+
+class EmbeddingBatcher:
+    """Collect concurrent single-text embedding requests into batched API calls"""
+    
+    def __init__(self, window_seconds: float, max_batch_size: int):
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(max_batch_size, 1)
+        self._condition = threading.Condition()
+        self._open_batch = None
+    
+    def submit(self, text: str, request_batch, timeout: Optional[float] = None) -> List[float]:
+        """
+        Add a text to the open batch and wait for its embedding
+        
+        The first caller of a batch waits for the window (or until the batch is
+        full) and then sends the batch; a caller that fills the batch sends it
+        right away. The other callers just wait for their result.
+        
+        Args:
+            text: The text to create an embedding for
+            request_batch: Function sending a list of texts as one API call
+            timeout: Optional deadline in seconds for the API call
+            
+        Returns:
+            The embedding of the text
+        """
+        future = Future()
+        with self._condition:
+            batch = self._open_batch
+            leader = batch is None
+            if leader:
+                batch = self._open_batch = []
+            batch.append((text, future))
+            full = len(batch) >= self.max_batch_size
+            if full:
+                self._open_batch = None
+                self._condition.notify_all()
+        
+        if full:
+            self._dispatch(batch, request_batch, timeout)
+        elif leader:
+            with self._condition:
+                self._condition.wait_for(lambda: self._open_batch is not batch, timeout=self.window_seconds)
+                send = self._open_batch is batch
+                if send:
+                    self._open_batch = None
+            if send:
+                self._dispatch(batch, request_batch, timeout)
+        
+        wait_timeout = None if timeout is None else timeout + self.window_seconds
+        return future.result(timeout=wait_timeout)
+    
+    def _dispatch(self, batch, request_batch, timeout):
+        """Send a batch as one API call and fan the results out to the waiting callers"""
+        metrics.EMBEDDING_BATCH_SIZE.observe(len(batch))
+        logger.debug(f"Sending {len(batch)} query embedding(s) in one batch")
+        
+        try:
+            embeddings = request_batch([text for text, _ in batch], timeout=timeout)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+
 class EmbeddingService:
     """Service for creating embeddings for documents"""
     
+    # Shared by all instances, so concurrent requests end up in the same batches
+    batcher = EmbeddingBatcher(EMBEDDING_BATCH_WINDOW_MS / 1000, EMBEDDING_BATCH_MAX_SIZE) \
+        if EMBEDDING_BATCH_WINDOW_MS > 0 else None
+    
     def __init__(self):
         self.api_key = OPENAI_KEY
         self.embedding_model = EMBEDDING_MODEL
+        self.base_url = OPENAI_BASE_URL
         
         if not self.api_key:
             raise ValueError("OpenAI API key is required. Check your .env file.")
     
-    def create_embedding(self, text: str) -> List[float]:
+    @timed_stage('embed')
+    def create_embedding(self, text: str, timeout: Optional[float] = None) -> List[float]:
         """
         Generate an embedding vector for the given text using OpenAI's API
         
         Args:
             text: The text to create an embedding for
+            timeout: Optional deadline in seconds, StageTimeout is raised when it's missed
             
         Returns:
             A list of floats representing the embedding vector
         """
-        logger.debug(f"Creating embedding for text of length {len(text)} characters")
+        logger.debug("Creating embedding for text of length %d characters", len(text))
+        
+        if timeout is not None and timeout <= 0:
+            # The request's budget is already spent, don't start a call
+            raise StageTimeout('embedding', 0.0)
+        
+        try:
+            if self.batcher:
+                embedding = self.batcher.submit(
+                    text, self._request_embeddings,
+                    timeout=timeout if timeout is not None else EMBEDDING_TIMEOUT_SECONDS
+                )
+            else:
+                embedding = self._request_embeddings(text, timeout=timeout)[0]
+            
+            logger.debug("Successfully created embedding of dimension %d", len(embedding))
+            
+            return embedding
+        except (requests.Timeout, FutureTimeoutError) as e:
+            raise StageTimeout('embedding', timeout if timeout is not None else EMBEDDING_TIMEOUT_SECONDS) from e
+        except Exception as e:
+            logger.error(f"Error creating embedding: {str(e)}")
+            raise
+    
+    @timed_stage('embed')
+    def create_embeddings(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
+        """
+        Generate embedding vectors for several texts with batched API calls
+        
+        Args:
+            texts: The texts to create embeddings for
+            batch_size: Maximum number of inputs sent in a single API call
+            
+        Returns:
+            A list of embedding vectors, in the same order as the input texts
+        """
+        logger.debug(f"Creating embeddings for {len(texts)} texts in batches of {batch_size}")
         
-        url = "https://api.openai.com/v1/embeddings"
+        embeddings = []
+        try:
+            for start in range(0, len(texts), batch_size):
+                embeddings.extend(self._request_embeddings(texts[start:start + batch_size]))
+            return embeddings
+        except Exception as e:
+            logger.error(f"Error creating embeddings: {str(e)}")
+            raise
+    
+    def _request_embeddings(self, inputs, timeout: Optional[float] = None) -> List[List[float]]:
+        """Call the embeddings API for a single text or a list of texts"""
+        url = f"{self.base_url.rstrip('/')}/embeddings"
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
         data = {
-            "input": text,
+            "input": inputs,
             "model": self.embedding_model
         }
         
+        # Batched ingestion calls get a more generous default than query embeddings
+        if timeout is None:
+            timeout = EMBEDDING_TIMEOUT_SECONDS if isinstance(inputs, str) else LLM_TIMEOUT_SECONDS
+        
+        start_time = time.perf_counter()
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=data, timeout=timeout)
             response.raise_for_status()
-            result = response.json()
-            embedding = result["data"][0]["embedding"]
-            
-            logger.debug(f"Successfully created embedding of dimension {len(embedding)}")
-            
-            return embedding
-        except Exception as e:
-            logger.error(f"Error creating embedding: {str(e)}")
+        except requests.Timeout:
+            metrics.EMBEDDING_ERRORS.inc(reason='timeout')
+            raise
+        except requests.RequestException:
+            metrics.EMBEDDING_ERRORS.inc(reason='error')
             raise
+        metrics.EMBEDDING_REQUEST_SECONDS.observe(time.perf_counter() - start_time)
+        result = response.json()
+        
+        # The API returns one item per input, tagged with its input index
+        items = sorted(result["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in items]
     
     def process_document(self, document):
         """
@@ -98,7 +314,8 @@ class VectorSearchService:
         self.Document = Document
         self.embedding_service = embedding_service or EmbeddingService()
     
-    def search_similar_documents(self, query: str, top_k: int = 3, user=None) -> List[Tuple[Any, float]]:
+    @timed_stage('search')
+    def search_similar_documents(self, query: str, top_k: int = 3, user=None, query_embedding=None) -> List[Tuple[Any, float]]:
         """
         Find documents similar to the query using vector similarity
         
@@ -106,17 +323,20 @@ class VectorSearchService:
             query: The query text
             top_k: Number of documents to return
             user: User to filter documents by (optional)
+            query_embedding: Precomputed embedding of the query (optional)
             
         Returns:
             List of tuples containing (document, similarity_score)
         """
-        logger.info(f"Searching for documents similar to query: '{query}'")
-        logger.info(f"User filter: {user.username if user else 'None'}")
+        logger.info("Searching for documents similar to query: '%s'", query)
+        logger.info("User filter: %s", user.username if user else 'None')
         start_time = time.time()
         
-        # Generate embedding for the query
-        query_embedding = np.array(self.embedding_service.create_embedding(query))
-        logger.debug(f"Generated query embedding with shape: {query_embedding.shape}")
+        # Generate embedding for the query unless the caller already has it
+        if query_embedding is None:
+            query_embedding = self.embedding_service.create_embedding(query)
+        query_embedding = np.array(query_embedding)
+        logger.debug("Generated query embedding with shape: %s", query_embedding.shape)
         
         # Get only active documents with embeddings
         documents_query = self.Document.objects.filter(
@@ -130,44 +350,360 @@ class VectorSearchService:
             
         documents = documents_query.all()
         
-        logger.info(f"Found {len(documents)} active documents with embeddings")
+        logger.info("Found %d active documents with embeddings", len(documents))
+        metrics.RETRIEVAL_CANDIDATES.observe(len(documents), source='index')
+        annotate('candidates', len(documents))
         
-        # Calculate similarity scores
+        # Calculate similarity scores, with per-document logging only when DEBUG is on
+        debug = logger.isEnabledFor(logging.DEBUG)
         document_scores = []
         for doc in documents:
             doc_embedding = np.array(doc.embedding)
             
             # Calculate cosine similarity
-            logger.debug(f"Calculating similarity for document: {doc.id} - {doc.title}")
             similarity = self._cosine_similarity(query_embedding, doc_embedding)
             document_scores.append((doc, similarity))
-            logger.debug(f"Document {doc.id} ({doc.title[:30]}{'...' if len(doc.title) > 30 else ''}) - Score: {similarity:.4f}")
+            if debug:
+                logger.debug("Document %s (%s) - Score: %.4f", doc.id, Truncated(doc.title, 30), similarity)
         
         # Sort by similarity (highest first) and take top_k
         document_scores.sort(key=lambda x: x[1], reverse=True)
         top_docs = document_scores[:top_k]
         
-        logger.info(f"Top {len(top_docs)} document matches:")
-        for i, (doc, score) in enumerate(top_docs):
-            logger.info(f"  {i+1}. Score: {score:.4f} - Document: {doc.id} - {doc.title}")
-            logger.debug(f"     Content preview: {doc.content[:100]}...")
+        logger.info("Top %d document matches, best: %s", len(top_docs),
+                    ", ".join(f"{doc.id} ({score:.4f})" for doc, score in top_docs[:3]))
+        if debug:
+            for i, (doc, score) in enumerate(top_docs):
+                logger.debug("  %d. Score: %.4f - Document: %s - %s", i + 1, score, doc.id, doc.title)
+                logger.debug("     Content preview: %s", Truncated(doc.content, 100))
+        
+        logger.info("Document search completed in %.2f seconds", time.time() - start_time)
+        return top_docs
+    
+    @timed_stage('search')
+    def search_lexical(self, query: str, top_k: int = 3, user=None) -> List[Tuple[Any, float]]:
+        """
+        Find documents matching the query with PostgreSQL full-text search
+        
+        Used as the fallback when the query embedding can't be created in time.
+        
+        Args:
+            query: The query text
+            top_k: Number of documents to return
+            user: User to filter documents by (optional)
+            
+        Returns:
+            List of tuples containing (document, rank)
+        """
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+        
+        start_time = time.time()
+        documents_query = self.Document.objects.filter(
+            embedding__isnull=False,
+            is_active=True
+        )
+        if user:
+            documents_query = documents_query.filter(user=user)
+        
+        search_query = SearchQuery(query, search_type='websearch')
+        documents = documents_query.annotate(
+            rank=SearchRank(SearchVector('title', 'content'), search_query)
+        ).filter(rank__gt=0).order_by('-rank')[:top_k]
         
-        logger.info(f"Document search completed in {time.time() - start_time:.2f} seconds")
+        top_docs = [(doc, doc.rank) for doc in documents]
+        logger.info(f"Lexical search found {len(top_docs)} document(s) in {time.time() - start_time:.2f} seconds")
         return top_docs
     
+    @timed_stage('search')
+    def search_candidates(self, query_embedding, candidate_ids, candidate_embeddings,
+                          top_k: int = 3, user=None) -> List[Tuple[Any, float]]:
+        """
+        Score the query against a stored candidate set instead of the whole index
+        
+        Args:
+            query_embedding: Embedding of the query
+            candidate_ids: Document IDs of the candidates
+            candidate_embeddings: Normalized float32 embeddings of the candidates, as bytes
+            top_k: Number of documents to return
+            user: User to filter documents by (optional)
+            
+        Returns:
+            List of tuples containing (document, similarity_score), best first. Candidates
+            that were deactivated or deleted since are skipped.
+        """
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        matrix = np.frombuffer(candidate_embeddings, dtype=np.float32)
+        if not candidate_ids or matrix.size != len(candidate_ids) * query_vector.size:
+            return []
+        matrix = matrix.reshape(len(candidate_ids), query_vector.size)
+        metrics.RETRIEVAL_CANDIDATES.observe(len(candidate_ids), source='conversation')
+        annotate('candidates', len(candidate_ids))
+        
+        scores = matrix @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+        order = np.argsort(scores)[::-1]
+        
+        documents_query = self.Document.objects.filter(id__in=candidate_ids, is_active=True)
+        if user:
+            documents_query = documents_query.filter(user=user)
+        documents = documents_query.defer('embedding').in_bulk()
+        
+        return [
+            (documents[candidate_ids[i]], float(scores[i]))
+            for i in order if candidate_ids[i] in documents
+        ][:top_k]
+    
+    @staticmethod
+    def pack_candidates(document_scores) -> Tuple[List[int], bytes]:
+        """Pack the documents of a search result as candidate IDs and normalized float32 embeddings"""
+        if not document_scores:
+            return [], b''
+        matrix = np.array([doc.embedding for doc, _ in document_scores], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return [doc.id for doc, _ in document_scores], matrix.tobytes()
+    
+    @timed_stage('expand')
+    def expand_documents(self, documents, window_chars: int = CONTEXT_WINDOW_CHARS) -> List[Tuple[Any, str]]:
+        """
+        Expand the best child chunk hits to a bounded window of their parent section
+        
+        Hits from the same parent whose windows overlap are merged into a single
+        passage. Documents without a parent (legacy single-level chunks) are
+        returned unchanged.
+        
+        Args:
+            documents: Ranked list of Document instances returned by the search
+            window_chars: Maximum size of the text window around each hit
+            
+        Returns:
+            List of tuples containing (document, passage_text), in rank order
+        """
+        parent_ids = {doc.parent_id for doc in documents if doc.parent_id}
+        parents = self.Document.objects.in_bulk(parent_ids) if parent_ids else {}
+        
+        passages = []
+        spans_by_parent = {}
+        for doc in documents:
+            parent = parents.get(doc.parent_id)
+            if parent is None or doc.start_offset is None:
+                passages.append([doc, None, None])
+                continue
+            
+            # Center the window on the chunk, clipped to the parent section
+            padding = max(window_chars - len(doc.content), 0) // 2
+            start = max(doc.start_offset - padding, 0)
+            end = min(doc.start_offset + len(doc.content) + padding, len(parent.content))
+            
+            # Merge with an earlier, overlapping window from the same parent
+            merged = False
+            for span in spans_by_parent.get(parent.id, []):
+                if start <= span[2] and end >= span[1]:
+                    span[1] = min(span[1], start)
+                    span[2] = max(span[2], end)
+                    merged = True
+                    break
+            
+            if not merged:
+                span = [parent, start, end]
+                spans_by_parent.setdefault(parent.id, []).append(span)
+                passages.append(span)
+        
+        expanded = []
+        for doc, start, end in passages:
+            if start is None:
+                expanded.append((doc, doc.content))
+            else:
+                # Don't start or end the window in the middle of a word
+                text = doc.content[start:end]
+                if start > 0 and ' ' in text:
+                    text = text[text.index(' '):]
+                if end < len(doc.content) and ' ' in text:
+                    text = text[:text.rindex(' ')]
+                expanded.append((doc, text.strip()))
+        
+        logger.info("Expanded %d hit(s) into %d passage(s) (%d chars)",
+                    len(documents), len(expanded), sum(len(text) for _, text in expanded))
+        return expanded
+    
     def _cosine_similarity(self, a, b):
         """Calculate cosine similarity between two vectors with logging"""
         dot_product = np.dot(a, b)
         norm_a = np.linalg.norm(a)
         norm_b = np.linalg.norm(b)
         similarity = dot_product / (norm_a * norm_b)
-        logger.debug(f"Similarity score: {similarity:.4f}")
+        logger.debug("Similarity score: %.4f", similarity)
         return similarity
 
 
+class ContextCompressionService:
+    """Service for extractive compression of the retrieved context"""
+    
+    # Sentence boundaries: end punctuation followed by whitespace, or line breaks
+    SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+    
+    def __init__(self, embedding_service=None, ratio: float = CONTEXT_COMPRESSION_RATIO,
+                 max_tokens: int = CONTEXT_COMPRESSION_MAX_TOKENS):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+    
+    def split_sentences(self, text: str) -> List[str]:
+        """Split a passage into non-empty sentences"""
+        return [sentence.strip() for sentence in self.SENTENCE_SPLIT.split(text) if sentence.strip()]
+    
+    @timed_stage('compress')
+    def compress(self, passages: List[Tuple[Any, str]], query_embedding) -> Tuple[List[Tuple[Any, str]], Dict[str, Any]]:
+        """
+        Keep only the sentences of the passages that are most similar to the query
+        
+        All sentences are scored against the query embedding in a single
+        matrix-vector product. Sentences are kept in descending score order
+        until the token budget is used up, then put back in their original
+        order. Passages left without any sentence are dropped.
+        
+        Only sentence embeddings warmed at ingestion are used, so compression
+        never calls the embeddings API on the request path. Passages with any
+        uncached sentence, such as the cut edges of expanded windows, can't be
+        scored and are kept whole.
+        
+        Args:
+            passages: List of (document, passage_text) tuples
+            query_embedding: Embedding vector of the query
+            
+        Returns:
+            Tuple containing (compressed_passages, stats)
+        """
+        start_time = time.perf_counter()
+        
+        all_sentences = []  # (passage_index, sentence)
+        for i, (_, text) in enumerate(passages):
+            all_sentences.extend((i, sentence) for sentence in self.split_sentences(text))
+        
+        tokens_before = sum(estimate_tokens(text) for _, text in passages)
+        stats = {
+            'tokens_before': tokens_before,
+            'tokens_after': tokens_before,
+            'sentences_before': len(all_sentences),
+            'sentences_after': len(all_sentences),
+        }
+        cached = self.get_cached_sentence_embeddings([sentence for _, sentence in all_sentences])
+        
+        # Passages with an uncached sentence can't be scored and are kept whole
+        unscored = {passage_index for i, (passage_index, _) in enumerate(all_sentences) if i not in cached}
+        scored = [i for i, (passage_index, _) in enumerate(all_sentences) if passage_index not in unscored]
+        if not scored:
+            return passages, stats
+        sentences = [all_sentences[i] for i in scored]
+        unscored_tokens = sum(estimate_tokens(passages[i][1]) for i in unscored)
+        
+        # Token budget: a ratio of the original context, capped by the target
+        budget = int(tokens_before * self.ratio)
+        if self.max_tokens:
+            budget = min(budget, self.max_tokens)
+        budget = max(budget - unscored_tokens, 0)
+        
+        # Score every sentence in one vectorized pass
+        matrix = np.vstack([cached[i] for i in scored])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = matrix @ query / np.where(norms == 0, 1, norms)
+        
+        keep = []
+        used = 0
+        for index in np.argsort(-scores):
+            sentence_tokens = estimate_tokens(sentences[index][1])
+            if keep and used + sentence_tokens > budget:
+                continue
+            keep.append(index)
+            used += sentence_tokens
+        keep.sort()
+        
+        kept_by_passage = {}
+        for index in keep:
+            passage_index, sentence = sentences[index]
+            kept_by_passage.setdefault(passage_index, []).append(sentence)
+        
+        compressed = [
+            passages[i] if i in unscored else (passages[i][0], " ".join(kept_by_passage[i]))
+            for i in range(len(passages)) if i in unscored or i in kept_by_passage
+        ]
+        
+        stats['tokens_after'] = sum(estimate_tokens(text) for _, text in compressed)
+        stats['sentences_after'] = len(keep) + sum(
+            1 for passage_index, _ in all_sentences if passage_index in unscored
+        )
+        stats['elapsed_ms'] = round((time.perf_counter() - start_time) * 1000, 2)
+        
+        logger.info("Context compression: %d -> %d tokens, %d/%d sentences kept in %s ms",
+                    stats['tokens_before'], stats['tokens_after'],
+                    stats['sentences_after'], stats['sentences_before'], stats['elapsed_ms'])
+        return compressed, stats
+    
+    def get_cached_sentence_embeddings(self, sentences: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up sentence embeddings in the cache only, without embedding misses
+        
+        Args:
+            sentences: The sentences to get embeddings for
+            
+        Returns:
+            Dictionary mapping the index of each cached sentence to its embedding
+        """
+        keys = [self._cache_key(sentence) for sentence in sentences]
+        cached = cache.get_many(keys)
+        
+        metrics.CACHE_REQUESTS.inc(len(cached), cache='sentence_embedding', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(set(keys)) - len(cached), cache='sentence_embedding', result='miss')
+        return {
+            i: np.frombuffer(cached[key], dtype=np.float32)
+            for i, key in enumerate(keys) if key in cached
+        }
+    
+    def get_sentence_embeddings(self, sentences: List[str]) -> np.ndarray:
+        """
+        Look up sentence embeddings in the cache, embedding any misses in one batched call
+        
+        Args:
+            sentences: The sentences to get embeddings for
+            
+        Returns:
+            A (len(sentences), dimension) float32 matrix
+        """
+        keys = [self._cache_key(sentence) for sentence in sentences]
+        cached = cache.get_many(keys)
+        
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        metrics.CACHE_REQUESTS.inc(len(keys) - len(missing), cache='sentence_embedding', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(missing), cache='sentence_embedding', result='miss')
+        if missing:
+            logger.debug(f"Sentence embedding cache: {len(sentences) - len(missing)} hits, {len(missing)} misses")
+            embeddings = self.embedding_service.create_embeddings([sentences[i] for i in missing])
+            new_entries = {
+                keys[i]: np.asarray(embedding, dtype=np.float32).tobytes()
+                for i, embedding in zip(missing, embeddings)
+            }
+            cache.set_many(new_entries, timeout=SENTENCE_EMBEDDING_CACHE_TTL_SECONDS)
+            cached.update(new_entries)
+        
+        return np.vstack([np.frombuffer(cached[key], dtype=np.float32) for key in keys])
+    
+    def warm_cache(self, text: str):
+        """Precompute the sentence embeddings of an ingested text"""
+        sentences = self.split_sentences(text)
+        if sentences:
+            self.get_sentence_embeddings(sentences)
+    
+    def _cache_key(self, sentence: str) -> str:
+        digest = hashlib.sha1(sentence.encode('utf-8')).hexdigest()
+        return f"sentence_embedding:{self.embedding_service.embedding_model}:{digest}"
+
+
 class LLMService:
     """Service for interacting with the LLM using the OpenAI v1+ API"""
     
+    # Runs the requests of hedged LLM calls, sized so they don't queue
+    hedge_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_MAX_WORKERS, thread_name_prefix='llm-hedge')
+    
     def __init__(self):
         from openai import OpenAI
         
@@ -179,7 +715,7 @@ class LLMService:
             raise ValueError("OpenAI API key is required. Check your .env file.")
         
         # Initialize the client with the API key
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(api_key=self.api_key, base_url=OPENAI_BASE_URL)
         
         # Default fallback prompt if no prompt is found in database
         self.default_prompt = {
@@ -187,6 +723,20 @@ class LLMService:
             "response_guidelines": "Be concise, accurate, and helpful. If you don't know the answer based on the provided context, say so.",
             "restrictions": "Only answer based on the context provided. Do not make up information."
         }
+        
+        self.prompt_layout = PROMPT_LAYOUT
+        self.hedge_delay = LLM_HEDGE_DELAY_SECONDS
+        self.default_static_prefix = "\n\n".join([
+            f"# Role\n{self.default_prompt['assistant_role']}",
+            f"# Response Guidelines\n{self.default_prompt['response_guidelines']}",
+            f"# Limitations\n{self.default_prompt['restrictions']}"
+        ])
+        
+        # Token usage, model and latency of the most recent response
+        self.last_usage = None
+        self.last_error = None
+        self.last_model = None
+        self.last_latency = None
     
     def get_active_prompt(self, user=None):
         """
@@ -196,7 +746,8 @@ class LLMService:
             user: The user to get the prompt for (optional)
             
         Returns:
-            Active Prompt model instance or None
+            Active Prompt model instance or None. A user's prompt is cached until
+            it changes and shared between requests, so it must not be modified.
         """
         from .models import Prompt
         
@@ -206,11 +757,13 @@ class LLMService:
             # Filter by user if provided
             if user:
                 prompt_query = prompt_query.filter(user=user)
-                
-            active_prompt = prompt_query.first()
+                active_prompt = ACTIVE_PROMPT.get(user.id, prompt_query.first)
+            else:
+                active_prompt = prompt_query.first()
             
             if active_prompt:
-                logger.info(f"Using active prompt from database: {active_prompt.name} (User: {user.username if user else 'None'})")
+                logger.info("Using active prompt from database: %s (User: %s)",
+                            active_prompt.name, user.username if user else 'None')
                 return active_prompt
             
             logger.info("No active prompt found in database, will use default")
@@ -221,7 +774,9 @@ class LLMService:
             logger.info("Using default prompt values due to error")
             return None
     
-    def generate_response(self, query: str, context: str, history: List[Dict[str, str]] = None, user=None) -> str:
+    def generate_response(self, query: str, context: str, history: List[Dict[str, str]] = None, user=None,
+                          summary: str = "", timeout: Optional[float] = None, model: Optional[str] = None,
+                          max_tokens: Optional[int] = None, prompt=None) -> str:
         """
         Generate a response from the LLM with detailed logging of all prompts
         
@@ -230,6 +785,11 @@ class LLMService:
             context: Context information retrieved from documents
             history: Optional conversation history
             user: The user making the request (optional)
+            summary: Optional rolling summary of the earlier conversation
+            timeout: Optional deadline in seconds, StageTimeout is raised when it's missed
+            model: Optional model to use instead of the default LLM_MODEL
+            max_tokens: Optional completion token limit
+            prompt: The user's active Prompt, if the caller already loaded it
             
         Returns:
             The LLM's response
@@ -238,25 +798,36 @@ class LLMService:
             history = []
         
         # Get the active prompt for the specific user or use defaults
-        active_prompt = self.get_active_prompt(user=user)
+        active_prompt = prompt or self.get_active_prompt(user=user)
         
         # Generate the system prompt
         if active_prompt:
             # Use the prompt's generate_system_prompt method
-            system_prompt = active_prompt.generate_system_prompt(dynamic_context=context)
+            system_prompt = active_prompt.generate_system_prompt(
+                dynamic_context=context,
+                conversation_summary=summary,
+                layout=self.prompt_layout
+            )
+        elif self.prompt_layout == "cache_friendly":
+            # Static default sections first, dynamic sections last
+            sections = [self.default_static_prefix]
+            sections.append(f"# Retrieved Information\n{context}")
+            if summary:
+                sections.append(f"# Conversation Summary\n{summary}")
+            system_prompt = "\n\n".join(sections)
         else:
             # Create a basic default prompt
             sections = []
             sections.append(f"# Role\n{self.default_prompt['assistant_role']}")
             sections.append(f"# Retrieved Information\n{context}")
+            if summary:
+                sections.append(f"# Conversation Summary\n{summary}")
             sections.append(f"# Response Guidelines\n{self.default_prompt['response_guidelines']}")
             sections.append(f"# Limitations\n{self.default_prompt['restrictions']}")
             system_prompt = "\n\n".join(sections)
         
-        # Log the full prompt context
-        logger.info("=============== FULL CONTEXT WINDOW ===============")
-        logger.info(f"Context documents (length: {len(context)} chars):\n{context}")
-        logger.info("=============== END CONTEXT ===============")
+        # Log the full prompt context for sampled requests
+        log_payload(logger, "Context window", context)
         
         # Prepare the messages for the LLM
         messages = [
@@ -264,62 +835,650 @@ class LLMService:
         ]
         
         # Add conversation history
+        for msg in history:
+            messages.append({"role": msg["role"], "content": msg["content"]})
         if history:
-            logger.info("=============== CONVERSATION HISTORY ===============")
-            for msg in history:
-                logger.info(f"{msg['role'].upper()}: {msg['content']}")
-                messages.append({"role": msg["role"], "content": msg["content"]})
-            logger.info("=============== END HISTORY ===============")
+            log_payload(logger, "Conversation history", "\n".join(
+                f"{msg['role'].upper()}: {msg['content']}" for msg in history
+            ))
         
         # Add the current query
-        logger.info(f"CURRENT QUERY: {query}")
+        logger.info("Current query: %s", Truncated(query))
         messages.append({"role": "user", "content": query})
         
         # Log the full message structure being sent to OpenAI
-        logger.debug("=============== FULL OPENAI MESSAGES ===============")
-        for msg in messages:
-            logger.debug(f"ROLE: {msg['role']}")
-            logger.debug(f"CONTENT: {msg['content']}")
-            logger.debug("---")
-        logger.debug("=============== END OPENAI MESSAGES ===============")
+        if logger.isEnabledFor(logging.DEBUG):
+            for msg in messages:
+                logger.debug("OpenAI message (%s): %s", msg['role'], Truncated(msg['content']))
+        
+        self.last_usage = None
+        self.last_error = None
+        self.last_model = model or self.model
+        self.last_latency = None
         
         try:
             start_time = time.time()
-            logger.info("Sending request to OpenAI API...")
+            logger.info("Sending request to OpenAI API (model: %s)...", self.last_model)
+            
+            if timeout is not None and timeout <= 0:
+                # The request's budget is already spent, don't start a call
+                raise StageTimeout('llm', 0.0)
             
             # Call the OpenAI API using the new client format
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._create_completion(
+                timeout if timeout is not None else LLM_TIMEOUT_SECONDS,
+                model=self.last_model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=500
+                max_tokens=max_tokens or 500
             )
             
-            logger.info(f"OpenAI API response received in {time.time() - start_time:.2f} seconds")
+            self.last_latency = time.time() - start_time
+            metrics.LLM_REQUEST_SECONDS.observe(self.last_latency, model=self.last_model)
+            logger.info("OpenAI API response received in %.2f seconds", self.last_latency)
             response_text = response.choices[0].message.content
+            self.last_usage = self._record_usage(response)
             
-            # Log the model's response
-            logger.info("=============== MODEL RESPONSE ===============")
-            logger.info(response_text)
-            logger.info("=============== END RESPONSE ===============")
+            # Log the model's response for sampled requests
+            log_payload(logger, "Model response", response_text)
             
             return response_text
+        except StageTimeout as e:
+            metrics.LLM_ERRORS.inc(model=self.last_model, reason='timeout')
+            self.last_error = e
+            raise
         except Exception as e:
+            metrics.LLM_ERRORS.inc(model=self.last_model, reason='error')
             logger.error(f"Error generating LLM response: {str(e)}")
+            self.last_error = e
             return f"I'm sorry, I encountered an error while processing your request: {str(e)}"
+    
+    @timed_stage('llm')
+    def _create_completion(self, timeout: float, **kwargs):
+        """
+        Call the chat completions API within a deadline, optionally hedged
+        
+        With a hedge delay configured, a second identical request is sent if the
+        first one hasn't completed after the delay, and whichever succeeds first
+        is used.
+        """
+        # Retries would silently exceed the deadline, so they are disabled here
+        client = self.client.with_options(timeout=timeout, max_retries=0)
+        call = lambda: client.chat.completions.create(**kwargs)
+        
+        if not self.hedge_delay or self.hedge_delay >= timeout:
+            try:
+                return call()
+            except openai.APITimeoutError as e:
+                raise StageTimeout('llm', timeout) from e
+        
+        expires_at = time.monotonic() + timeout
+        pending = {self.hedge_executor.submit(call)}
+        done, pending = wait(pending, timeout=self.hedge_delay)
+        if not done:
+            metrics.DEADLINE_HITS.inc(stage='llm_hedged')
+            logger.info(f"No LLM response after {self.hedge_delay:.2f}s, sending hedged request")
+            pending.add(self.hedge_executor.submit(call))
+        
+        # Use the first successful response, or raise the last error
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=max(expires_at - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise StageTimeout('llm', timeout)
+        
+        if isinstance(error, openai.APITimeoutError):
+            raise StageTimeout('llm', timeout) from error
+        raise error
+    
+    def _record_usage(self, response) -> Optional[Dict[str, int]]:
+        """Extract prompt, completion and cached token counts from an API response"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        
+        details = getattr(usage, 'prompt_tokens_details', None)
+        usage_data = {
+            'prompt_tokens': usage.prompt_tokens or 0,
+            'completion_tokens': usage.completion_tokens or 0,
+            'cached_tokens': (getattr(details, 'cached_tokens', None) or 0) if details else 0,
+        }
+        
+        hit_rate = usage_data['cached_tokens'] / usage_data['prompt_tokens'] if usage_data['prompt_tokens'] else 0
+        logger.info("Token usage: prompt=%d completion=%d cached=%d (%.0f%% of prompt, layout=%s)",
+                    usage_data['prompt_tokens'], usage_data['completion_tokens'],
+                    usage_data['cached_tokens'], hit_rate * 100, self.prompt_layout)
+        annotate('prompt_tokens', usage_data['prompt_tokens'])
+        return usage_data
+    
+    def summarize_conversation(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Fold conversation messages into a running summary
+        
+        Args:
+            previous_summary: The current summary of the conversation (may be empty)
+            messages: The messages to add to the summary, in chronological order
+            
+        Returns:
+            The updated summary text
+        """
+        transcript = "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in messages)
+        
+        prompt_messages = [
+            {"role": "system", "content": (
+                "You maintain a running summary of a conversation between a user and an assistant. "
+                "Update the summary with the new messages. Keep the facts, questions and answers "
+                "the conversation may refer back to, and stay under 200 words."
+            )},
+            {"role": "user", "content": (
+                f"# Current Summary\n{previous_summary or '(none)'}\n\n# New Messages\n{transcript}"
+            )}
+        ]
+        
+        start_time = time.time()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=prompt_messages,
+            temperature=0,
+            max_tokens=300
+        )
+        logger.info(f"Conversation summary generated in {time.time() - start_time:.2f} seconds")
+        
+        return response.choices[0].message.content
+
+
+def _phrase_pattern(phrases):
+    """Alternation of phrases, longest first, matching whole words"""
+    return "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+
+
+class RetrievalRouter:
+    """Decide per turn whether fresh retrieval is needed, using rules and a tiny linear model"""
+    
+    RETRIEVE = 'retrieve'
+    REUSE = 'reuse'
+    NONE = 'none'
+    # A probable follow-up: the previous documents are reused only if they
+    # score at least RETRIEVAL_REUSE_MIN_SCORE against the query
+    LIKELY_REUSE = 'likely_reuse'
+    
+    # Logistic model over [bias, length, question mark, question word, anaphora ratio, digits]
+    # scoring how likely a turn is a follow-up answerable from the previous documents
+    REUSE_WEIGHTS = np.array([0.4, -3.0, -0.6, -0.8, 6.0, -1.5])
+    
+    def __init__(self, acknowledgements=None, confirmations=None, reuse_phrases=None,
+                 anaphora=None, question_words=None):
+        # Acknowledgements, greetings and other turns that need no documents at all
+        self.no_retrieval = re.compile(
+            rf"^(?:(?:{_phrase_pattern(acknowledgements or RETRIEVAL_ROUTER_ACKNOWLEDGEMENTS)})[\s,.!]*)+$"
+        )
+        # Yes/no answers to the previous turn, which continue its topic
+        self.confirmation = re.compile(
+            rf"^(?:{_phrase_pattern(confirmations or RETRIEVAL_ROUTER_CONFIRMATIONS)})\b[\s,.!]*"
+        )
+        # Requests to rework the previous answer, which need the same documents again
+        self.reuse_request = re.compile(
+            rf"(?<!\w)(?:{_phrase_pattern(reuse_phrases or RETRIEVAL_ROUTER_REUSE_PHRASES)})(?!\w)"
+        )
+        self.anaphora = set(anaphora or RETRIEVAL_ROUTER_ANAPHORA)
+        self.question_words = set(question_words or RETRIEVAL_ROUTER_QUESTION_WORDS)
+    
+    def classify(self, query: str, has_previous_turn: bool) -> str:
+        """
+        Classify a turn as needing fresh retrieval, reusing the previous documents, or none
+        
+        Args:
+            query: The user's message
+            has_previous_turn: Whether the conversation has earlier turns
+            
+        Returns:
+            One of RETRIEVE, REUSE, LIKELY_REUSE or NONE
+        """
+        start_time = time.perf_counter()
+        text = query.lower().strip()
+        
+        if self.no_retrieval.match(text):
+            decision, reason = self.NONE, 'rule: acknowledgement'
+        elif not has_previous_turn:
+            decision, reason = self.RETRIEVE, 'first turn'
+        elif self.confirmation.match(text):
+            decision, reason = self.REUSE, 'rule: confirmation'
+        elif self.reuse_request.search(text):
+            decision, reason = self.REUSE, 'rule: rework previous answer'
+        else:
+            probability = self.reuse_probability(text)
+            decision = self.LIKELY_REUSE if probability > 0.5 else self.RETRIEVE
+            reason = f'model: p_reuse={probability:.2f}'
+        
+        elapsed_us = (time.perf_counter() - start_time) * 1e6
+        logger.info("Retrieval router: decision=%s (%s) in %.0f us", decision, reason, elapsed_us)
+        return decision
+    
+    def reuse_probability(self, text: str) -> float:
+        """Score how likely a message is a follow-up on the previous answer"""
+        words = re.findall(r"\w+(?:'\w+)?", text)
+        if not words:
+            return 0.0
+        features = np.array([
+            1.0,
+            min(len(words) / 20, 1.0),
+            1.0 if '?' in text else 0.0,
+            1.0 if words[0] in self.question_words else 0.0,
+            sum(word in self.anaphora for word in words) / len(words),
+            1.0 if any(char.isdigit() for char in text) else 0.0,
+        ])
+        return float(1 / (1 + np.exp(-features @ self.REUSE_WEIGHTS)))
+    
+    def record(self, decision: str):
+        """Count a decision in today's statistics"""
+        from .models import RetrievalRoutingStat
+        
+        today = timezone.localdate()
+        updated = RetrievalRoutingStat.objects.filter(
+            date=today, decision=decision
+        ).update(count=F('count') + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    RetrievalRoutingStat.objects.create(date=today, decision=decision, count=1)
+            except IntegrityError:
+                RetrievalRoutingStat.objects.filter(
+                    date=today, decision=decision
+                ).update(count=F('count') + 1)
+
+
+class ModelRouter:
+    """Route each request to a model tier based on the query and observed latencies"""
+    
+    # Exponentially weighted moving average of the response latency per model
+    _latency_ewma = {}
+    _latency_lock = threading.Lock()
+    
+    def __init__(self, tiers: List[Dict[str, Any]] = None):
+        self.tiers = tiers if tiers is not None else LLM_MODEL_TIERS
+    
+    @classmethod
+    def observe(cls, model: str, latency: float) -> float:
+        """Update the latency average of a model with a real response time"""
+        with cls._latency_lock:
+            previous = cls._latency_ewma.get(model)
+            if previous is None:
+                current = latency
+            else:
+                current = ROUTING_EWMA_ALPHA * latency + (1 - ROUTING_EWMA_ALPHA) * previous
+            cls._latency_ewma[model] = current
+            return current
+    
+    @classmethod
+    def latency(cls, model: str) -> Optional[float]:
+        with cls._latency_lock:
+            return cls._latency_ewma.get(model)
+    
+    def choose(self, query: str, document_scores: List[Tuple[Any, float]], history_tokens: int,
+               override: str = "") -> Dict[str, Any]:
+        """
+        Choose the model tier for a request
+        
+        Args:
+            query: The user's question
+            document_scores: Retrieved (document, score) tuples, best first
+            history_tokens: Size of the conversation history sent with the request
+            override: Model configured for the tenant, bypassing routing
+            
+        Returns:
+            Dict with the tier name, model, max_tokens and the reason of the decision
+        """
+        default_tier = self.tiers[-1] if self.tiers else {'name': 'default', 'model': LLM_MODEL, 'max_tokens': 500}
+        
+        if override:
+            # Only configured models can be pinned, e.g. not one saved before a tier was removed
+            tier = next((t for t in self.tiers if t['model'] == override), None)
+            if tier:
+                return self._log(dict(tier, reason='tenant override'), {})
+            logger.warning(f"Ignoring model override {override!r}, it is not a configured tier")
+        
+        scores = [float(score) for _, score in document_scores]
+        features = {
+            'query_tokens': estimate_tokens(query),
+            'top_score': round(scores[0], 4) if scores else 0.0,
+            'score_margin': round(scores[0] - scores[1], 4) if len(scores) > 1 else (round(scores[0], 4) if scores else 0.0),
+            'history_tokens': history_tokens,
+        }
+        
+        if len(self.tiers) < 2:
+            return self._log(dict(default_tier, reason='single tier'), features)
+        
+        fast_tier = self.tiers[0]
+        is_simple = (
+            features['query_tokens'] <= ROUTING_MAX_QUERY_TOKENS
+            and features['top_score'] >= ROUTING_MIN_TOP_SCORE
+            and features['score_margin'] >= ROUTING_MIN_SCORE_MARGIN
+            and features['history_tokens'] <= ROUTING_MAX_HISTORY_TOKENS
+        )
+        if not is_simple:
+            return self._log(dict(default_tier, reason='complex request'), features)
+        
+        # The fast tier only pays off while it actually responds faster
+        fast_latency = self.latency(fast_tier['model'])
+        default_latency = self.latency(default_tier['model'])
+        if fast_latency is not None and default_latency is not None and fast_latency > default_latency:
+            # A share still goes to the fast tier, otherwise its average could never recover
+            if random.random() < ROUTING_EXPLORE_RATE:
+                return self._log(dict(fast_tier, reason='exploring slower fast tier'), features)
+            return self._log(dict(default_tier, reason='fast tier currently slower'), features)
+        
+        return self._log(dict(fast_tier, reason='simple request'), features)
+    
+    def _log(self, route, features):
+        logger.info("Routing decision: tier=%s model=%s reason=%s features=%s",
+                    route['name'], route['model'], route['reason'], features)
+        return route
+
+
+class ConversationSummaryService:
+    """Service maintaining the rolling summary of long conversations"""
+    
+    # Summaries are refreshed off the request thread
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='conversation-summary')
+    
+    def __init__(self, llm_service=None):
+        from .models import Conversation, Message
+        self.Conversation = Conversation
+        self.Message = Message
+        self.llm_service = llm_service
+    
+    def needs_refresh(self, unsummarized_messages: List[Dict[str, str]], has_summary: bool = False) -> bool:
+        """
+        Check whether messages not covered by the summary should be folded into it
+        
+        Before the first summary, that is once they are over the token threshold.
+        Once a summary exists, the prompt only carries the most recent messages,
+        so any older message is folded before it drops out of the prompt.
+        """
+        if len(unsummarized_messages) <= HISTORY_RECENT_MESSAGES:
+            return False
+        if has_summary:
+            return True
+        tokens = sum(estimate_tokens(msg['content']) for msg in unsummarized_messages)
+        return tokens > HISTORY_SUMMARY_TOKEN_THRESHOLD
+    
+    def schedule_refresh(self, conversation):
+        """Refresh the summary of a conversation in a background thread"""
+        logger.info(f"Scheduling summary refresh for conversation {conversation.session_id}")
+        self.executor.submit(self._refresh_in_thread, conversation.id)
+    
+    def _refresh_in_thread(self, conversation_pk):
+        try:
+            self.refresh(conversation_pk)
+        except Exception as e:
+            logger.error(f"Error refreshing conversation summary: {str(e)}")
+        finally:
+            # Threads outside the request cycle have to close their own connection
+            connection.close()
+    
+    def refresh(self, conversation_pk):
+        """
+        Fold all messages except the most recent ones into the conversation summary
+        
+        Messages are folded in windows of at most HISTORY_SUMMARY_FOLD_MESSAGES,
+        one LLM call each, so the first refresh of a long conversation doesn't
+        send its whole history at once.
+        
+        Args:
+            conversation_pk: Primary key of the Conversation to summarize
+        """
+        conversation = self.Conversation.objects.get(pk=conversation_pk)
+        last_message_id = conversation.summary_last_message_id
+        summary = conversation.summary
+        
+        messages = self.Message.objects.filter(conversation=conversation).order_by('timestamp')
+        if last_message_id:
+            messages = messages.filter(id__gt=last_message_id)
+        messages = list(messages)
+        
+        to_fold = messages[:-HISTORY_RECENT_MESSAGES] if HISTORY_RECENT_MESSAGES else messages
+        if not to_fold:
+            return
+        
+        llm_service = self.llm_service or LLMService()
+        
+        for start in range(0, len(to_fold), HISTORY_SUMMARY_FOLD_MESSAGES):
+            window = to_fold[start:start + HISTORY_SUMMARY_FOLD_MESSAGES]
+            new_summary = llm_service.summarize_conversation(summary, [
+                {"role": msg.role, "content": msg.content} for msg in window
+            ])
+            
+            # Only store the summary if no concurrent refresh got there first
+            updated = self.Conversation.objects.filter(
+                pk=conversation_pk,
+                summary_last_message_id=last_message_id
+            ).update(summary=new_summary, summary_last_message_id=window[-1].id)
+            if not updated:
+                logger.info(f"Discarded summary of conversation {conversation.session_id}, "
+                            f"it was refreshed concurrently")
+                return
+            
+            folded_tokens = sum(estimate_tokens(msg.content) for msg in window)
+            logger.info(f"Refreshed summary of conversation {conversation.session_id}: "
+                        f"{len(window)} message(s) ({folded_tokens} tokens) folded into "
+                        f"{estimate_tokens(new_summary)} summary tokens")
+            summary, last_message_id = new_summary, window[-1].id
+
+
+class AnswerCacheService:
+    """Service caching answers to repeated questions"""
+    
+    # Share of stored answers that also prune expired and outdated entries
+    PRUNE_PROBABILITY = 0.01
+    
+    def __init__(self, similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                 ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS):
+        from .models import CachedAnswer, Document
+        self.CachedAnswer = CachedAnswer
+        self.Document = Document
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+    
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize a query so trivially different phrasings share an exact-match key"""
+        normalized = re.sub(r'\s+', ' ', query.lower()).strip()
+        return normalized.strip('?!.,;: ')
+    
+    def get_versions(self, user, active_prompt) -> Tuple[str, str]:
+        """
+        Get the versions a cached answer depends on
+        
+        The document version is a per-user counter in the user_data cache,
+        bumped whenever a document is created, deleted, activated,
+        deactivated or re-chunked (see models.bump_document_version), so the
+        lookup costs the same whatever the size of the corpus.
+        The prompt version is the active prompt's last update time.
+        
+        Returns:
+            Tuple containing (document_version, prompt_version)
+        """
+        document_version = str(get_version('documents', user.id if user else 0))
+        
+        prompt_version = active_prompt.updated_at.isoformat() if active_prompt else "default"
+        return document_version, prompt_version
+    
+    def _valid_entries(self, user, versions):
+        document_version, prompt_version = versions
+        entries = self.CachedAnswer.objects.filter(
+            document_version=document_version,
+            prompt_version=prompt_version,
+            created_at__gte=timezone.now() - timedelta(seconds=self.ttl_seconds)
+        )
+        if user:
+            entries = entries.filter(user=user)
+        return entries
+    
+    def lookup_exact(self, query: str, user, versions):
+        """Find a cached answer for exactly the same normalized query"""
+        query_hash = hashlib.sha256(self.normalize(query).encode('utf-8')).hexdigest()
+        entry = self._valid_entries(user, versions).filter(query_hash=query_hash).order_by('-created_at').first()
+        metrics.CACHE_REQUESTS.inc(cache='answer_exact', result='hit' if entry else 'miss')
+        if entry:
+            self._record_hit(entry, "exact")
+        return entry
+    
+    def lookup_similar(self, query_embedding, user, versions):
+        """Find the cached answer whose query embedding is most similar, above the threshold"""
+        candidates = list(
+            self._valid_entries(user, versions)
+            .filter(query_embedding__isnull=False)
+            .order_by('-created_at')
+            .values_list('id', 'query_embedding')[:ANSWER_CACHE_MAX_CANDIDATES]
+        )
+        if not candidates:
+            metrics.CACHE_REQUESTS.inc(cache='answer_similar', result='miss')
+            return None
+        
+        ids = [entry_id for entry_id, _ in candidates]
+        matrix = np.array([embedding for _, embedding in candidates], dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = matrix @ query / np.where(norms == 0, 1, norms)
+        
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            metrics.CACHE_REQUESTS.inc(cache='answer_similar', result='miss')
+            logger.info(f"Answer cache miss: best similarity {scores[best]:.4f} below {self.similarity_threshold}")
+            return None
+        
+        metrics.CACHE_REQUESTS.inc(cache='answer_similar', result='hit')
+        entry = self.CachedAnswer.objects.get(id=ids[best])
+        self._record_hit(entry, f"similar ({scores[best]:.4f})")
+        return entry
+    
+    def store(self, query: str, query_embedding, response: str, documents, user, versions):
+        """Cache a generated answer with its reference documents"""
+        normalized = self.normalize(query)
+        document_version, prompt_version = versions
+        entry = self.CachedAnswer.objects.create(
+            normalized_query=normalized,
+            query_hash=hashlib.sha256(normalized.encode('utf-8')).hexdigest(),
+            query_embedding=list(query_embedding),
+            response=response,
+            document_version=document_version,
+            prompt_version=prompt_version,
+            user=user
+        )
+        entry.reference_documents.set(documents)
+        logger.debug(f"Cached answer {entry.id} for query: '{normalized}'")
+        
+        if random.random() < self.PRUNE_PROBABILITY:
+            self._prune(user, versions)
+        return entry
+    
+    def _prune(self, user, versions):
+        """Delete expired entries, and the user's entries for outdated versions"""
+        document_version, prompt_version = versions
+        expired = self.CachedAnswer.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=self.ttl_seconds)
+        ).delete()[0]
+        outdated = self.CachedAnswer.objects.filter(user=user).exclude(
+            document_version=document_version, prompt_version=prompt_version
+        ).delete()[0]
+        logger.debug(f"Pruned {expired} expired and {outdated} outdated cached answer(s)")
+    
+    def _record_hit(self, entry, kind):
+        self.CachedAnswer.objects.filter(id=entry.id).update(hit_count=F('hit_count') + 1)
+        logger.info(f"Answer cache hit ({kind}): entry {entry.id}")
+
+
+class UsageLedgerService:
+    """Service recording token usage and stage timings per message and per user and day"""
+    
+    # Model recorded for answers served from the answer cache
+    CACHE_MODEL = 'answer-cache'
+    
+    STAGES = ['embed', 'search', 'history', 'llm', 'persist']
+    
+    def __init__(self):
+        from .models import UsageRollup
+        self.UsageRollup = UsageRollup
+    
+    @staticmethod
+    def _tokens(usage: Optional[Dict[str, int]]) -> Dict[str, int]:
+        usage = usage or {}
+        return {
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'cached_tokens': usage.get('cached_tokens', 0),
+        }
+    
+    def message_fields(self, model: Optional[str], usage: Optional[Dict[str, int]],
+                       timings: RequestTimer) -> Dict[str, Any]:
+        """
+        Usage and timing fields of an assistant Message, set when it is inserted
+        
+        The persist stage is still running at that point and is only counted
+        in the rollup.
+        """
+        return dict(self._tokens(usage), model=model or '', timings=timings.as_dict())
+    
+    def record(self, user, model: Optional[str], usage: Optional[Dict[str, int]], timings: RequestTimer):
+        """
+        Add a turn's usage and timings to the user's daily rollup
+        
+        Args:
+            user: The user making the request (optional)
+            model: The model that generated the answer
+            usage: Prompt, completion and cached token counts, if the API reported them
+            timings: Stage timings of the request
+        """
+        stage_ms = timings.as_dict()
+        tokens = self._tokens(usage)
+        
+        # Incremental upsert of the (user, day, model) rollup row
+        increments = dict(tokens, total_ms=round(timings.total_ms()))
+        increments.update({f"{stage}_ms": stage_ms.get(stage, 0) for stage in self.STAGES})
+        key = {'user': user, 'date': timezone.localdate(), 'model': model or ''}
+        
+        updates = {field: F(field) + value for field, value in increments.items()}
+        updated = self.UsageRollup.objects.filter(**key).update(requests=F('requests') + 1, **updates)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    self.UsageRollup.objects.create(requests=1, **key, **increments)
+            except IntegrityError:
+                self.UsageRollup.objects.filter(**key).update(requests=F('requests') + 1, **updates)
 
 
 class RAGService:
     """Service implementing the RAG pipeline"""
     
+    # Moving average of full index search times, to estimate what a reused
+    # candidate set saves
+    FULL_SEARCH_EWMA_ALPHA = 0.1
+    _full_search_ms = None
+    _full_search_lock = threading.Lock()
+    
     def __init__(self):
         from .models import Conversation, Message
         self.Conversation = Conversation
         self.Message = Message
         self.vector_search = VectorSearchService()
         self.llm_service = LLMService()
+        self.summary_service = ConversationSummaryService(self.llm_service)
+        self.answer_cache = AnswerCacheService() if ANSWER_CACHE_ENABLED else None
+        self.router = ModelRouter()
+        self.retrieval_router = RetrievalRouter()
+        self.usage_ledger = UsageLedgerService()
+        self.compression = None
+        if CONTEXT_COMPRESSION_ENABLED:
+            self.compression = ContextCompressionService(self.vector_search.embedding_service)
     
-    def process_query(self, query: str, conversation_id: Optional[str] = None, user=None) -> Tuple[str, List[Any]]:
+    def process_query(self, query: str, conversation_id: Optional[str] = None, user=None) -> Tuple[str, List[Any], str]:
         """
         Process a user query with detailed logging of the entire RAG pipeline
         
@@ -329,104 +1488,530 @@ class RAGService:
             user: The user making the query (optional)
             
         Returns:
-            Tuple containing (response, relevant_documents)
+            Tuple containing (response, relevant_documents, conversation_id). The
+            ID is a new conversation's when conversation_id was not given or
+            does not belong to the user.
         """
         logger.info("=============== NEW QUERY PROCESSING ===============")
-        logger.info(f"Query: '{query}'")
-        logger.info(f"Conversation ID: {conversation_id}")
-        logger.info(f"User: {user.username if user else 'Anonymous'}")
+        logger.info("Query: '%s'", Truncated(query))
+        logger.info("Conversation ID: %s", conversation_id)
+        logger.info("User: %s", user.username if user else 'Anonymous')
         start_time = time.time()
+        sample_payloads()
+        budget = LatencyBudget()
+        # The pipeline's own stages, apart from the request timer of the middleware
+        timings = RequestTimer()
+        active_prompt = self.llm_service.get_active_prompt(user=user)
         
-        # 1. Retrieve similar documents
+        conversation = None
+        if conversation_id:
+            # If user is provided, ensure the conversation belongs to the user
+            conversation_query = self.Conversation.objects.filter(session_id=conversation_id)
+            if user:
+                conversation_query = conversation_query.filter(user=user)
+            conversation = conversation_query.first()
+        
+        # 0. Answers to the opening question of a conversation don't depend on
+        # any history, so they can be served from the answer cache
+        cache_versions = None
+        if self.answer_cache and not conversation_id:
+            cache_versions = self.answer_cache.get_versions(user, active_prompt)
+            cached = self.answer_cache.lookup_exact(query, user, cache_versions)
+            if cached:
+                return self._answer_from_cache(cached, query, user, start_time, timings)
+        
+        # 1. Retrieve similar documents, unless the turn doesn't need fresh retrieval
         logger.info("STEP 1: Retrieving similar documents...")
-        document_scores = self.vector_search.search_similar_documents(query, top_k=3, user=user)
+        query_embedding = None
+        document_scores = []
+        candidates = None
+        embedded = False
+        # Conversations are only created together with their first turn
+        decision = self.retrieval_router.classify(query, has_previous_turn=conversation is not None)
+        
+        if decision == RetrievalRouter.REUSE:
+            document_scores = [(doc, 0.0) for doc in self._previous_turn_documents(conversation_id, user)]
+            if not document_scores:
+                decision = RetrievalRouter.RETRIEVE
+        elif decision == RetrievalRouter.LIKELY_REUSE:
+            query_embedding, embedded = self._embed_query(query, budget, timings), True
+            if query_embedding is not None:
+                document_scores = self._score_previous_turn(conversation_id, query_embedding, user)
+            decision = RetrievalRouter.REUSE if document_scores else RetrievalRouter.RETRIEVE
+        self.retrieval_router.record(decision)
+        
+        if decision == RetrievalRouter.RETRIEVE:
+            if not embedded:
+                query_embedding = self._embed_query(query, budget, timings)
+            
+            if query_embedding is None:
+                # Degrade to lexical retrieval, then to the documents of the previous turn
+                with timings.measure('search'):
+                    document_scores = self.vector_search.search_lexical(query, top_k=3, user=user)
+                if not document_scores and conversation:
+                    document_scores = [(doc, 0.0) for doc in self._previous_turn_documents(conversation_id, user)]
+            else:
+                if cache_versions:
+                    cached = self.answer_cache.lookup_similar(query_embedding, user, cache_versions)
+                    if cached:
+                        return self._answer_from_cache(cached, query, user, start_time, timings)
+                
+                if conversation and conversation.candidate_document_ids:
+                    with timings.measure('search'):
+                        document_scores = self._search_conversation_candidates(conversation, query_embedding, user)
+                
+                if not document_scores:
+                    # Keep the wider candidate set so follow-ups can be scored against it
+                    search_start = time.perf_counter()
+                    with timings.measure('search'):
+                        candidates = self.vector_search.search_similar_documents(
+                            query, top_k=max(RETRIEVAL_REUSE_CANDIDATES, 3), user=user,
+                            query_embedding=query_embedding
+                        )
+                    self._observe_full_search((time.perf_counter() - search_start) * 1000)
+                    document_scores = candidates[:3]
         relevant_documents = [doc for doc, _ in document_scores]
         
-        # 2. Format documents as context
+        # 2. Expand the best chunks to their surrounding text and format as context
         logger.info("STEP 2: Formatting documents as context...")
+        with timings.measure('search'):
+            passages = self.vector_search.expand_documents(relevant_documents)
+            if self.compression and query_embedding is not None:
+                passages, _ = self.compression.compress(passages, query_embedding)
         context = "\n\n".join([
-            f"Document {i+1} ({doc.title}):\n{doc.content}" 
-            for i, doc in enumerate(relevant_documents)
+            f"Document {i+1} ({doc.title}):\n{text}" 
+            for i, (doc, text) in enumerate(passages)
         ])
         
         # 3. Get conversation history if conversation_id is provided
         logger.info("STEP 3: Retrieving conversation history...")
         history = []
-        conversation = None
+        unsummarized_history = []
+        summary = ""
         
-        if conversation_id:
-            try:
-                # If user is provided, ensure the conversation belongs to the user
-                conversation_query = self.Conversation.objects.filter(session_id=conversation_id)
-                if user:
-                    conversation_query = conversation_query.filter(user=user)
-                    
-                conversation = conversation_query.first()
+        with timings.measure('history'):
+            if conversation:
+                logger.info("Found existing conversation: %s", conversation.session_id)
+                messages = self.Message.objects.filter(conversation=conversation).order_by('timestamp')
+                
+                # Take the last 5 messages to keep context manageable
+                recent_messages = list(messages.order_by('-timestamp')[:HISTORY_MAX_MESSAGES])
+                recent_messages.reverse()  # Put in chronological order
                 
-                if conversation:
-                    logger.info(f"Found existing conversation: {conversation.session_id}")
-                    messages = self.Message.objects.filter(conversation=conversation).order_by('timestamp')
-                    
-                    # Take the last 5 messages to keep context manageable
-                    for msg in messages.order_by('-timestamp')[:5]:
-                        history.append({
-                            "role": msg.role,
-                            "content": msg.content
-                        })
-                    history.reverse()  # Put in chronological order
-                    
-                    logger.info(f"Retrieved {len(history)} message(s) from history")
-                else:
-                    logger.info("No existing conversation found or it doesn't belong to the user")
+                # Messages already covered by the rolling summary are replaced by it
+                summary = conversation.summary
+                for msg in recent_messages:
+                    if summary and msg.id <= conversation.summary_last_message_id:
+                        continue
+                    history.append({
+                        "role": msg.role,
+                        "content": msg.content
+                    })
+                unsummarized_history = history
+                if summary and HISTORY_RECENT_MESSAGES:
+                    # Older messages are folded into the summary after this turn
+                    history = history[-HISTORY_RECENT_MESSAGES:]
                 
-            except self.Conversation.DoesNotExist:
-                logger.info("No existing conversation found, will create a new one")
-                # If conversation doesn't exist, we'll create a new one
-                pass
+                logger.info("Retrieved %d message(s) from history", len(history))
+                if summary:
+                    raw_tokens = sum(estimate_tokens(msg.content) for msg in recent_messages)
+                    prompt_tokens = estimate_tokens(summary) + sum(estimate_tokens(msg['content']) for msg in history)
+                    logger.info("History with summary: %d tokens instead of %d tokens for the last %d raw message(s)",
+                                prompt_tokens, raw_tokens, len(recent_messages))
+            elif conversation_id:
+                logger.info("No existing conversation found or it doesn't belong to the user")
         
         # 4. Generate response using the LLM
         logger.info("STEP 4: Generating response using LLM...")
-        response = self.llm_service.generate_response(query, context, history, user=user)
+        history_tokens = estimate_tokens(summary) + sum(estimate_tokens(msg['content']) for msg in history)
+        route = self.router.choose(
+            query, document_scores, history_tokens,
+            override=active_prompt.model_override if active_prompt else ""
+        )
+        try:
+            with timings.measure('llm'):
+                response = self.llm_service.generate_response(
+                    query, context, history, user=user, summary=summary,
+                    timeout=budget.stage_timeout(LLM_TIMEOUT_SECONDS),
+                    model=route['model'], max_tokens=route['max_tokens'], prompt=active_prompt
+                )
+        except StageTimeout as e:
+            record_deadline_hit('llm')
+            response = self._retrieval_only_response(relevant_documents)
+            # A missed deadline counts as (at least) the deadline for the latency
+            # average, unless no call was made because the budget was spent
+            if e.timeout > 0:
+                self.router.observe(route['model'], e.timeout)
+        
+        if self.llm_service.last_latency is not None:
+            ewma = self.router.observe(route['model'], self.llm_service.last_latency)
+            usage = self.llm_service.last_usage or {}
+            logger.info("Routing outcome: tier=%s model=%s latency=%.2fs ewma=%.2fs completion_tokens=%s",
+                        route['name'], route['model'], self.llm_service.last_latency, ewma,
+                        usage.get('completion_tokens'))
         
         # 5. Save conversation and messages to database
         logger.info("STEP 5: Saving conversation and messages...")
-        if not conversation:
-            # Create new conversation if none exists
-            conversation_id = f"conv_{self.Conversation.objects.count() + 1}"
+        with timings.measure('persist'):
+            conversation, _ = self._save_turn(
+                conversation, query, response, relevant_documents, user, candidates,
+                usage_fields=self.usage_ledger.message_fields(
+                    self.llm_service.last_model, self.llm_service.last_usage, timings
+                )
+            )
             
-            # Add user if provided
-            conversation_data = {'session_id': conversation_id}
-            if user:
-                conversation_data['user'] = user
-                
-            conversation = self.Conversation.objects.create(**conversation_data)
-            logger.info(f"Created new conversation with ID: {conversation_id}")
-        
-        # Save user message
-        user_message = self.Message.objects.create(
-            conversation=conversation,
-            role='user',
-            content=query
-        )
-        logger.debug(f"Saved user message with ID: {user_message.id}")
+            if cache_versions and query_embedding is not None and not self.llm_service.last_error:
+                self.answer_cache.store(query, query_embedding, response, relevant_documents, user, cache_versions)
         
-        # Save assistant response
-        assistant_message = self.Message.objects.create(
-            conversation=conversation,
-            role='assistant',
-            content=response
+        self.usage_ledger.record(user, self.llm_service.last_model, self.llm_service.last_usage, timings)
+        self._observe_timings(timings)
+        
+        # 6. Refresh the rolling summary off the critical path if the history grew too large
+        unsummarized = unsummarized_history + [
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": response}
+        ]
+        if self.summary_service.needs_refresh(unsummarized, has_summary=bool(summary)):
+            self.summary_service.schedule_refresh(conversation)
+        
+        logger.info("Query processing completed in %.2f seconds", time.time() - start_time)
+        logger.info("=============== END QUERY PROCESSING ===============")
+        
+        return response, relevant_documents, conversation.session_id
+    
+    def _embed_query(self, query, budget, timings):
+        """Embed the query within the budget, None when the deadline was missed"""
+        try:
+            with timings.measure('embed'):
+                return self.vector_search.embedding_service.create_embedding(
+                    query, timeout=budget.stage_timeout(EMBEDDING_TIMEOUT_SECONDS)
+                )
+        except StageTimeout:
+            record_deadline_hit('embedding')
+            return None
+    
+    def _score_previous_turn(self, conversation_id, query_embedding, user):
+        """
+        Score the previous turn's documents against a probable follow-up
+        
+        Returns:
+            The documents with scores, best first, or an empty list when none
+            scores at least RETRIEVAL_REUSE_MIN_SCORE and fresh retrieval is needed
+        """
+        documents = [doc for doc in self._previous_turn_documents(conversation_id, user) if doc.embedding]
+        if not documents:
+            return []
+        
+        ids, packed = self.vector_search.pack_candidates([(doc, 0.0) for doc in documents])
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        matrix = np.frombuffer(packed, dtype=np.float32).reshape(len(ids), -1)
+        scores = matrix @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+        
+        if scores.max() < RETRIEVAL_REUSE_MIN_SCORE:
+            logger.info("Previous documents don't match the follow-up (best score %.4f)", scores.max())
+            return []
+        return sorted(zip(documents, scores.tolist()), key=lambda item: item[1], reverse=True)
+    
+    def _search_conversation_candidates(self, conversation, query_embedding, user):
+        """
+        Score a follow-up query against the conversation's stored candidate set
+        
+        Returns:
+            The top documents with scores, or an empty list when the best candidate
+            scores below the reuse threshold and the full index has to be searched
+        """
+        search_start = time.perf_counter()
+        document_scores = self.vector_search.search_candidates(
+            query_embedding, conversation.candidate_document_ids,
+            bytes(conversation.candidate_embeddings or b''), top_k=3, user=user
         )
-        logger.debug(f"Saved assistant message with ID: {assistant_message.id}")
+        elapsed_ms = (time.perf_counter() - search_start) * 1000
+        
+        if not document_scores or document_scores[0][1] < RETRIEVAL_REUSE_MIN_SCORE:
+            best = f"{document_scores[0][1]:.4f}" if document_scores else "none"
+            metrics.CACHE_REQUESTS.inc(cache='conversation_candidates', result='miss')
+            logger.info("Candidate set miss (best score %s), searching the full index", best)
+            return []
+        
+        # Estimate the saving against the average full search in this process
+        with RAGService._full_search_lock:
+            full_search_ms = RAGService._full_search_ms
+        saved_ms = max(full_search_ms - elapsed_ms, 0.0) if full_search_ms is not None else 0.0
+        metrics.CACHE_REQUESTS.inc(cache='conversation_candidates', result='hit')
+        metrics.RETRIEVAL_REUSE_SAVED_SECONDS.observe(saved_ms / 1000)
+        logger.info("Candidate set hit (best score %.4f) in %.1f ms, ~%.1f ms saved",
+                    document_scores[0][1], elapsed_ms, saved_ms)
+        return document_scores
+    
+    @classmethod
+    def _observe_full_search(cls, elapsed_ms):
+        with cls._full_search_lock:
+            if cls._full_search_ms is None:
+                cls._full_search_ms = elapsed_ms
+            else:
+                cls._full_search_ms += cls.FULL_SEARCH_EWMA_ALPHA * (elapsed_ms - cls._full_search_ms)
+    
+    def _observe_timings(self, timings):
+        """Report the stage timings of a request to the metrics registry"""
+        for stage, ms in timings.stages.items():
+            metrics.CHAT_STAGE_SECONDS.observe(ms / 1000, stage=stage)
+        metrics.CHAT_REQUEST_SECONDS.observe(timings.total_ms() / 1000)
+    
+    def _retrieval_only_response(self, relevant_documents):
+        """Answer with the retrieved sources when the LLM missed its deadline"""
+        if not relevant_documents:
+            return "I'm sorry, I couldn't generate an answer in time. Please try again."
+        
+        sources = "\n".join(f"- {doc.title}" for doc in relevant_documents)
+        return ("I couldn't generate a complete answer in time. "
+                f"These sources look relevant to your question:\n{sources}")
+    
+    def _previous_turn_documents(self, conversation_id, user):
+        """Get the reference documents of the last assistant message in a conversation that had any"""
+        messages = self.Message.objects.filter(
+            conversation__session_id=conversation_id,
+            role='assistant',
+            reference_documents__isnull=False
+        ).distinct()
+        if user:
+            messages = messages.filter(conversation__user=user)
         
-        # Link relevant documents to the assistant's message
-        for doc in relevant_documents:
-            assistant_message.reference_documents.add(doc)
-        logger.debug(f"Linked {len(relevant_documents)} reference document(s) to response")
+        last_message = messages.order_by('-timestamp').first()
+        return list(last_message.reference_documents.all()) if last_message else []
+    
+    def _answer_from_cache(self, cached, query, user, start_time, timings):
+        """Persist and return a cached answer as a new conversation turn"""
+        relevant_documents = list(cached.reference_documents.all())
+        with timings.measure('persist'):
+            conversation, _ = self._save_turn(
+                None, query, cached.response, relevant_documents, user,
+                usage_fields=self.usage_ledger.message_fields(UsageLedgerService.CACHE_MODEL, None, timings)
+            )
+        self.usage_ledger.record(user, UsageLedgerService.CACHE_MODEL, None, timings)
+        self._observe_timings(timings)
         
-        logger.info(f"Query processing completed in {time.time() - start_time:.2f} seconds")
+        logger.info("Query answered from cache in %.1f ms", (time.time() - start_time) * 1000)
         logger.info("=============== END QUERY PROCESSING ===============")
         
-        return response, relevant_documents
+        return cached.response, relevant_documents, conversation.session_id
+    
+    def _save_turn(self, conversation, query, response, relevant_documents, user, candidates=None,
+                   usage_fields=None):
+        """
+        Save the user message and assistant response in one transaction, creating
+        the conversation if needed
+        
+        Args:
+            conversation: The existing conversation, or None to start a new one
+            query: The user's message
+            response: The assistant's response
+            relevant_documents: Documents to link to the response
+            user: The user the conversation belongs to (optional)
+            candidates: Scored documents of a full search to keep for follow-ups (optional)
+            usage_fields: Usage and timing fields of the assistant message (optional)
+        
+        Returns:
+            Tuple containing (conversation, assistant_message)
+        """
+        candidate_fields = {}
+        if candidates is not None:
+            candidate_ids, candidate_embeddings = self.vector_search.pack_candidates(candidates)
+            candidate_fields = {
+                'candidate_document_ids': candidate_ids,
+                'candidate_embeddings': candidate_embeddings,
+            }
+        
+        with transaction.atomic():
+            if not conversation:
+                # Random IDs need no coordination between workers, unlike a counter
+                conversation = self.Conversation.objects.create(
+                    session_id=f"conv_{uuid.uuid4().hex}",
+                    user=user,
+                    **candidate_fields
+                )
+                logger.info("Created new conversation with ID: %s", conversation.session_id)
+            elif candidate_fields:
+                self.Conversation.objects.filter(pk=conversation.pk).update(**candidate_fields)
+            
+            user_message, assistant_message = self.Message.objects.bulk_create([
+                self.Message(conversation=conversation, role='user', content=query),
+                self.Message(conversation=conversation, role='assistant', content=response, **(usage_fields or {})),
+            ])
+            logger.debug("Saved messages %s and %s", user_message.id, assistant_message.id)
+            
+            # Link relevant documents to the assistant's message in one insert
+            Link = self.Message.reference_documents.through
+            document_ids = dict.fromkeys(doc.id for doc in relevant_documents)
+            Link.objects.bulk_create(
+                [Link(message_id=assistant_message.id, document_id=document_id) for document_id in document_ids],
+                ignore_conflicts=True
+            )
+            logger.debug("Linked %d reference document(s) to response", len(document_ids))
+        
+        return conversation, assistant_message
+
+
+class RequestCoalescingService:
+    """Service sharing one execution between duplicate chat requests"""
+    
+    # Requests currently executing in this process, by key
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
+    
+    POLL_INTERVAL_SECONDS = 0.2
+    # Share of completed requests that also prune expired records
+    PRUNE_PROBABILITY = 0.01
+    
+    def __init__(self, replay_window_seconds: int = CHAT_REPLAY_WINDOW_SECONDS,
+                 wait_seconds: int = CHAT_COALESCE_WAIT_SECONDS):
+        from .models import ChatRequest
+        self.ChatRequest = ChatRequest
+        self.replay_window = timedelta(seconds=replay_window_seconds)
+        self.wait_seconds = wait_seconds
+    
+    @staticmethod
+    def make_key(user, conversation_id, message, idempotency_key=None) -> Optional[str]:
+        """
+        Build the key identifying duplicates of a chat request
+        
+        A client-supplied idempotency key takes precedence. Otherwise requests
+        are duplicates when user, conversation and message are identical.
+        Without a key, requests starting a new conversation are never
+        duplicates: two chats opening with the same question are unrelated.
+        
+        Returns:
+            The key, or None when the request can't be told apart from a new one
+        """
+        user_id = user.id if user else None
+        if idempotency_key:
+            material = f"{user_id}|key|{idempotency_key}"
+        elif conversation_id:
+            material = f"{user_id}|{conversation_id}|{message}"
+        else:
+            return None
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def run(self, key: str, user, compute) -> Tuple[Dict[str, Any], bool]:
+        """
+        Execute compute() once for all concurrent duplicates of a request
+        
+        Args:
+            key: The request key from make_key(), None runs compute() directly
+            user: The user making the request
+            compute: Callable returning a tuple of the JSON-serializable response
+                data and whether it may be replayed. Responses that aren't
+                replayable, such as fallbacks after an upstream error, are
+                shared with concurrent duplicates but not kept for retries.
+            
+        Returns:
+            Tuple containing (response_data, replayed)
+        """
+        if key is None:
+            return compute()[0], False
+        
+        replay = self._get_replay(key)
+        if replay is not None:
+            logger.info(f"Replaying completed chat request {key[:12]}")
+            return replay, True
+        
+        # Single-flight within this process: followers wait for the leader
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+        
+        if not is_leader:
+            logger.info(f"Coalescing duplicate chat request {key[:12]} with the one in flight")
+            try:
+                return future.result(timeout=self.wait_seconds), True
+            except FutureTimeoutError:
+                logger.warning(f"Timed out waiting for chat request {key[:12]}, executing it again")
+                return compute()[0], False
+        
+        try:
+            data, replayed = self._run_across_processes(key, user, compute)
+            future.set_result(data)
+            return data, replayed
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+    
+    def _run_across_processes(self, key, user, compute):
+        """Use the ChatRequest table as a lock shared by all worker processes"""
+        self._delete_expired(key)
+        
+        try:
+            with transaction.atomic():
+                record = self.ChatRequest.objects.create(key=key, user=user)
+        except IntegrityError:
+            # Another process owns the request, wait for its result
+            data = self._wait_for_completion(key)
+            if data is not None:
+                logger.info(f"Coalesced chat request {key[:12]} with another worker")
+                return data, True
+            logger.warning(f"Timed out waiting for chat request {key[:12]}, executing it again")
+            return compute()[0], False
+        
+        try:
+            data, replayable = compute()
+        except Exception:
+            # Let retries run the pipeline again
+            record.delete()
+            raise
+        
+        if not replayable:
+            # A retry may succeed where this attempt failed
+            record.delete()
+            return data, False
+        
+        record.status = 'completed'
+        record.response_data = data
+        record.completed_at = timezone.now()
+        record.save(update_fields=['status', 'response_data', 'completed_at'])
+        
+        # Occasionally clear out old records of other requests
+        if random.random() < self.PRUNE_PROBABILITY:
+            self._prune()
+        
+        return data, False
+    
+    def _get_replay(self, key):
+        record = self.ChatRequest.objects.filter(
+            key=key,
+            status='completed',
+            completed_at__gte=timezone.now() - self.replay_window
+        ).only('response_data').first()
+        return record.response_data if record else None
+    
+    def _wait_for_completion(self, key):
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL_SECONDS)
+            record = self.ChatRequest.objects.filter(key=key).only('status', 'response_data').first()
+            if record is None:
+                # The owner failed and released the key
+                return None
+            if record.status == 'completed':
+                return record.response_data
+        return None
+    
+    def _delete_expired(self, key):
+        """Release a key whose replay window has passed or whose owner died"""
+        now = timezone.now()
+        self.ChatRequest.objects.filter(key=key, status='completed', completed_at__lt=now - self.replay_window).delete()
+        self.ChatRequest.objects.filter(
+            key=key, status='pending', created_at__lt=now - timedelta(seconds=self.wait_seconds)
+        ).delete()
+    
+    def _prune(self):
+        cutoff = timezone.now() - max(self.replay_window, timedelta(seconds=self.wait_seconds))
+        deleted = self.ChatRequest.objects.filter(created_at__lt=cutoff).delete()[0]
+        logger.debug(f"Pruned {deleted} expired chat request record(s)")
 
 
 class DocumentProcessingService:
@@ -439,15 +2024,19 @@ class DocumentProcessingService:
         """
         Process a PDF file by extracting text, splitting into chunks, and storing with embeddings
         
+        The text is split into parent sections of chunk_size characters. Each
+        section is split again into small child chunks, which are the rows that
+        get embedded and scored at query time.
+        
         Args:
             pdf_file: The PDF file object (BytesIO or file path)
             title: Optional title for the document
-            chunk_size: Size of text chunks to split into
-            chunk_overlap: Overlap between chunks to maintain context
+            chunk_size: Size of the parent sections to split into
+            chunk_overlap: Overlap between sections to maintain context
             user: The user who uploaded the document (optional)
             
         Returns:
-            List of created Document objects
+            List of created parent section Document objects
         """
         from .models import Document
         
@@ -471,8 +2060,9 @@ class DocumentProcessingService:
         if not title:
             title = f"PDF Document ({len(chunks)} chunks)"
         
-        # Create documents and embeddings for each chunk
+        # Create a parent section for each chunk, with embedded child chunks
         documents = []
+        child_count = 0
         for i, chunk in enumerate(chunks):
             chunk_title = f"{title} - Part {i+1}"
             logger.debug(f"Processing chunk {i+1}/{len(chunks)}: {chunk_title}")
@@ -489,13 +2079,90 @@ class DocumentProcessingService:
                 
             doc = Document.objects.create(**doc_data)
             
-            # Generate embedding
-            self.embedding_service.process_document(doc)
+            # Generate embedded child chunks for the section
+            child_count += len(self.create_child_chunks(doc))
             documents.append(doc)
+            
+            # Precompute sentence embeddings so compression stays local at query time
+            if CONTEXT_COMPRESSION_ENABLED:
+                ContextCompressionService(self.embedding_service).warm_cache(chunk)
         
-        logger.info(f"PDF processing completed: {len(documents)} documents created")
+        logger.info(f"PDF processing completed: {len(documents)} sections and {child_count} chunks created")
         return documents
     
+    @timed_stage('chunk')
+    def create_child_chunks(self, parent, chunk_size=CHILD_CHUNK_SIZE, chunk_overlap=CHILD_CHUNK_OVERLAP):
+        """
+        Split a parent section into small child chunks and store them with embeddings
+        
+        Args:
+            parent: The parent section Document instance
+            chunk_size: Size of the child chunks
+            chunk_overlap: Overlap between child chunks
+            
+        Returns:
+            List of created child Document objects
+        """
+        from .models import Document, bump_document_version
+        
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True
+        )
+        start_time = time.perf_counter()
+        pieces = text_splitter.create_documents([parent.content])
+        
+        # One batched embeddings call per section instead of one call per chunk
+        embeddings = self.embedding_service.create_embeddings([piece.page_content for piece in pieces])
+        
+        children = Document.objects.bulk_create([
+            Document(
+                title=f"{parent.title} - Chunk {j+1}",
+                content=piece.page_content,
+                embedding=embedding,
+                source=parent.source,
+                is_active=parent.is_active,
+                user=parent.user,
+                parent=parent,
+                start_offset=piece.metadata['start_index']
+            )
+            for j, (piece, embedding) in enumerate(zip(pieces, embeddings))
+        ])
+        bump_document_version(parent.user_id)
+        logger.debug(f"Created {len(children)} child chunks for section {parent.id}")
+        metrics.INGESTION_CHUNKS.inc(len(children))
+        metrics.INGESTION_SECONDS.inc(time.perf_counter() - start_time)
+        
+        return children
+    
+    def rechunk_document(self, document):
+        """
+        Convert a legacy single-level document into a parent section with child chunks
+        
+        The document's own embedding is cleared afterwards, so only the new
+        child chunks are scored at query time. Its sentence embeddings are
+        warmed for compression like those of uploaded PDFs.
+        
+        Args:
+            document: A top-level Document instance without children
+            
+        Returns:
+            List of created child Document objects
+        """
+        children = self.create_child_chunks(document)
+        document.embedding = None
+        document.save(update_fields=['embedding'])
+        
+        if CONTEXT_COMPRESSION_ENABLED:
+            ContextCompressionService(self.embedding_service).warm_cache(document.content)
+        
+        logger.info(f"Re-chunked document {document.id} into {len(children)} child chunks")
+        return children
+    
+    @timed_stage('extract')
     def _extract_text_from_pdf(self, pdf_file):
         """Extract text from a PDF file"""
         if isinstance(pdf_file, str):  # If it's a filepath
@@ -518,6 +2185,7 @@ class DocumentProcessingService:
         
         return text
     
+    @timed_stage('split')
     def _split_text(self, text, chunk_size=1000, chunk_overlap=200):
         """Split text into overlapping chunks"""
         logger.debug(f"Splitting text with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
@@ -545,6 +2213,25 @@ class BackgroundService:
         from .models import BackgroundImage
         return BackgroundImage.objects.filter(is_active=True, user=user).first()
     
+    @staticmethod
+    def get_active_background_data(user):
+        """
+        Get the active background of a user as response data, cached until it changes
+        
+        Returns:
+            Dict with background_id, name and the relative image_url, or None
+        """
+        def load():
+            background = BackgroundService.get_active_background(user)
+            if not background:
+                return None
+            return {
+                'background_id': background.id,
+                'name': background.name,
+                'image_url': background.image.url if hasattr(background.image, 'url') else None
+            }
+        return BACKGROUND_RESPONSE.get(user.id, load)
+    
     @staticmethod
     def list_backgrounds(user):
         """List all backgrounds for a user"""
@@ -590,20 +2277,20 @@ class DocumentService:
     
     @staticmethod
     def list_documents(user):
-        """List all documents for a user"""
+        """List all top-level documents (sections) for a user"""
         from .models import Document
-        return Document.objects.filter(user=user).order_by('-created_at')
+        return Document.objects.filter(user=user, parent__isnull=True).order_by('-created_at')
     
     @staticmethod
     def get_active_documents(user):
-        """Get active documents for a user"""
+        """Get active top-level documents (sections) for a user"""
         from .models import Document
-        return Document.objects.filter(is_active=True, user=user).order_by('-created_at')
+        return Document.objects.filter(is_active=True, user=user, parent__isnull=True).order_by('-created_at')
     
     @staticmethod
     def set_active_documents(document_ids, user):
-        """Set specified documents as active for a user"""
-        from .models import Document
+        """Set specified documents, and their child chunks, as active for a user"""
+        from .models import Document, bump_document_version
         
         # Deactivate all documents for this user first
         Document.objects.filter(user=user).update(is_active=False)
@@ -614,12 +2301,19 @@ class DocumentService:
             user=user
         ).update(is_active=True)
         
+        # Child chunks follow the active state of their parent section
+        Document.objects.filter(
+            parent_id__in=document_ids,
+            user=user
+        ).update(is_active=True)
+        
+        bump_document_version(user.id)
         return updated
     
     @staticmethod
     def delete_document(document_id, user):
         """Delete a document and all related documents with the same source"""
-        from .models import Document
+        from .models import Document, bump_document_version
         
         # Get the document and ensure it belongs to the current user
         document = Document.objects.get(id=document_id, user=user)
@@ -627,6 +2321,7 @@ class DocumentService:
         
         # Delete all documents with the same source that belong to this user
         deleted_count = Document.objects.filter(source=source, user=user).delete()[0]
+        bump_document_version(user.id)
         return deleted_count
 
 class PromptService:
@@ -654,9 +2349,27 @@ class PromptService:
         
         return prompt
     
+    @staticmethod
+    def get_prompt_data(user):
+        """Get the user's prompt as response data, cached until it changes"""
+        def load():
+            prompt = PromptService.get_prompt(user)
+            return {
+                'id': prompt.id,
+                'name': prompt.name,
+                'assistant_role': prompt.assistant_role,
+                'website_context': prompt.website_context,
+                'knowledge_context': prompt.knowledge_context,
+                'response_guidelines': prompt.response_guidelines,
+                'restrictions': prompt.restrictions,
+                'model_override': prompt.model_override,
+                'created_at': prompt.created_at.isoformat() if prompt.created_at else None
+            }
+        return PROMPT_RESPONSE.get(user.id, load)
+    
     @staticmethod
     def update_prompt(prompt_data, user):
-        """Update user's prompt"""
+        """Update user's prompt, raising ValueError for a model outside the configured tiers"""
         from .models import Prompt
         
         prompt = Prompt.objects.filter(user=user).first()
@@ -679,6 +2392,12 @@ class PromptService:
             prompt.response_guidelines = prompt_data['response_guidelines']
         if 'restrictions' in prompt_data:
             prompt.restrictions = prompt_data['restrictions']
+        if 'model_override' in prompt_data:
+            model_override = prompt_data['model_override'] or ''
+            allowed = [tier['model'] for tier in LLM_MODEL_TIERS]
+            if model_override and model_override not in allowed:
+                raise ValueError(f"model_override must be one of: {', '.join(allowed)}")
+            prompt.model_override = model_override
         
         prompt.is_active = True
         prompt.save()
@@ -718,6 +2437,30 @@ class SettingsService:
         
         return settings
     
+    @staticmethod
+    def get_settings_data(user):
+        """Get the active settings of a user as response data, cached until they change"""
+        def load():
+            settings = SettingsService.get_settings(user)
+            return {
+                'id': settings.id,
+                'chatName': settings.chatName,
+                'colorPrimary': settings.colorPrimary,
+                'buttonBg': settings.buttonBg,
+                'welcomeMessage': settings.welcomeMessage,
+                'disclaimerTitle': settings.disclaimerTitle,
+                'disclaimerIntro': settings.disclaimerIntro,
+                'disclaimerPoints': settings.disclaimerPoints,
+                'acceptButtonText': settings.acceptButtonText,
+                'sendButtonText': settings.sendButtonText,
+                'footerDisclaimer': settings.footerDisclaimer,
+                'privacyPolicyText': settings.privacyPolicyText,
+                'is_active': settings.is_active,
+                'created_at': settings.created_at.isoformat() if settings.created_at else None,
+                'updated_at': settings.updated_at.isoformat() if settings.updated_at else None
+            }
+        return SETTINGS_RESPONSE.get(user.id, load)
+    
     @staticmethod
     def update_settings(settings_data, user):
         """Update settings for a user"""
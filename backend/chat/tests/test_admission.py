@@ -0,0 +1,93 @@
+# backend/chat/tests/test_admission.py
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import metrics
+from chat.middleware import AdmissionControlMiddleware, AdmissionController
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+class AdmissionMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.configure(None)
+        self.controller = AdmissionController('chat', concurrency=1, queue_size=0, target_wait=5, max_per_user=1)
+        patcher = mock.patch.dict('chat.middleware.CONTROLLERS', {'chat': self.controller})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='alice')
+        self.middleware = AdmissionControlMiddleware(lambda request: HttpResponse("ok"))
+
+    def request(self):
+        return RequestFactory().post('/api/chat/', HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_admitted_request_releases_its_slot(self):
+        response = self.middleware(self.request())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.controller.stats()['running'], 0)
+
+    def test_full_queue_is_shed_with_retry_after(self):
+        self.assertIsNone(self.controller.acquire('someone else'))
+
+        response = self.middleware(self.request())
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        output = metrics.render()
+        self.assertIn('admission_shed_total{endpoint="chat",reason="queue_full"} 1.0', output)
+        self.assertIn('admission_running{endpoint="chat"} 1.0', output)
+        self.assertIn('admission_queued{endpoint="chat"} 0.0', output)
+
+
+class AdmissionFairnessTests(SimpleTestCase):
+    def test_freed_slot_goes_to_the_user_with_fewest_running_requests(self):
+        controller = AdmissionController('chat', concurrency=2, queue_size=8, target_wait=5, max_per_user=2)
+        for _ in range(2):
+            self.assertIsNone(controller.acquire('alice'))
+        admitted = []
+
+        def acquire(user_key):
+            if controller.acquire(user_key) is None:
+                admitted.append(user_key)
+
+        threads = []
+        for user_key in ('alice', 'bob'):
+            thread = threading.Thread(target=acquire, args=(user_key,))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: controller.stats()['queued'] == len(threads))
+
+        # Alice queued first, but Bob has no running request
+        controller.release('alice', 0.01)
+        wait_until(lambda: admitted == ['bob'])
+        self.assertEqual(controller.stats()['queued'], 1)
+
+        controller.release('bob', 0.01)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(admitted, ['bob', 'alice'])
+
+    def test_user_cannot_queue_beyond_their_slot_limit(self):
+        controller = AdmissionController('chat', concurrency=1, queue_size=8, target_wait=5, max_per_user=1)
+        self.assertIsNone(controller.acquire('alice'))
+        thread = threading.Thread(target=controller.acquire, args=('alice',))
+        thread.start()
+        wait_until(lambda: controller.stats()['queued'] == 1)
+
+        self.assertIsNotNone(controller.acquire('alice'))
+
+        controller.release('alice', 0.01)
+        thread.join(timeout=5)
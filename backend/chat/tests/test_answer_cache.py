@@ -0,0 +1,67 @@
+# backend/chat/tests/test_answer_cache.py
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from chat.models import CachedAnswer, Document
+from chat.services import AnswerCacheService, DocumentService
+from chat.user_cache import cache
+
+
+class AnswerCacheVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice')
+        self.documents = [Document.objects.create(title=f"Doc {i}", content="x", user=self.user) for i in range(5)]
+        self.service = AnswerCacheService()
+
+    def version(self):
+        return self.service.get_versions(self.user, None)[0]
+
+    def test_document_version_changes_when_documents_are_swapped(self):
+        DocumentService.set_active_documents([self.documents[i].id for i in (0, 3, 4)], self.user)
+        first = self.version()
+
+        # Same count, maximum and sum of IDs
+        DocumentService.set_active_documents([self.documents[i].id for i in (1, 2, 4)], self.user)
+
+        self.assertNotEqual(self.version(), first)
+
+    def test_document_version_changes_on_upload_and_delete(self):
+        before = self.version()
+        Document.objects.create(title="New", content="x", user=self.user)
+        after_upload = self.version()
+        DocumentService.delete_document(self.documents[0].id, self.user)
+
+        self.assertNotEqual(after_upload, before)
+        self.assertNotEqual(self.version(), after_upload)
+
+    def test_lookup_needs_no_document_query(self):
+        self.version()
+
+        with self.assertNumQueries(0):
+            self.version()
+
+
+@mock.patch.object(AnswerCacheService, 'PRUNE_PROBABILITY', 1)
+class AnswerCachePruneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice')
+        self.service = AnswerCacheService(ttl_seconds=60)
+
+    def store(self, query, versions):
+        return self.service.store(query, [1.0, 0.0], "Answer", [], self.user, versions)
+
+    def test_expired_and_outdated_entries_are_removed(self):
+        expired = self.store("Old question", ('1', 'p'))
+        CachedAnswer.objects.filter(pk=expired.pk).update(created_at=timezone.now() - timedelta(seconds=120))
+        outdated = self.store("Other question", ('1', 'p'))
+
+        current = self.store("New question", ('2', 'p'))
+
+        self.assertEqual(list(CachedAnswer.objects.values_list('pk', flat=True)), [current.pk])
+        self.assertNotIn(outdated.pk, CachedAnswer.objects.values_list('pk', flat=True))
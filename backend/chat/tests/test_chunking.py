@@ -0,0 +1,84 @@
+# backend/chat/tests/test_chunking.py
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat.mock_openai import StubEmbeddingService
+from chat.models import Document
+from chat.services import DocumentProcessingService, DocumentService, VectorSearchService
+
+SECTION = " ".join(f"Sentence {i} of the section about refunds and shipping." for i in range(10))
+
+
+class ChildChunkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.embedding_service = StubEmbeddingService(32)
+        self.processing = DocumentProcessingService(self.embedding_service)
+        self.parent = Document.objects.create(
+            title="Policies", content=SECTION, source="policies.pdf", user=self.user, embedding=[1.0] * 32
+        )
+
+    def test_children_are_linked_to_their_parent_with_offsets(self):
+        children = self.processing.create_child_chunks(self.parent, chunk_size=120, chunk_overlap=20)
+
+        self.assertGreater(len(children), 1)
+        self.assertEqual(self.embedding_service.calls, 1)
+        for child in children:
+            self.assertEqual(child.parent, self.parent)
+            self.assertEqual(child.source, self.parent.source)
+            self.assertEqual(SECTION[child.start_offset:child.start_offset + len(child.content)], child.content)
+            self.assertEqual(len(child.embedding), 32)
+
+    def test_rechunking_clears_the_parent_embedding(self):
+        children = self.processing.rechunk_document(self.parent)
+
+        self.parent.refresh_from_db()
+        self.assertIsNone(self.parent.embedding)
+        self.assertEqual(Document.objects.filter(parent=self.parent).count(), len(children))
+
+    def test_activating_a_parent_activates_its_children(self):
+        self.processing.create_child_chunks(self.parent, chunk_size=120, chunk_overlap=20)
+        other = Document.objects.create(title="Other", content="x", user=self.user, is_active=True)
+
+        DocumentService.set_active_documents([self.parent.id], self.user)
+
+        self.assertTrue(Document.objects.filter(parent=self.parent).exists())
+        self.assertFalse(Document.objects.filter(parent=self.parent, is_active=False).exists())
+        other.refresh_from_db()
+        self.assertFalse(other.is_active)
+
+
+class ExpandDocumentsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.parent = Document.objects.create(title="Policies", content=SECTION, user=self.user)
+        self.search = VectorSearchService(StubEmbeddingService(32))
+
+    def child(self, start, length=50):
+        return Document(
+            title="Chunk", content=SECTION[start:start + length], user=self.user,
+            parent=self.parent, start_offset=start
+        )
+
+    def test_overlapping_windows_of_one_parent_are_merged(self):
+        first, second = self.child(100), self.child(150)
+
+        [(doc, text)] = self.search.expand_documents([first, second], window_chars=100)
+
+        self.assertEqual(doc, self.parent)
+        self.assertIn(first.content.strip(), text)
+        self.assertIn(second.content.strip(), text)
+
+    def test_distant_windows_stay_separate_and_in_rank_order(self):
+        far, near = self.child(400), self.child(0)
+
+        passages = self.search.expand_documents([far, near], window_chars=100)
+
+        self.assertEqual(len(passages), 2)
+        self.assertIn(far.content.strip(), passages[0][1])
+        self.assertIn(near.content.strip(), passages[1][1])
+
+    def test_documents_without_a_parent_are_returned_whole(self):
+        legacy = Document(title="Legacy", content="A single-level document.", user=self.user)
+
+        self.assertEqual(self.search.expand_documents([legacy]), [(legacy, legacy.content)])
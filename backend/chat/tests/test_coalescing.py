@@ -0,0 +1,50 @@
+# backend/chat/tests/test_coalescing.py
+from concurrent.futures import Future
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat.models import ChatRequest
+from chat.services import RequestCoalescingService
+
+
+class RequestCoalescingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.coalescer = RequestCoalescingService()
+
+    def test_new_conversations_are_only_matched_by_idempotency_key(self):
+        make_key = RequestCoalescingService.make_key
+
+        self.assertIsNone(make_key(self.user, None, "What are your opening hours?"))
+        self.assertIsNotNone(make_key(self.user, None, "What are your opening hours?", 'retry-1'))
+        self.assertIsNotNone(make_key(self.user, 'conv_1', "What are your opening hours?"))
+
+    def test_completed_response_is_replayed(self):
+        key = self.coalescer.make_key(self.user, None, "Hi", 'retry-1')
+        self.coalescer.run(key, self.user, lambda: ({'response': 'Hello'}, True))
+
+        data, replayed = self.coalescer.run(key, self.user, lambda: ({'response': 'Other'}, True))
+
+        self.assertEqual(data, {'response': 'Hello'})
+        self.assertTrue(replayed)
+
+    def test_fallback_response_is_not_replayed(self):
+        key = self.coalescer.make_key(self.user, None, "Hi", 'retry-1')
+        self.coalescer.run(key, self.user, lambda: ({'response': "I'm sorry"}, False))
+
+        self.assertFalse(ChatRequest.objects.filter(key=key).exists())
+        data, replayed = self.coalescer.run(key, self.user, lambda: ({'response': 'Hello'}, True))
+        self.assertEqual(data, {'response': 'Hello'})
+        self.assertFalse(replayed)
+
+    def test_follower_runs_the_request_itself_when_the_leader_is_too_slow(self):
+        key = self.coalescer.make_key(self.user, None, "Hi", 'retry-1')
+        RequestCoalescingService._in_flight[key] = Future()
+        self.addCleanup(RequestCoalescingService._in_flight.pop, key, None)
+        coalescer = RequestCoalescingService(wait_seconds=0)
+
+        data, replayed = coalescer.run(key, self.user, lambda: ({'response': 'Hello'}, True))
+
+        self.assertEqual(data, {'response': 'Hello'})
+        self.assertFalse(replayed)
@@ -0,0 +1,64 @@
+# backend/chat/tests/test_compression.py
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from chat.mock_openai import StubEmbeddingService, fake_embedding
+from chat.models import Document
+from chat.services import ContextCompressionService, DocumentProcessingService
+
+WARMED = "Refunds take 14 days. Shipping takes 3 days. The warranty lasts two years. Manuals are online."
+
+
+class ContextCompressionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.embedding_service = StubEmbeddingService(32)
+        self.compression = ContextCompressionService(self.embedding_service, ratio=0.5, max_tokens=0)
+        self.compression.warm_cache(WARMED)
+        self.embedding_service.calls = 0
+
+    def test_warmed_passages_are_compressed(self):
+        compressed, stats = self.compression.compress([('doc', WARMED)], fake_embedding("Shipping takes 3 days.", 32))
+
+        self.assertEqual(self.embedding_service.calls, 0)
+        [(_, text)] = compressed
+        self.assertIn("Shipping takes 3 days.", text)
+        self.assertLess(stats['tokens_after'], stats['tokens_before'])
+
+    def test_passages_with_an_uncached_sentence_are_kept_whole(self):
+        # A context window cut mid-sentence at both edges
+        mixed = "ds take 14 days. " + WARMED.split(". ", 1)[1] + " Opening hou"
+        passages = [('warmed', WARMED), ('mixed', mixed)]
+
+        compressed, _ = self.compression.compress(passages, fake_embedding("Shipping takes 3 days.", 32))
+
+        self.assertEqual(self.embedding_service.calls, 0)
+        self.assertIn(('mixed', mixed), compressed)
+
+    def test_passages_without_cached_sentences_are_kept_whole(self):
+        passages = [('warmed', WARMED), ('cold', "Never warmed. Kept as it is.")]
+
+        compressed, _ = self.compression.compress(passages, fake_embedding("Refunds take 14 days.", 32))
+
+        self.assertEqual(self.embedding_service.calls, 0)
+        self.assertIn(('cold', "Never warmed. Kept as it is."), compressed)
+
+
+class RechunkWarmingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.embedding_service = StubEmbeddingService(32)
+        self.document = Document.objects.create(
+            title="Legacy", content=WARMED, user=User.objects.create_user(username='alice')
+        )
+
+    @mock.patch('chat.services.CONTEXT_COMPRESSION_ENABLED', True)
+    def test_rechunking_warms_the_sentence_embeddings(self):
+        DocumentProcessingService(self.embedding_service).rechunk_document(self.document)
+
+        compression = ContextCompressionService(self.embedding_service)
+        sentences = compression.split_sentences(WARMED)
+        self.assertEqual(len(compression.get_cached_sentence_embeddings(sentences)), len(sentences))
@@ -0,0 +1,42 @@
+# backend/chat/tests/test_conversation_summary.py
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat import services
+from chat.models import Conversation, Message
+from chat.services import ConversationSummaryService
+
+
+@mock.patch.object(services, 'HISTORY_RECENT_MESSAGES', 2)
+@mock.patch.object(services, 'HISTORY_SUMMARY_FOLD_MESSAGES', 4)
+class ConversationSummaryTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='alice')
+        self.conversation = Conversation.objects.create(session_id='conv_1', user=user)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, role=role, content=f"Message {i}")
+            for i, role in enumerate(['user', 'assistant'] * 5)
+        ]
+        self.llm_service = mock.Mock()
+        self.llm_service.summarize_conversation.side_effect = lambda summary, messages: (
+            f"{summary}+{len(messages)}"
+        )
+        self.service = ConversationSummaryService(self.llm_service)
+
+    def test_history_is_folded_in_bounded_windows(self):
+        self.service.refresh(self.conversation.pk)
+
+        folded = [len(call.args[1]) for call in self.llm_service.summarize_conversation.call_args_list]
+        self.assertEqual(folded, [4, 4])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "+4+4")
+        self.assertEqual(self.conversation.summary_last_message_id, self.messages[7].id)
+
+    def test_messages_leaving_the_prompt_are_folded_once_summarized(self):
+        turn = [{'role': 'user', 'content': 'Hi'}, {'role': 'assistant', 'content': 'Hello'}]
+
+        self.assertFalse(self.service.needs_refresh(turn, has_summary=True))
+        self.assertTrue(self.service.needs_refresh(turn * 2, has_summary=True))
+        self.assertFalse(self.service.needs_refresh(turn * 2, has_summary=False))
@@ -0,0 +1,30 @@
+# backend/chat/tests/test_deadlines.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat import services
+from chat.services import EmbeddingService, LLMService, StageTimeout
+
+
+@mock.patch.object(services, 'OPENAI_KEY', 'test-key')
+class SpentBudgetTests(SimpleTestCase):
+    def test_llm_call_is_not_started(self):
+        llm_service = LLMService()
+
+        with mock.patch.object(llm_service, '_create_completion') as create_completion:
+            with self.assertRaises(StageTimeout) as context:
+                llm_service.generate_response("Hi", "", prompt=mock.Mock(), timeout=0.0)
+
+        create_completion.assert_not_called()
+        self.assertEqual(context.exception.timeout, 0.0)
+        self.assertIs(llm_service.last_error, context.exception)
+
+    def test_embedding_call_is_not_started(self):
+        embedding_service = EmbeddingService()
+
+        with mock.patch.object(embedding_service, '_request_embeddings') as request_embeddings:
+            with self.assertRaises(StageTimeout):
+                embedding_service.create_embedding("Hi", timeout=0.0)
+
+        request_embeddings.assert_not_called()
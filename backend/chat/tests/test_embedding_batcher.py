@@ -0,0 +1,98 @@
+# backend/chat/tests/test_embedding_batcher.py
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+from django.test import SimpleTestCase
+
+from chat.mock_openai import fake_embedding
+from chat.services import EmbeddingBatcher
+
+
+class RecordingBackend:
+    """request_batch stand-in recording the texts of each call"""
+
+    def __init__(self, error=None, release=None):
+        self.batches = []
+        self.error = error
+        self.release = release
+
+    def __call__(self, texts, timeout=None):
+        self.batches.append(list(texts))
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return [fake_embedding(text, 8) for text in texts]
+
+
+def submit_all(batcher, texts, request_batch, timeout=None):
+    """Submit each text from its own thread, returning each text's embedding or exception"""
+    outcomes = {}
+
+    def submit(text):
+        try:
+            outcomes[text] = batcher.submit(text, request_batch, timeout=timeout)
+        except Exception as e:
+            outcomes[text] = e
+
+    threads = [threading.Thread(target=submit, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return outcomes
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    texts = ["opening hours", "refunds", "shipping", "warranty"]
+
+    def test_concurrent_requests_share_one_call(self):
+        backend = RecordingBackend()
+        batcher = EmbeddingBatcher(window_seconds=5, max_batch_size=len(self.texts))
+
+        submit_all(batcher, self.texts, backend)
+
+        self.assertEqual(len(backend.batches), 1)
+        self.assertCountEqual(backend.batches[0], self.texts)
+
+    def test_each_caller_gets_its_own_embedding(self):
+        batcher = EmbeddingBatcher(window_seconds=5, max_batch_size=len(self.texts))
+
+        outcomes = submit_all(batcher, self.texts, RecordingBackend())
+
+        self.assertEqual(outcomes, {text: fake_embedding(text, 8) for text in self.texts})
+
+    def test_partial_batch_is_sent_after_the_window(self):
+        backend = RecordingBackend()
+        batcher = EmbeddingBatcher(window_seconds=0.01, max_batch_size=100)
+
+        self.assertEqual(batcher.submit("refunds", backend), fake_embedding("refunds", 8))
+        self.assertEqual(backend.batches, [["refunds"]])
+
+    def test_errors_reach_every_caller(self):
+        error = requests.Timeout("upstream timed out")
+        batcher = EmbeddingBatcher(window_seconds=5, max_batch_size=len(self.texts))
+
+        outcomes = submit_all(batcher, self.texts, RecordingBackend(error=error))
+
+        self.assertEqual(list(outcomes.values()), [error] * len(self.texts))
+
+    def test_waiting_callers_time_out_when_the_call_hangs(self):
+        release = threading.Event()
+        backend = RecordingBackend(release=release)
+        batcher = EmbeddingBatcher(window_seconds=0.2, max_batch_size=100)
+        leader = threading.Thread(target=batcher.submit, args=("refunds", backend), kwargs={'timeout': 5})
+        leader.start()
+        # Join the leader's batch rather than opening one
+        while batcher._open_batch is None:
+            time.sleep(0.001)
+
+        try:
+            with self.assertRaises(FutureTimeoutError):
+                batcher.submit("shipping", backend, timeout=0.05)
+        finally:
+            release.set()
+            leader.join(timeout=5)
+        self.assertEqual(backend.batches, [["refunds", "shipping"]])
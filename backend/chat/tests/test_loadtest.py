@@ -0,0 +1,68 @@
+# backend/chat/tests/test_loadtest.py
+import io
+
+import PyPDF2
+import requests
+from django.contrib.auth.models import User
+from django.core.management import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from chat.management.commands.loadtest import Command, synthetic_pdf
+from chat.mock_openai import MockOpenAIServer
+
+
+class MockOpenAIServerTests(SimpleTestCase):
+    def test_injects_errors_at_the_configured_rate(self):
+        with MockOpenAIServer(latency_ms=0, error_rate=1.0, error_status=429) as server:
+            response = requests.post(f"{server.base_url}/embeddings", json={'input': 'hello', 'model': 'm'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['error']['type'], 'rate_limit_error')
+        self.assertEqual(server.errors, 1)
+
+    def test_streams_completion_chunks(self):
+        with MockOpenAIServer(latency_ms=0, stream_chunk_ms=0, response_chars=120) as server:
+            response = requests.post(f"{server.base_url}/chat/completions", json={
+                'model': 'm', 'stream': True, 'messages': [{'role': 'user', 'content': 'hi'}],
+            })
+
+        events = [line[len('data: '):] for line in response.text.splitlines() if line.startswith('data: ')]
+        self.assertEqual(response.headers['Content-Type'], 'text/event-stream')
+        self.assertGreater(len(events), 2)
+        self.assertEqual(events[-1], '[DONE]')
+
+
+class SyntheticPdfTests(SimpleTestCase):
+    def test_text_is_extractable(self):
+        pdf = synthetic_pdf(["Refunds are issued within 14 days.", "Shipping takes (about) 3 days."])
+
+        text = PyPDF2.PdfReader(io.BytesIO(pdf)).pages[0].extract_text()
+
+        self.assertIn("Refunds are issued within 14 days.", text)
+        self.assertIn("Shipping takes about 3 days.", text)
+
+
+class LoadTestUserTests(TestCase):
+    def test_existing_account_is_not_taken_over(self):
+        User.objects.create_user(username='loadtest-1', password='secret')
+
+        with self.assertRaises(CommandError):
+            Command()._create_users(2, reuse=True)
+        self.assertFalse(User.objects.filter(username='loadtest-0').exists())
+
+    def test_kept_users_are_reused_on_request(self):
+        Command()._create_users(2, reuse=False)
+
+        with self.assertRaises(CommandError):
+            Command()._create_users(2, reuse=False)
+        users = Command()._create_users(2, reuse=True)
+        self.assertEqual([user.username for user, _ in users], ['loadtest-0', 'loadtest-1'])
+        self.assertFalse(users[0][0].has_usable_password())
+
+
+class SummaryTests(SimpleTestCase):
+    def test_failed_requests_count_as_errors(self):
+        summary = Command()._summarize([(10.0, 200, False), (20.0, 200, True), (30.0, 429, False)], 1.0)
+
+        self.assertEqual(summary['error_rate'], round(1 / 3, 4))
+        self.assertEqual(summary['shed_rate'], round(1 / 3, 4))
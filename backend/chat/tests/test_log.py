@@ -0,0 +1,56 @@
+# backend/chat/tests/test_log.py
+import logging
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.log import Truncated, log_payload, sample_payloads
+
+logger = logging.getLogger('chat.tests')
+
+
+class TruncatedTests(SimpleTestCase):
+    @override_settings(LOG_PAYLOAD_MAX_CHARS=10)
+    def test_text_is_cut_at_the_configured_limit(self):
+        self.assertEqual(str(Truncated("a" * 25)), "aaaaaaaaaa... [15 more chars]")
+
+    @override_settings(LOG_PAYLOAD_MAX_CHARS=10)
+    def test_short_text_is_unchanged(self):
+        self.assertEqual(str(Truncated("short")), "short")
+
+    @override_settings(LOG_PAYLOAD_MAX_CHARS=0)
+    def test_zero_limit_disables_truncation(self):
+        self.assertEqual(str(Truncated("a" * 25)), "a" * 25)
+
+    def test_explicit_limit_overrides_the_setting(self):
+        self.assertEqual(str(Truncated("abcdef", limit=3)), "abc... [3 more chars]")
+
+
+class PayloadSamplingTests(SimpleTestCase):
+    @override_settings(LOG_PAYLOAD_SAMPLE_RATE=0)
+    def test_unsampled_payloads_are_not_formatted(self):
+        sample_payloads()
+
+        with mock.patch.object(Truncated, '__str__') as format_payload, self.assertNoLogs(logger, 'INFO'):
+            log_payload(logger, "Context window", "x" * 5000)
+        format_payload.assert_not_called()
+
+    @override_settings(LOG_PAYLOAD_SAMPLE_RATE=1, LOG_PAYLOAD_MAX_CHARS=100)
+    def test_sampled_payloads_are_logged_truncated(self):
+        sample_payloads()
+
+        with self.assertLogs(logger, 'INFO') as logs:
+            log_payload(logger, "Context window", "x" * 5000)
+
+        [message] = logs.output
+        self.assertIn("Context window (5000 chars)", message)
+        self.assertIn("x" * 100 + "... [4900 more chars]", message)
+        self.assertNotIn("x" * 101, message)
+
+    @override_settings(LOG_PAYLOAD_SAMPLE_RATE=0.5)
+    def test_sampling_is_decided_once_per_request(self):
+        with mock.patch('chat.log.random.random', return_value=0.9):
+            self.assertFalse(sample_payloads())
+
+        with mock.patch('chat.log.random.random', return_value=0.1), self.assertNoLogs(logger, 'INFO'):
+            log_payload(logger, "Context window", "text")
@@ -0,0 +1,105 @@
+# backend/chat/tests/test_memory.py
+"""
+Peak-memory regression tests for ingestion and search
+
+Each test runs a service inside `memory_profile`, which records the peak
+Python allocations (tracemalloc) of every pipeline stage, and asserts a
+ceiling per stage. Failures print the whole per-stage profile. Raise a
+ceiling only together with the change that justifies it.
+"""
+import io
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from chat.management.commands.loadtest import synthetic_pdf
+from chat.mock_openai import StubEmbeddingService, fake_embedding
+from chat.models import Document
+from chat.services import DocumentProcessingService, VectorSearchService
+from chat.timing import memory_profile
+
+MB = 1024 * 1024
+
+LINES = [
+    f"Line {i} of the synthetic manual, describing warranty, shipping and refund rules in detail."
+    for i in range(45)
+]
+
+
+class MemoryTestCase(TestCase):
+    def assertStageCeilings(self, profile, ceilings):
+        report = "\n".join(
+            f"  {stage:<10}{values['peak_bytes'] / MB:>8.1f} MB{values['ms']:>10.0f} ms"
+            for stage, values in profile.report().items()
+        )
+        for stage, ceiling in ceilings.items():
+            with self.subTest(stage=stage):
+                self.assertIn(stage, profile.memory, f"Stage {stage} was not recorded:\n{report}")
+                self.assertLessEqual(
+                    profile.memory[stage], ceiling,
+                    f"{stage} peaked at {profile.memory[stage] / MB:.1f} MB, "
+                    f"ceiling {ceiling / MB:.1f} MB. Per stage:\n{report}"
+                )
+
+
+class MemoryProfileTests(SimpleTestCase):
+    def test_nested_stage_peaks_count_towards_enclosing_stages(self):
+        with memory_profile() as profile:
+            with profile.measure('outer'):
+                with profile.measure('inner'):
+                    buffer = bytearray(4 * MB)
+                    del buffer
+
+        self.assertGreaterEqual(profile.memory['inner'], 4 * MB)
+        self.assertLess(profile.memory['inner'], 5 * MB)
+        self.assertGreaterEqual(profile.memory['outer'], 4 * MB)
+        self.assertGreaterEqual(profile.memory['total'], 4 * MB)
+        self.assertIn('ms', profile.report()['inner'])
+
+
+class IngestionMemoryTests(MemoryTestCase):
+    def test_500_page_pdf(self):
+        user = User.objects.create_user(username='alice')
+        # Smaller embeddings keep the test fast under tracemalloc; they are
+        # created and stored one section at a time either way
+        service = DocumentProcessingService(embedding_service=StubEmbeddingService(256))
+        pdf = io.BytesIO(synthetic_pdf(LINES, pages=500))
+
+        with memory_profile() as profile:
+            sections = service.process_pdf(pdf, 'Manual', user=user)
+
+        self.assertGreater(len(sections), 100)
+        self.assertStageCeilings(profile, {
+            # About 2 MB of text; the full text and all sections are held at once
+            'extract': 10 * MB,
+            'split': 10 * MB,
+            # Per section: child chunks and their embeddings
+            'chunk': 2 * MB,
+            'total': 20 * MB,
+        })
+
+
+class SearchMemoryTests(MemoryTestCase):
+    def test_search_over_2000_chunks(self):
+        user = User.objects.create_user(username='alice')
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((2000, 1536)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        Document.objects.bulk_create([
+            Document(title=f"Chunk {i}", content=" ".join(LINES[:8]), embedding=vector.tolist(),
+                     is_active=True, user=user)
+            for i, vector in enumerate(vectors)
+        ])
+        service = VectorSearchService(embedding_service=StubEmbeddingService(1536))
+
+        with memory_profile() as profile:
+            results = service.search_similar_documents("warranty", top_k=3, user=user,
+                                                       query_embedding=fake_embedding("warranty"))
+
+        self.assertEqual(len(results), 3)
+        self.assertStageCeilings(profile, {
+            # Every candidate's embedding is loaded as a Python list of floats
+            'search': 128 * MB,
+            'total': 128 * MB,
+        })
@@ -0,0 +1,129 @@
+# backend/chat/tests/test_metrics.py
+import multiprocessing
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import metrics
+from chat.services import EmbeddingBatcher
+
+
+def _record_in_worker(directory, amount):
+    metrics.configure(directory)
+    metrics.INGESTION_CHUNKS.inc(amount)
+    metrics.EMBEDDING_REQUEST_SECONDS.observe(0.02)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        metrics.configure(None)
+
+    def tearDown(self):
+        metrics.configure(None)
+
+    def test_counter_and_labels_are_rendered(self):
+        metrics.CACHE_REQUESTS.inc(cache='answer_exact', result='hit')
+        metrics.CACHE_REQUESTS.inc(2, cache='answer_exact', result='hit')
+
+        output = metrics.render()
+
+        self.assertIn('# TYPE cache_requests_total counter', output)
+        self.assertIn('cache_requests_total{cache="answer_exact",result="hit"} 3.0', output)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.LLM_REQUEST_SECONDS.observe(0.2, model='test-model')
+        metrics.LLM_REQUEST_SECONDS.observe(3.0, model='test-model')
+
+        output = metrics.render()
+
+        self.assertIn('llm_request_seconds_bucket{model="test-model",le="0.1"} 0.0', output)
+        self.assertIn('llm_request_seconds_bucket{model="test-model",le="0.25"} 1.0', output)
+        self.assertIn('llm_request_seconds_bucket{model="test-model",le="+Inf"} 2.0', output)
+        self.assertIn('llm_request_seconds_count{model="test-model"} 2.0', output)
+        self.assertIn('llm_request_seconds_sum{model="test-model"} 3.2', output)
+
+    def test_embedding_batches_are_exported(self):
+        batcher = EmbeddingBatcher(window_seconds=0, max_batch_size=8)
+
+        batcher.submit("hello", lambda texts, timeout: [[1.0] for _ in texts])
+
+        output = metrics.render()
+        self.assertIn('embedding_batch_size_count 1.0', output)
+        self.assertIn('embedding_batch_size_sum 1.0', output)
+
+    def test_wrong_labels_are_rejected(self):
+        with self.assertRaises(ValueError):
+            metrics.LLM_ERRORS.inc(model='test-model')
+
+    def test_label_values_are_escaped(self):
+        metrics.HTTP_REQUESTS.inc(view='say "hi"\n', status=200)
+
+        self.assertIn('view="say \\"hi\\"\\n"', metrics.render())
+
+
+class MultiprocessMetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        metrics.configure(None)
+        shutil.rmtree(self.directory)
+
+    def test_values_are_summed_across_worker_processes(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_record_in_worker, args=(self.directory, amount)) for amount in (3, 4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        metrics.configure(self.directory)
+        metrics.INGESTION_CHUNKS.inc(5)
+        output = metrics.render()
+
+        self.assertIn('ingestion_chunks_total 12.0', output)
+        self.assertIn('embedding_request_seconds_count 2.0', output)
+
+    def test_store_file_grows_beyond_initial_size(self):
+        metrics.configure(self.directory)
+        for i in range(3000):
+            metrics.HTTP_REQUESTS.inc(view=f"view_{i}", status=200)
+
+        output = metrics.render()
+
+        self.assertIn('http_requests_total{status="200",view="view_2999"} 1.0', output)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-token')
+class MetricsEndpointTests(SimpleTestCase):
+    def setUp(self):
+        metrics.configure(None)
+
+    def test_requires_token(self):
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_serves_text_exposition_format(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE chat_stage_seconds histogram', response.content.decode())
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN=None, DEBUG=False)
+class MetricsWithoutTokenTests(TestCase):
+    def get(self, user):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_anonymous_scrape_is_refused(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+    def test_only_staff_can_scrape(self):
+        self.assertEqual(self.get(User.objects.create_user(username='alice')).status_code, 401)
+        self.assertEqual(self.get(User.objects.create_user(username='admin', is_staff=True)).status_code, 200)
@@ -0,0 +1,57 @@
+# backend/chat/tests/test_profiling.py
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.middleware import ProfilingMiddleware
+from chat.profiling import DeterministicProfiler, ProfilerBusy, ProfileStore
+
+
+class DeterministicProfilerTests(SimpleTestCase):
+    def test_one_profile_runs_at_a_time(self):
+        first, second = DeterministicProfiler(), DeterministicProfiler()
+
+        first.start()
+        try:
+            with self.assertRaises(ProfilerBusy):
+                second.start()
+        finally:
+            first.stop()
+
+        second.start()
+        second.stop()
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_SAMPLE_INTERVAL_MS=1)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch('chat.middleware.PROFILE_STORE', ProfileStore(directory, 5))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        staff = User.objects.create_user(username='admin', is_staff=True)
+        self.request = RequestFactory().get(
+            '/api/settings/', HTTP_X_PROFILE='cprofile', HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(staff)}"
+        )
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse("ok"))
+
+    def test_requested_profile_uses_cprofile(self):
+        response = self.middleware(self.request)
+
+        self.assertTrue(response['X-Profile-Id'].endswith('.prof'))
+
+    def test_falls_back_to_sampling_while_cprofile_is_busy(self):
+        busy = DeterministicProfiler()
+        busy.start()
+        try:
+            response = self.middleware(self.request)
+        finally:
+            busy.stop()
+
+        self.assertTrue(response['X-Profile-Id'].endswith('.collapsed'))
@@ -0,0 +1,38 @@
+# backend/chat/tests/test_prompt.py
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat import models
+from chat.models import Prompt
+
+
+class StaticPrefixTests(TestCase):
+    def setUp(self):
+        models._STATIC_PREFIX_CACHE.clear()
+        self.user = User.objects.create_user(username='alice')
+
+    def turn(self, context, summary=""):
+        # Every request loads its own copy of the prompt
+        prompt = Prompt.objects.get(user=self.user)
+        return prompt.generate_system_prompt(context, summary, layout="cache_friendly")
+
+    def test_prefix_is_byte_identical_across_turns(self):
+        prefix = Prompt.objects.get(user=self.user).render_static_prefix()
+
+        first = self.turn("Opening hours are 9 to 17.")
+        second = self.turn("Refunds take 14 days.", "The user asked about opening hours.")
+
+        self.assertTrue(first.startswith(prefix + "\n\n"))
+        self.assertTrue(second.startswith(prefix + "\n\n"))
+
+    def test_edit_replaces_the_cached_prefix(self):
+        prompt = Prompt.objects.get(user=self.user)
+        before = prompt.render_static_prefix()
+
+        prompt.restrictions = "Never discuss pricing."
+        prompt.save()
+        after = Prompt.objects.get(user=self.user).render_static_prefix()
+
+        self.assertNotEqual(after, before)
+        self.assertIn("Never discuss pricing.", after)
+        self.assertEqual(list(models._STATIC_PREFIX_CACHE), [prompt.pk])
@@ -0,0 +1,284 @@
+# backend/chat/tests/test_query_counts.py
+"""
+Query-count and query-plan regression tests for the API endpoints
+
+The counts pin the exact number of queries per request; if a change adds or
+removes queries on purpose, update the number in the same commit. The plan
+tests EXPLAIN every query the hot endpoints issue with sequential scans
+disabled, so a query that can only be answered by scanning a large table
+fails the build even though the test tables are tiny. The index tests check
+that each hot-path query uses the index added for it.
+"""
+import re
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import services
+from chat.mock_openai import MockOpenAIServer, fake_embedding
+from chat.models import BackgroundImage, ChatRequest, Conversation, Document, Message, Prompt, Settings
+from chat.services import DocumentService
+from chat.user_cache import clear_local_caches
+
+# Tables that grow with usage, where a sequential scan on the request path is a bug
+LARGE_TABLES = (
+    'chat_document',
+    'chat_conversation',
+    'chat_message',
+    'chat_message_reference_documents',
+    'chat_chatrequest',
+    'chat_cachedanswer',
+    'chat_usagerollup',
+)
+
+DOCUMENTS = [
+    "Our opening hours are 9 to 17 on weekdays.",
+    "Refunds are issued within 14 days of receiving the returned product.",
+    "Shipping within the EU takes 2 to 5 business days.",
+]
+
+
+class APITestCase(TestCase):
+    """Test case with a user, a small active corpus and the OpenAI stand-in"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.openai = MockOpenAIServer(latency_ms=0, per_item_ms=0, response_chars=200).__enter__()
+        cls.base_url_patch = mock.patch.object(services, 'OPENAI_BASE_URL', cls.openai.base_url)
+        cls.base_url_patch.start()
+        # The services refuse to start without a key, which the stand-in ignores
+        cls.key_patch = mock.patch.object(services, 'OPENAI_KEY', 'test-key')
+        cls.key_patch.start()
+        # The occasional expiry prune would make query counts vary between runs
+        cls.prune_patch = mock.patch.object(services.RequestCoalescingService, 'PRUNE_PROBABILITY', 0)
+        cls.prune_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.prune_patch.stop()
+        cls.key_patch.stop()
+        cls.base_url_patch.stop()
+        cls.openai.__exit__(None, None, None)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        caches['user_data'].clear()
+        clear_local_caches()
+        self.user = User.objects.create_user(username='alice', password='secret')
+        for content in DOCUMENTS:
+            Document.objects.create(
+                title=content[:20], content=content, embedding=fake_embedding(content),
+                is_active=True, user=self.user
+            )
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def chat(self, message, conversation_id=None):
+        payload = {'message': message}
+        if conversation_id:
+            payload['conversation_id'] = conversation_id
+        response = self.client.post('/api/chat/', payload, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+
+class EndpointQueryCountTests(APITestCase):
+    def test_chat_first_turn(self):
+        # Both messages, with the answer's usage and timings, and their
+        # reference documents are written in bulk, inside one transaction.
+        # Without an idempotency key a new conversation skips request
+        # coalescing.
+        with self.assertNumQueries(16):
+            self.chat("What are your opening hours?")
+
+        answer = Message.objects.get(role='assistant')
+        self.assertTrue(answer.model)
+        self.assertIn('llm', answer.timings)
+
+    def test_chat_follow_up_turn(self):
+        conversation_id = self.chat("What are your opening hours?")['conversation_id']
+
+        with self.assertNumQueries(19):
+            self.chat("How long do refunds take?", conversation_id)
+
+    def test_get_settings(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/settings/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_settings_prompt_and_background(self):
+        for url in ('/api/settings/', '/api/prompts/', '/api/backgrounds/active/'):
+            self.client.get(url, **self.auth)
+            # Only the user lookup of the authentication is left
+            with self.subTest(url=url), self.assertNumQueries(1):
+                response = self.client.get(url, **self.auth)
+            self.assertEqual(response.status_code, 200)
+
+    def test_update_settings(self):
+        self.client.get('/api/settings/', **self.auth)
+
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/settings/update/', {'welcomeMessage': 'Hi!'},
+                                        content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_prompt(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/prompts/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_documents(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/documents/', **self.auth)
+        self.assertEqual(len(response.json()['documents']), len(DOCUMENTS))
+
+    def test_active_documents(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/documents/active/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_active_background(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/backgrounds/active/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_usage(self):
+        self.chat("What are your opening hours?")
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/usage/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+
+def explain(queryset, disable=('seqscan',)):
+    """Plan of a queryset with the given planner methods disabled"""
+    with connection.cursor() as cursor:
+        for method in disable:
+            cursor.execute(f"SET enable_{method} = off")
+        try:
+            return queryset.explain()
+        finally:
+            for method in disable:
+                cursor.execute(f"RESET enable_{method}")
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN output is PostgreSQL-specific")
+class QueryPlanTests(APITestCase):
+    def assertNoSequentialScans(self, queries):
+        checked = 0
+        for query in queries:
+            sql = query['sql']
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+                try:
+                    cursor.execute(f"EXPLAIN {sql}")
+                    plan = "\n".join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.execute("RESET enable_seqscan")
+            checked += 1
+            for table in LARGE_TABLES:
+                with self.subTest(sql=sql[:120], table=table):
+                    self.assertNotRegex(plan, rf'Seq Scan on {table}\b', f"{sql}\n{plan}")
+        self.assertGreater(checked, 0)
+
+    def capture(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return context.captured_queries
+
+    def test_chat_turns(self):
+        first_turn = {}
+        queries = self.capture(lambda: first_turn.update(self.chat("What are your opening hours?")))
+        queries += self.capture(lambda: self.chat("How long do refunds take?", first_turn['conversation_id']))
+
+        self.assertNoSequentialScans(queries)
+
+    def test_settings_prompts_documents_and_backgrounds(self):
+        queries = []
+        for url in ('/api/settings/', '/api/prompts/', '/api/documents/',
+                    '/api/documents/active/', '/api/backgrounds/active/', '/api/usage/'):
+            queries += self.capture(lambda: self.client.get(url, **self.auth))
+
+        self.assertNoSequentialScans(queries)
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN output is PostgreSQL-specific")
+class IndexUsageTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Another tenant's rows, so the user's rows are a small share of each table
+        other = User.objects.create_user(username='bob')
+        other_section = Document.objects.create(title="Other", content="x", source='other.pdf', user=other)
+        Document.objects.bulk_create([
+            Document(title=f"Other {i}", content="x", embedding=[0.0] * 4, is_active=i % 2 == 0,
+                     source='other.pdf', parent=other_section, user=other)
+            for i in range(400)
+        ])
+        # Sections with child chunks, as ingestion creates them
+        for i in range(20):
+            section = Document.objects.create(title=f"Section {i}", content="x", source='manual.pdf', user=self.user)
+            Document.objects.bulk_create([
+                Document(title=f"Chunk {i}.{j}", content="x", embedding=[0.0] * 4, source='manual.pdf',
+                         parent=section, user=self.user)
+                for j in range(10)
+            ])
+        self.conversation = Conversation.objects.create(session_id='conv-index', user=self.user)
+        Message.objects.create(conversation=self.conversation, role='user', content='Hi')
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name, ordered=False):
+        # For ordered queries the index must also provide the order, so sorting
+        # is disabled too: on tiny tables sorting a few rows is always cheaper
+        plan = explain(queryset, ('seqscan', 'sort') if ordered else ('seqscan',))
+        self.assertIn(index_name, plan, plan)
+
+    def test_search_candidates(self):
+        self.assertUsesIndex(
+            Document.objects.filter(embedding__isnull=False, is_active=True, user=self.user),
+            'document_user_searchable_idx'
+        )
+
+    def test_document_list(self):
+        self.assertUsesIndex(DocumentService.list_documents(self.user), 'document_user_sections_idx', ordered=True)
+
+    def test_documents_by_source(self):
+        self.assertUsesIndex(Document.objects.filter(source='manual.pdf', user=self.user), 'document_user_source_idx')
+
+    def test_conversation_history(self):
+        self.assertUsesIndex(
+            Message.objects.filter(conversation=self.conversation).order_by('timestamp'),
+            'message_conversation_time_idx',
+            ordered=True
+        )
+
+    def test_latest_conversation(self):
+        self.assertUsesIndex(
+            Conversation.objects.filter(user=self.user).order_by('-created_at')[:1],
+            'conversation_user_created_idx',
+            ordered=True
+        )
+
+    def test_chat_request_pruning(self):
+        cutoff = timezone.now() - timedelta(minutes=5)
+        self.assertUsesIndex(ChatRequest.objects.filter(created_at__lt=cutoff), 'chatrequest_created_idx')
+
+    def test_active_prompt_settings_and_background(self):
+        for model, index_name in [
+            (Prompt, 'prompt_user_active_idx'),
+            (Settings, 'settings_user_active_idx'),
+            (BackgroundImage, 'background_user_active_idx'),
+        ]:
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(model.objects.filter(is_active=True, user=self.user), index_name)
+
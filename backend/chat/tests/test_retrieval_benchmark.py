@@ -0,0 +1,65 @@
+# backend/chat/tests/test_retrieval_benchmark.py
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from chat.mock_openai import StubEmbeddingService
+from chat.services import VectorSearchService
+
+
+class RetrievalBenchmarkTests(TestCase):
+    def run_benchmark(self, **options):
+        output = StringIO()
+        call_command(
+            'benchmark_retrieval', sizes='60', dimensions=32, queries=4, topics=5,
+            stdout=output, stderr=StringIO(), **options
+        )
+        return output.getvalue()
+
+    def test_writes_machine_readable_results(self):
+        report = json.loads(self.run_benchmark())
+
+        self.assertEqual(report['benchmark'], 'retrieval')
+        self.assertEqual(report['config']['dimensions'], 32)
+        [result] = report['results']
+        self.assertEqual(result['chunks'], 60)
+        self.assertEqual(result['searches'], 4)
+        self.assertEqual(result['candidates_per_search'], 60)
+        self.assertEqual(result['db_queries_per_search'], 1)
+        self.assertGreater(result['db_bytes_per_search'], 60 * 32 * 8)
+        self.assertGreater(result['peak_memory_bytes'], 0)
+        self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+
+    def test_compares_against_previous_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            self.run_benchmark(output=baseline)
+
+            report = json.loads(self.run_benchmark(compare=baseline, label='candidate'))
+
+        self.assertEqual(report['label'], 'candidate')
+        self.assertIn('p50_change', report['results'][0])
+
+    def test_synthetic_topics_are_retrievable_with_the_stub(self):
+        self.run_benchmark()
+        user = User.objects.get(username='benchmark-retrieval-60-32')
+        service = VectorSearchService(embedding_service=StubEmbeddingService(32))
+
+        results = service.search_similar_documents('topic 3', top_k=3, user=user)
+
+        self.assertEqual(len(results), 3)
+        for document, score in results:
+            self.assertIn('(topic 3)', document.title)
+            self.assertGreater(score, 0.5)
+
+    def test_refuses_to_take_over_a_real_account(self):
+        user = User.objects.create_user(username='benchmark-retrieval-60-32', password='secret')
+
+        with self.assertRaises(CommandError):
+            self.run_benchmark()
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
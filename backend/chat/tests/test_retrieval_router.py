@@ -0,0 +1,78 @@
+# backend/chat/tests/test_retrieval_router.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat.services import RAGService, RetrievalRouter, VectorSearchService
+from chat.tests.test_query_counts import APITestCase
+
+
+class RetrievalRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = RetrievalRouter()
+
+    def classify(self, query):
+        return self.router.classify(query, has_previous_turn=True)
+
+    def test_acknowledgements_need_no_documents(self):
+        self.assertEqual(self.classify("Thanks!"), RetrievalRouter.NONE)
+        self.assertEqual(self.classify("Köszönöm szépen!"), RetrievalRouter.NONE)
+
+    def test_yes_and_no_reuse_the_previous_documents(self):
+        self.assertEqual(self.classify("yes"), RetrievalRouter.REUSE)
+        self.assertEqual(self.classify("No, the other one"), RetrievalRouter.REUSE)
+        self.assertEqual(self.classify("Igen"), RetrievalRouter.REUSE)
+
+    def test_rework_requests_reuse_the_previous_documents(self):
+        self.assertEqual(self.classify("Fogalmazd át röviden"), RetrievalRouter.REUSE)
+
+    def test_short_topic_switch_is_not_reused_unchecked(self):
+        # Left to the score of the previous documents against the query
+        self.assertIn(self.classify("opening hours"), [RetrievalRouter.RETRIEVE, RetrievalRouter.LIKELY_REUSE])
+
+    def test_accented_words_are_tokenized_whole(self):
+        with_anaphora = self.router.reuse_probability("és ez?")
+        without = self.router.reuse_probability("és éz?")
+
+        self.assertGreater(with_anaphora, without)
+
+    def test_lexicons_are_configurable(self):
+        router = RetrievalRouter(acknowledgements=['danke'])
+
+        self.assertEqual(router.classify("Danke!", has_previous_turn=True), RetrievalRouter.NONE)
+        self.assertNotEqual(router.classify("Thanks!", has_previous_turn=True), RetrievalRouter.NONE)
+
+
+class LikelyReuseTests(SimpleTestCase):
+    def setUp(self):
+        self.rag_service = RAGService.__new__(RAGService)
+        self.rag_service.vector_search = mock.Mock(pack_candidates=VectorSearchService.pack_candidates)
+
+    def score(self, query_embedding):
+        documents = [mock.Mock(id=1, embedding=[1.0, 0.0]), mock.Mock(id=2, embedding=[0.0, 1.0])]
+        with mock.patch.object(self.rag_service, '_previous_turn_documents', return_value=documents):
+            return self.rag_service._score_previous_turn('conv_1', query_embedding, None)
+
+    def test_matching_documents_are_reused_best_first(self):
+        scores = self.score([0.1, 0.9])
+
+        self.assertEqual([doc.id for doc, _ in scores], [2, 1])
+
+    def test_unrelated_documents_are_not_reused(self):
+        self.assertEqual(self.score([-1.0, -1.0]), [])
+
+
+class PreviousTurnTests(APITestCase):
+    def classify_turn(self, message, conversation_id=None):
+        with mock.patch.object(RetrievalRouter, 'classify', autospec=True,
+                               return_value=RetrievalRouter.RETRIEVE) as classify:
+            self.chat(message, conversation_id)
+        return classify.call_args.kwargs['has_previous_turn']
+
+    def test_follow_up_in_an_existing_conversation_has_a_previous_turn(self):
+        conversation_id = self.chat("What are your opening hours?")['conversation_id']
+
+        self.assertTrue(self.classify_turn("And on weekends?", conversation_id))
+
+    def test_unknown_conversation_has_no_previous_turn(self):
+        self.assertFalse(self.classify_turn("And on weekends?", 'unknown-conversation'))
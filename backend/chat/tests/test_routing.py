@@ -0,0 +1,59 @@
+# backend/chat/tests/test_routing.py
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import services
+from chat.models import Prompt
+from chat.services import ModelRouter
+
+TIERS = [
+    {'name': 'fast', 'model': 'fast-model', 'max_tokens': 300},
+    {'name': 'default', 'model': 'default-model', 'max_tokens': 500},
+]
+SIMPLE = ("Opening hours?", [(None, 0.9), (None, 0.5)], 0)
+
+
+class ModelRouterTests(SimpleTestCase):
+    def setUp(self):
+        ModelRouter._latency_ewma.clear()
+        self.router = ModelRouter(TIERS)
+
+    def tearDown(self):
+        ModelRouter._latency_ewma.clear()
+
+    def test_slower_fast_tier_still_gets_exploration_traffic(self):
+        ModelRouter.observe('fast-model', 5.0)
+        ModelRouter.observe('default-model', 1.0)
+
+        with mock.patch.object(services.random, 'random', return_value=0.99):
+            self.assertEqual(self.router.choose(*SIMPLE)['model'], 'default-model')
+        with mock.patch.object(services.random, 'random', return_value=0.0):
+            self.assertEqual(self.router.choose(*SIMPLE)['model'], 'fast-model')
+
+    def test_unknown_override_is_ignored(self):
+        self.assertEqual(self.router.choose(*SIMPLE, override='default-model')['reason'], 'tenant override')
+        self.assertEqual(self.router.choose(*SIMPLE, override='o1-pro')['model'], 'fast-model')
+
+
+@mock.patch.object(services, 'LLM_MODEL_TIERS', TIERS)
+class ModelOverrideValidationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def update(self, model_override):
+        return self.client.post('/api/prompts/update/', {'model_override': model_override},
+                                content_type='application/json', **self.auth)
+
+    def test_tier_model_is_accepted(self):
+        self.assertEqual(self.update('fast-model').status_code, 200)
+        self.assertEqual(Prompt.objects.get(user=self.user).model_override, 'fast-model')
+
+    def test_other_model_is_rejected(self):
+        response = self.update('o1-pro')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Prompt.objects.get(user=self.user).model_override, '')
@@ -0,0 +1,53 @@
+# backend/chat/tests/test_server_timing.py
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from chat.middleware import ServerTimingMiddleware
+from chat.timing import current_timer
+
+
+def view(request):
+    """Runs one query inside a pipeline stage, and reports the installed execute wrappers"""
+    with current_timer().measure('retrieve'):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    return HttpResponse(str(len(connection.execute_wrappers)))
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, METRICS_ENABLED=True, METRICS_DB_ENABLED=False, SLOW_REQUEST_MS=0)
+class ServerTimingMiddlewareTests(TestCase):
+    def get(self):
+        return ServerTimingMiddleware(view)(RequestFactory().get('/api/public-test/'))
+
+    def test_header_lists_the_stages(self):
+        response = self.get()
+
+        stages = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['retrieve', 'total'])
+
+    def test_queries_are_not_wrapped_without_a_consumer(self):
+        response = self.get()
+
+        self.assertEqual(response.content, b"0")
+        self.assertNotIn('db;', response['Server-Timing'])
+
+    @override_settings(METRICS_DB_ENABLED=True)
+    def test_database_metrics_time_the_queries(self):
+        response = self.get()
+
+        self.assertEqual(response.content, b"1")
+        self.assertIn('db;desc="1 queries"', response['Server-Timing'])
+
+    @override_settings(SLOW_REQUEST_MS=60000)
+    def test_slow_request_log_times_the_queries(self):
+        response = self.get()
+
+        self.assertIn('db;desc="1 queries"', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_header_can_be_disabled(self):
+        response = self.get()
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('Timing-Allow-Origin', response)
@@ -0,0 +1,86 @@
+# backend/chat/tests/test_slow_requests.py
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import timing
+from chat.middleware import record_slow_request
+from chat.models import SlowRequest
+from chat.timing import RequestTimer
+
+
+def timer_with_queries(durations_ms, max_queries=2):
+    """Timer that saw one query per duration"""
+    timer = RequestTimer(max_queries)
+    for ms in durations_ms:
+        with mock.patch.object(timing.time, 'perf_counter', side_effect=[0.0, ms / 1000]):
+            timer.db_wrapper(lambda *args: None, f"SELECT {ms:g}", None, False, None)
+    return timer
+
+
+class RequestTimerTests(SimpleTestCase):
+    def test_only_the_slowest_queries_are_kept(self):
+        timer = timer_with_queries([5, 1, 9, 3, 7])
+
+        self.assertEqual(timer.slowest_queries(), [("SELECT 9", 9.0), ("SELECT 7", 7.0)])
+        self.assertEqual(timer.db_queries, 5)
+
+    def test_queries_are_not_kept_by_default(self):
+        self.assertEqual(timer_with_queries([5], max_queries=0).slowest_queries(), [])
+
+
+class SlowRequestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice')
+        self.request = RequestFactory().post(
+            '/api/chat/', HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def record(self, durations_ms=(120, 40, 300)):
+        timer = timer_with_queries(durations_ms)
+        timer.add('llm', 4000.0)
+        timer.add('embed', 150.0)
+        timer.annotate('candidates', 12)
+        record_slow_request(self.request, HttpResponse(status=200), timer, 'chat')
+
+    def test_breakdown_is_stored(self):
+        self.record()
+
+        slow_request = SlowRequest.objects.get()
+        self.assertEqual(slow_request.user, self.user)
+        self.assertEqual(slow_request.endpoint, 'chat')
+        self.assertEqual(slow_request.stages, {'llm': 4000.0, 'embed': 150.0})
+        self.assertEqual(slow_request.upstream_calls, {'embed': [150.0], 'llm': [4000.0]})
+        self.assertEqual(slow_request.db_queries, 3)
+        self.assertEqual([query['sql'] for query in slow_request.queries], ["SELECT 300", "SELECT 120"])
+        self.assertEqual(slow_request.candidates, 12)
+
+    @override_settings(SLOW_REQUEST_MAX_ROWS=2)
+    def test_only_the_newest_rows_are_kept(self):
+        for _ in range(4):
+            self.record()
+
+        self.assertEqual(SlowRequest.objects.count(), 2)
+
+    def test_report_lists_endpoints_and_slowest_query(self):
+        self.record()
+        output = StringIO()
+
+        call_command('slow_request_report', stdout=output)
+
+        report = output.getvalue()
+        self.assertIn("chat", report)
+        self.assertIn("alice", report)
+        self.assertIn("slowest query (300.0ms): SELECT 300", report)
+
+    def test_report_without_slow_requests(self):
+        output = StringIO()
+
+        call_command('slow_request_report', stdout=output)
+
+        self.assertIn("No slow requests recorded", output.getvalue())
@@ -0,0 +1,120 @@
+# backend/chat/tests/test_user_cache.py
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from chat.models import BackgroundImage
+from chat.services import BackgroundService, PromptService, SettingsService
+from chat import user_cache
+from chat.user_cache import UserDataCache, bump_version, clear_local_caches
+
+
+class UserDataCacheTests(TestCase):
+    def setUp(self):
+        caches['user_data'].clear()
+
+    def test_concurrent_misses_load_once(self):
+        cached = UserDataCache('test_stampede', 'test')
+        loads = []
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.1)
+            return {'value': 1}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cached.get(1, loader))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [{'value': 1}] * 8)
+
+    def test_bump_invalidates_and_none_is_cached(self):
+        cached = UserDataCache('test_bump', 'test')
+        values = iter([None, 'updated'])
+
+        self.assertIsNone(cached.get(1, lambda: next(values)))
+        self.assertIsNone(cached.get(1, lambda: next(values)))
+        bump_version('test', 1)
+
+        self.assertEqual(cached.get(1, lambda: next(values)), 'updated')
+
+    def test_caches_sharing_a_backend_see_a_bump_after_the_local_ttl(self):
+        # Two instances sharing the cache backend, as workers share Redis. With
+        # the in-memory backend, workers don't share it, see the check below.
+        worker, other_worker = (UserDataCache('test_workers', 'test', local_ttl_seconds=0) for _ in range(2))
+        worker.get(1, lambda: 'old')
+        other_worker.get(1, lambda: 'old')
+
+        bump_version('test', 1)
+
+        self.assertEqual(worker.get(1, lambda: 'new'), 'new')
+        self.assertEqual(other_worker.get(1, lambda: 'newer'), 'new')
+
+    def test_local_entries_are_evicted_least_recently_used_first(self):
+        cached = UserDataCache('test_lru', 'test', max_entries=2)
+        for user_id in (1, 2, 3):
+            cached.get(user_id, lambda: user_id)
+
+        self.assertEqual(list(cached._local), [2, 3])
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_in_memory_cache_is_refused_with_several_workers(self):
+        with mock.patch.object(user_cache, 'USER_CACHE_ENABLED', True), \
+                mock.patch.object(user_cache, 'WEB_CONCURRENCY', 4):
+            self.assertFalse(user_cache.is_enabled())
+            self.assertEqual([error.id for error in user_cache.check_shared_cache(None)], ['chat.E001'])
+            values = iter(['first', 'second'])
+            cached = UserDataCache('test_refused', 'test')
+            cached.get(1, lambda: next(values))
+            self.assertEqual(cached.get(1, lambda: next(values)), 'second')
+
+    @override_settings(ANSWER_CACHE_ENABLED=True)
+    def test_answer_cache_versions_need_a_shared_cache(self):
+        with mock.patch.object(user_cache, 'USER_CACHE_ENABLED', False), \
+                mock.patch.object(user_cache, 'WEB_CONCURRENCY', 4):
+            self.assertEqual([error.id for error in user_cache.check_shared_cache(None)], ['chat.E002'])
+
+    def test_in_memory_cache_is_used_by_a_single_worker(self):
+        with mock.patch.object(user_cache, 'USER_CACHE_ENABLED', True), \
+                mock.patch.object(user_cache, 'WEB_CONCURRENCY', 1):
+            self.assertTrue(user_cache.is_enabled())
+            self.assertEqual(user_cache.check_shared_cache(None), [])
+
+
+class UserDataInvalidationTests(TestCase):
+    def setUp(self):
+        caches['user_data'].clear()
+        clear_local_caches()
+        self.user = User.objects.create_user(username='alice')
+
+    def test_settings_update(self):
+        SettingsService.get_settings_data(self.user)
+
+        SettingsService.update_settings({'welcomeMessage': 'Hi!'}, self.user)
+
+        self.assertEqual(SettingsService.get_settings_data(self.user)['welcomeMessage'], 'Hi!')
+
+    def test_prompt_update(self):
+        PromptService.get_prompt_data(self.user)
+
+        PromptService.update_prompt({'name': 'Support'}, self.user)
+
+        self.assertEqual(PromptService.get_prompt_data(self.user)['name'], 'Support')
+
+    def test_background_delete(self):
+        background = BackgroundImage.objects.create(name='Sky', image='backgrounds/sky.png',
+                                                    is_active=True, user=self.user)
+        self.assertEqual(BackgroundService.get_active_background_data(self.user)['name'], 'Sky')
+
+        background.delete()
+
+        self.assertIsNone(BackgroundService.get_active_background_data(self.user))
@@ -0,0 +1,203 @@
+# backend/chat/timing.py
+"""
+Request-scoped stage timer reported in the Server-Timing response header
+
+Services mark their expensive calls with `timed_stage` and report request
+details such as candidate counts with `annotate`.
+Outside a request timed by ServerTimingMiddleware, or with the middleware
+disabled, these cost a single context variable lookup.
+"""
+import contextvars
+import functools
+import heapq
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """Stage durations, database queries and annotations of one request"""
+    
+    def __init__(self, max_queries=0):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.calls = {}
+        self.details = {}
+        self.db_queries = 0
+        self.db_ms = 0.0
+        # Min-heap of the max_queries slowest (milliseconds, sql), kept for the
+        # slow-request log
+        self.max_queries = max_queries
+        self._slowest = []
+    
+    def add(self, stage, ms):
+        """Add milliseconds to a stage, keeping the duration of each call"""
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+        self.calls.setdefault(stage, []).append(ms)
+    
+    def annotate(self, key, value):
+        """Add a count (candidates scanned, prompt tokens, ...) to the request's details"""
+        self.details[key] = self.details.get(key, 0) + value
+    
+    def measure(self, stage):
+        """Context manager timing a block as part of a stage"""
+        return _Measure(self, stage)
+    
+    def db_wrapper(self, execute, sql, params, many, context):
+        """Database execute wrapper counting queries and their time"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.db_queries += 1
+            self.db_ms += ms
+            if len(self._slowest) < self.max_queries:
+                heapq.heappush(self._slowest, (ms, sql))
+            elif self.max_queries and ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (ms, sql))
+    
+    def slowest_queries(self):
+        """(sql, milliseconds) of the slowest queries recorded, slowest first"""
+        return [(sql, ms) for ms, sql in sorted(self._slowest, reverse=True)]
+    
+    def total_ms(self):
+        return (time.perf_counter() - self.started_at) * 1000
+    
+    def as_dict(self):
+        """Stage durations rounded to whole milliseconds"""
+        return {stage: round(ms) for stage, ms in self.stages.items()}
+    
+    def header(self, db=True):
+        """Server-Timing header value, with the database time if it was recorded"""
+        metrics = [f"{stage};dur={ms:.1f}" for stage, ms in self.stages.items()]
+        if db:
+            metrics.append(f'db;desc="{self.db_queries} queries";dur={self.db_ms:.1f}')
+        metrics.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(metrics)
+
+
+class _Measure:
+    __slots__ = ('timer', 'stage', 'start')
+    
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exc_info):
+        self.timer.add(self.stage, (time.perf_counter() - self.start) * 1000)
+
+
+class MemoryProfile(RequestTimer):
+    """
+    Timer that also records each stage's peak Python memory, via tracemalloc
+    
+    `memory[stage]` is the largest increase over the memory in use when the
+    stage started, across all its calls. Nested stages count towards their
+    enclosing stages as well.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.memory = {}
+        self._stack = []
+    
+    def measure(self, stage):
+        return _MemoryMeasure(self, stage)
+    
+    def report(self):
+        """Peak memory and time per stage, largest first"""
+        return {
+            stage: {'peak_bytes': peak, 'ms': round(self.stages.get(stage, 0.0), 1)}
+            for stage, peak in sorted(self.memory.items(), key=lambda item: item[1], reverse=True)
+        }
+    
+    def _enter(self, stage):
+        current, peak = tracemalloc.get_traced_memory()
+        # Resetting the peak for this stage must not lose the enclosing stages' peaks
+        for frame in self._stack:
+            frame[2] = max(frame[2], peak)
+        tracemalloc.reset_peak()
+        self._stack.append([stage, current, current])
+    
+    def _exit(self):
+        stage, start, seen = self._stack.pop()
+        peak = max(seen, tracemalloc.get_traced_memory()[1])
+        self.memory[stage] = max(self.memory.get(stage, 0), peak - start)
+        for frame in self._stack:
+            frame[2] = max(frame[2], peak)
+
+
+class _MemoryMeasure(_Measure):
+    __slots__ = ()
+    
+    def __enter__(self):
+        self.timer._enter(self.stage)
+        super().__enter__()
+    
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        self.timer._exit()
+
+
+@contextmanager
+def memory_profile(stage='total'):
+    """
+    Profile the memory and time of the stages run inside the block
+    
+    Starts tracemalloc for the duration of the block unless it is already
+    tracing. The whole block is recorded as `stage`.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    profile = MemoryProfile()
+    token = _current_timer.set(profile)
+    try:
+        with profile.measure(stage):
+            yield profile
+    finally:
+        _current_timer.reset(token)
+        if started:
+            tracemalloc.stop()
+
+
+def start_request_timer(max_queries=0):
+    """Start timing the current request, returning the timer and a token to reset it"""
+    timer = RequestTimer(max_queries)
+    return timer, _current_timer.set(timer)
+
+
+def stop_request_timer(token):
+    _current_timer.reset(token)
+
+
+def current_timer():
+    """The timer of the current request, or None"""
+    return _current_timer.get()
+
+
+def annotate(key, value):
+    """Add a count to the current request's details, if it is being timed"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.annotate(key, value)
+
+
+def timed_stage(stage):
+    """Decorator adding each call's duration to a stage of the current request"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current_timer.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            with timer.measure(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
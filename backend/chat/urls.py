@@ -38,6 +38,14 @@ urlpatterns = [
     path('settings/', views.get_settings, name='get_settings'),
     path('settings/update/', views.update_settings, name='update_settings'),
     
+    # Usage endpoint
+    path('usage/', views.get_usage, name='get_usage'),
+    
+    # Monitoring endpoints
+    path('monitoring/admission/', views.admission_stats, name='admission_stats'),
+    path('monitoring/profiles/', views.list_profiles, name='list_profiles'),
+    path('monitoring/profiles/<str:name>/', views.download_profile, name='download_profile'),
+    
     # Public test endpoint
     path('public-test/', views.public_test, name='public_test'),
 ]
\ No newline at end of file
@@ -0,0 +1,243 @@
+# backend/chat/user_cache.py
+"""
+Read-through cache of per-user data that rarely changes (settings, prompt,
+background)
+
+Entries are keyed by user and a version counter kept in the `user_data`
+cache. The models bump the version when they are saved or deleted, so a
+write makes the entries unreachable instead of deleting them one by one. A
+small in-process LRU sits in front of that cache; its entries are trusted
+for USER_CACHE_LOCAL_TTL_SECONDS before the version is checked again.
+
+Other worker processes only see a bump through a shared backend (Redis).
+With the in-memory backend and several workers the cache is refused: the
+`chat.E001` system check fails and the cache stays off at runtime. The
+answer cache versions its entries with the `documents` group of the same
+counters, and is refused the same way (`chat.E002`).
+
+On a miss, one caller per user and entry loads the value while the others
+wait for it (a lock in this process, and a lock in Django's cache across
+processes), so an invalidation doesn't send every concurrent request to the
+database at once.
+"""
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+from . import metrics
+
+cache = ConnectionProxy(caches, 'user_data')
+
+WEB_CONCURRENCY = settings.WEB_CONCURRENCY
+USER_CACHE_ENABLED = settings.USER_CACHE_ENABLED
+USER_CACHE_TTL_SECONDS = settings.USER_CACHE_TTL_SECONDS
+USER_CACHE_LOCAL_SIZE = settings.USER_CACHE_LOCAL_SIZE
+USER_CACHE_LOCAL_TTL_SECONDS = settings.USER_CACHE_LOCAL_TTL_SECONDS
+USER_CACHE_LOCK_SECONDS = settings.USER_CACHE_LOCK_SECONDS
+
+
+def is_shared():
+    """Whether the user_data cache is shared between worker processes"""
+    return not isinstance(caches['user_data'], LocMemCache)
+
+
+def is_enabled():
+    """Whether caching is on, and safe with the configured backend and workers"""
+    return USER_CACHE_ENABLED and (WEB_CONCURRENCY <= 1 or is_shared())
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    errors = []
+    if USER_CACHE_ENABLED and not is_enabled():
+        errors.append(checks.Error(
+            "USER_CACHE_ENABLED needs a cache shared between the WEB_CONCURRENCY workers",
+            hint="Set REDIS_URL, or set USER_CACHE_ENABLED=False",
+            id='chat.E001',
+        ))
+    # Cached answers are versioned by a document counter kept in this cache
+    if settings.ANSWER_CACHE_ENABLED and WEB_CONCURRENCY > 1 and not is_shared():
+        errors.append(checks.Error(
+            "ANSWER_CACHE_ENABLED needs a cache shared between the WEB_CONCURRENCY workers",
+            hint="Set REDIS_URL, or set ANSWER_CACHE_ENABLED=False",
+            id='chat.E002',
+        ))
+    return errors
+
+
+def _version_key(group, user_id):
+    return f"user_data:version:{group}:{user_id}"
+
+
+def get_version(group, user_id):
+    """Current version of a user's data group, initializing it if missing"""
+    key = _version_key(group, user_id)
+    version = cache.get(key)
+    if version is None:
+        # A random start, so entries cached before the version was evicted
+        # can't match the new one
+        cache.add(key, random.getrandbits(48), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _increment(group, user_id):
+    key = _version_key(group, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, random.getrandbits(48), timeout=None)
+    for user_cache in list(UserDataCache.instances):
+        if user_cache.group == group:
+            user_cache.forget(user_id)
+
+
+def bump_version(group, user_id):
+    """Invalidate every cached entry of a user's data group"""
+    if user_id is None:
+        return
+    _increment(group, user_id)
+    # Again once the write is committed: a miss between the two bumps may
+    # have cached the data as it was before the transaction
+    transaction.on_commit(lambda: _increment(group, user_id))
+
+
+class UserDataCache:
+    """
+    Read-through cache of one value per user, invalidated with its version group
+
+    Values are shared between callers, which must not modify them.
+    """
+
+    POLL_INTERVAL_SECONDS = 0.02
+
+    # Every cache of this process, so a bump can drop their local entries
+    instances = weakref.WeakSet()
+
+    def __init__(self, name, group, max_entries=USER_CACHE_LOCAL_SIZE,
+                 local_ttl_seconds=USER_CACHE_LOCAL_TTL_SECONDS, ttl_seconds=USER_CACHE_TTL_SECONDS,
+                 lock_seconds=USER_CACHE_LOCK_SECONDS):
+        self.name = name
+        self.group = group
+        self.max_entries = max_entries
+        self.local_ttl_seconds = local_ttl_seconds
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        # user_id -> (version, checked_at, value), least recently used first
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        UserDataCache.instances.add(self)
+
+    def get(self, user_id, loader):
+        """
+        Get a user's value, calling `loader()` to compute it on a miss
+
+        Args:
+            user_id: The user the value belongs to
+            loader: Function returning the value, called at most once per miss
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        if not is_enabled() or user_id is None:
+            return loader()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry and now - entry[1] < self.local_ttl_seconds:
+                self._local.move_to_end(user_id)
+                metrics.CACHE_REQUESTS.inc(cache=self.name, result='hit')
+                return entry[2]
+
+        version = get_version(self.group, user_id)
+        if entry and entry[0] == version:
+            self._remember(user_id, version, entry[2])
+            metrics.CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return entry[2]
+
+        key = f"user_data:{self.name}:{user_id}:{version}"
+        cached = cache.get(key)
+        if cached is not None:
+            self._remember(user_id, version, cached[0])
+            metrics.CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return cached[0]
+
+        metrics.CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        value = self._load_once(user_id, key, loader)
+        self._remember(user_id, version, value)
+        return value
+
+    def forget(self, user_id):
+        """Forget this process's entry of a user"""
+        with self._lock:
+            self._local.pop(user_id, None)
+
+    def clear(self):
+        """Forget this process's entries"""
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, user_id, version, value):
+        with self._lock:
+            self._local[user_id] = (version, time.monotonic(), value)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _load_once(self, user_id, key, loader):
+        """Load a missing value, letting concurrent callers wait for one load"""
+        with self._lock:
+            load_lock = self._loading.setdefault(user_id, threading.Lock())
+
+        try:
+            with load_lock:
+                # Loaded by another thread of this process while we waited
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached[0]
+
+                lock_key = f"{key}:lock"
+                if not cache.add(lock_key, 1, timeout=self.lock_seconds):
+                    # Another process is loading it, wait for its result
+                    deadline = time.monotonic() + self.lock_seconds
+                    while time.monotonic() < deadline:
+                        time.sleep(self.POLL_INTERVAL_SECONDS)
+                        cached = cache.get(key)
+                        if cached is not None:
+                            return cached[0]
+                try:
+                    value = loader()
+                    # Wrapped, so a cached None is told apart from a miss
+                    cache.set(key, (value,), timeout=self.ttl_seconds)
+                finally:
+                    cache.delete(lock_key)
+                return value
+        finally:
+            with self._lock:
+                if self._loading.get(user_id) is load_lock:
+                    del self._loading[user_id]
+
+
+# Response payloads of the settings, prompt and background endpoints, and the
+# active Prompt instance the chat pipeline uses
+SETTINGS_RESPONSE = UserDataCache('settings_response', 'settings')
+PROMPT_RESPONSE = UserDataCache('prompt_response', 'prompt')
+ACTIVE_PROMPT = UserDataCache('active_prompt', 'prompt')
+BACKGROUND_RESPONSE = UserDataCache('background_response', 'background')
+
+
+def clear_local_caches():
+    """Forget the in-process entries of every user data cache"""
+    for user_cache in list(UserDataCache.instances):
+        user_cache.clear()
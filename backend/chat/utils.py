@@ -1,10 +1,47 @@
 # backend/chat/utils.py
 from django.http import JsonResponse
 import logging
+import threading
 import traceback
+from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+# Rough characters-per-token ratio for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a text without loading a tokenizer
+    
+    Args:
+        text: The text to measure
+        
+    Returns:
+        Approximate token count
+    """
+    if not text:
+        return 0
+    return max(len(text) // CHARS_PER_TOKEN, 1)
+
+class StatsCounter:
+    """Thread-safe in-process counters for pipeline statistics"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+    
+    def incr(self, name, amount=1):
+        """Increment a counter and return its new value"""
+        with self._lock:
+            self._counts[name] += amount
+            return self._counts[name]
+    
+    def snapshot(self):
+        """Return a copy of all counters"""
+        with self._lock:
+            return dict(self._counts)
+
 def error_response(message, status=400, log_error=True, exc=None):
     """
     Create a consistent error response
@@ -1,24 +1,29 @@
 # backend/chat/views.py
 import json
 import logging
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, FileResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import timedelta
 from rest_framework import generics
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Document, Conversation, BackgroundImage, Prompt, Settings
+from .models import Document, BackgroundImage, Prompt, Settings, UsageRollup
 from .serializers import UserSerializer
 from .utils import error_response, success_response
+from .middleware import CONTROLLERS, ADMISSION_SHED, PROFILE_STORE, jwt_user_id
+from . import metrics
 from .services import (
     RAGService, DocumentProcessingService, 
     BackgroundService, DocumentService, 
-    PromptService, SettingsService
+    PromptService, SettingsService,
+    RequestCoalescingService
 )
 
 logger = logging.getLogger(__name__)
@@ -86,6 +91,12 @@ def chat(request):
     Accepts JSON data with:
     - message: User's message/query
     - conversation_id: Optional ID to continue existing conversation
+    - idempotency_key: Optional client key identifying retries of one request
+      (the Idempotency-Key header works as well)
+    
+    Duplicate requests share one pipeline execution, and completed responses
+    are replayed for a short window. Without an idempotency key, only
+    requests continuing a conversation are matched as duplicates.
     """
     try:
         data = json.loads(request.body)
@@ -95,35 +106,41 @@ def chat(request):
             
         message = data['message']
         conversation_id = data.get('conversation_id')
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        
+        def process_chat():
+            # Use RAG service to process the query
+            rag_service = RAGService()
+            response, relevant_documents, resolved_conversation_id = rag_service.process_query(
+                message, 
+                conversation_id, 
+                user=request.user  
+            )
 
-        # Use RAG service to process the query
-        rag_service = RAGService()
-        response, relevant_documents = rag_service.process_query(
-            message, 
-            conversation_id, 
-            user=request.user  
-        )
-        
-        if not conversation_id:
-            conversation = Conversation.objects.filter(
-                user=request.user
-            ).latest('created_at')
-            conversation_id = conversation.session_id
-
-        # Format source information for the response
-        sources = []
-        for doc in relevant_documents:
-            sources.append({
-                'id': doc.id,
-                'title': doc.title,
-                'content_preview': doc.content[:100] + '...' if len(doc.content) > 100 else doc.content
-            })
-        
-        return success_response({
-            'response': response,
-            'conversation_id': conversation_id,
-            'sources': sources
-        })
+            # Format source information for the response
+            sources = []
+            for doc in relevant_documents:
+                sources.append({
+                    'id': doc.id,
+                    'title': doc.title,
+                    'content_preview': doc.content[:100] + '...' if len(doc.content) > 100 else doc.content
+                })
+            
+            # Fallback answers after an upstream error are not replayed to retries
+            return {
+                'response': response,
+                'conversation_id': resolved_conversation_id,
+                'sources': sources
+            }, rag_service.llm_service.last_error is None
+        
+        coalescer = RequestCoalescingService()
+        key = coalescer.make_key(request.user, conversation_id, message, idempotency_key)
+        response_data, replayed = coalescer.run(key, request.user, process_chat)
+        
+        response = success_response(response_data)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
         
     except json.JSONDecodeError:
         return error_response('Invalid JSON data', status=400)
@@ -202,13 +219,13 @@ def get_active_background(request):
     API endpoint to get the currently active background image
     """
     try:
-        active_background = BackgroundService.get_active_background(request.user)
+        active_background = BackgroundService.get_active_background_data(request.user)
         
         if active_background:
             return success_response({
-                'background_id': active_background.id,
-                'name': active_background.name,
-                'image_url': request.build_absolute_uri(active_background.image.url) if hasattr(active_background.image, 'url') else None
+                **active_background,
+                'image_url': request.build_absolute_uri(active_background['image_url'])
+                    if active_background['image_url'] else None
             })
         else:
             return success_response({
@@ -393,21 +410,10 @@ def get_prompt(request):
     """
     try:
         # Use the service to get prompt
-        prompt = PromptService.get_prompt(request.user)
+        prompt = PromptService.get_prompt_data(request.user)
         
         if prompt:
-            return success_response({
-                'prompt': {
-                    'id': prompt.id,
-                    'name': prompt.name,
-                    'assistant_role': prompt.assistant_role,
-                    'website_context': prompt.website_context,
-                    'knowledge_context': prompt.knowledge_context,
-                    'response_guidelines': prompt.response_guidelines,
-                    'restrictions': prompt.restrictions,
-                    'created_at': prompt.created_at.isoformat() if prompt.created_at else None
-                }
-            })
+            return success_response({'prompt': prompt})
         else:
             return success_response({
                 'message': 'No prompt found',
@@ -434,6 +440,8 @@ def update_prompt(request):
         
     except json.JSONDecodeError:
         return error_response('Invalid JSON data', status=400)
+    except ValueError as e:
+        return error_response(str(e), status=400, log_error=False)
     except Exception as e:
         return error_response(f"Error updating prompt: {str(e)}", status=500, exc=e)
 
@@ -445,27 +453,8 @@ def get_settings(request):
     API endpoint to get the current active settings
     """
     try:
-        # Use the service to get settings
-        settings = SettingsService.get_settings(request.user)
-        
-        # Convert to dictionary
-        settings_data = {
-            'id': settings.id,
-            'chatName': settings.chatName,
-            'colorPrimary': settings.colorPrimary,
-            'buttonBg': settings.buttonBg,
-            'welcomeMessage': settings.welcomeMessage,
-            'disclaimerTitle': settings.disclaimerTitle,
-            'disclaimerIntro': settings.disclaimerIntro,
-            'disclaimerPoints': settings.disclaimerPoints,
-            'acceptButtonText': settings.acceptButtonText,
-            'sendButtonText': settings.sendButtonText,
-            'footerDisclaimer': settings.footerDisclaimer,
-            'privacyPolicyText': settings.privacyPolicyText,
-            'is_active': settings.is_active,
-            'created_at': settings.created_at.isoformat() if settings.created_at else None,
-            'updated_at': settings.updated_at.isoformat() if settings.updated_at else None
-        }
+        # Use the service to get settings, already converted to a dictionary
+        settings_data = SettingsService.get_settings_data(request.user)
         
         return JsonResponse(settings_data)
             
@@ -509,6 +498,98 @@ class LogoutView(APIView):
         except Exception as e:
             return error_response(f"Error logging out: {str(e)}", status=400)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_usage(request):
+    """
+    API endpoint with the daily token usage and stage timings rollup
+    
+    Query parameters:
+    - days: Number of days to return (default: 30)
+    - all: Staff only, include every user instead of just the requester
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return error_response("days must be an integer", status=400, log_error=False)
+    
+    since = timezone.localdate() - timedelta(days=max(days, 1) - 1)
+    rollups = UsageRollup.objects.filter(date__gte=since).select_related('user').order_by('-date', 'model')
+    if not (request.user.is_staff and request.GET.get('all', '').lower() == 'true'):
+        rollups = rollups.filter(user=request.user)
+    
+    usage = []
+    for rollup in rollups:
+        usage.append({
+            'user': rollup.user.username if rollup.user else None,
+            'date': rollup.date.isoformat(),
+            'model': rollup.model,
+            'requests': rollup.requests,
+            'prompt_tokens': rollup.prompt_tokens,
+            'completion_tokens': rollup.completion_tokens,
+            'cached_tokens': rollup.cached_tokens,
+            'avg_ms': {
+                stage: round(getattr(rollup, f"{stage}_ms") / rollup.requests, 1)
+                for stage in ['embed', 'search', 'history', 'llm', 'persist', 'total']
+            }
+        })
+    
+    return success_response({'usage': usage})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_profiles(request):
+    """
+    API endpoint listing the stored request profiles, newest first
+    """
+    return success_response({'profiles': PROFILE_STORE.list()})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def download_profile(request, name):
+    """
+    API endpoint to download a stored request profile
+    """
+    path = PROFILE_STORE.path(name)
+    if path is None:
+        return error_response("Profile not found", status=404, log_error=False)
+    
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint with the metrics of all worker processes
+    
+    Requires METRICS_TOKEN as a Bearer token when it is set. Without it, only
+    staff users can scrape, unless DEBUG is on.
+    """
+    from django.conf import settings as django_settings
+    
+    if not django_settings.METRICS_ENABLED:
+        return error_response("Metrics are disabled", status=404, log_error=False)
+    if django_settings.METRICS_TOKEN:
+        if request.META.get('HTTP_AUTHORIZATION') != f"Bearer {django_settings.METRICS_TOKEN}":
+            return error_response("Invalid metrics token", status=401, log_error=False)
+    elif not django_settings.DEBUG:
+        user_id = jwt_user_id(request)
+        if user_id is None or not User.objects.filter(pk=user_id, is_staff=True, is_active=True).exists():
+            return error_response("Staff authentication or METRICS_TOKEN required", status=401, log_error=False)
+    
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admission_stats(request):
+    """
+    API endpoint with the admission control queue depth and shed counts
+    of this worker process (/metrics has the totals of all workers)
+    """
+    return success_response({
+        'endpoints': {name: controller.stats() for name, controller in CONTROLLERS.items()},
+        'shed': ADMISSION_SHED.snapshot()
+    })
+
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
 def public_test(request):
@@ -62,6 +62,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.middleware.ServerTimingMiddleware',
+    'chat.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -70,6 +72,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'chat.middleware.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -110,6 +113,39 @@ else:
         }
     }
 
+# Caches: with REDIS_URL set, all worker processes share Redis. Otherwise every
+# process has its own in-memory caches, which can't be invalidated across
+# WEB_CONCURRENCY > 1 workers. User data has a cache of its own, so the many
+# sentence embeddings can't evict its version counters.
+REDIS_URL = os.getenv('REDIS_URL') or None
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'user_data': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'user_data',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        },
+        'user_data': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'user_data',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        },
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -146,16 +182,228 @@ CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
 ]
 
+# Logging: pipeline payloads (context window, history, model response) are only
+# dumped for the sampled share of requests and truncated to the max chars.
+# With LOG_ASYNC, records are written by a listener thread, off the request
+# thread. LOG_FORMAT is 'text' or 'json'.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'True').lower() == 'true'
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+        'json': {'()': 'chat.log.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'loggers': {
+        'chat': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # OpenAI settings from environment variables
 OPENAI_KEY = os.getenv('OPENAI_KEY')
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL')
 LLM_MODEL = os.getenv('LLM_MODEL')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+
+# Model tiers for latency-aware routing, fastest first. Short questions with
+# one clearly relevant chunk and little history go to the fast tier, unless
+# its observed latency (EWMA) is worse than the default tier's; then only
+# ROUTING_EXPLORE_RATE of them do, so its latency can recover. Routing is
+# off while LLM_FAST_MODEL is unset. Tenants can only pin tier models.
+LLM_FAST_MODEL = os.getenv('LLM_FAST_MODEL')
+LLM_MODEL_TIERS = [
+    tier for tier in [
+        {'name': 'fast', 'model': LLM_FAST_MODEL, 'max_tokens': 300},
+        {'name': 'default', 'model': LLM_MODEL, 'max_tokens': 500},
+    ] if tier['model']
+]
+ROUTING_MAX_QUERY_TOKENS = int(os.getenv('ROUTING_MAX_QUERY_TOKENS', '32'))
+ROUTING_MIN_TOP_SCORE = float(os.getenv('ROUTING_MIN_TOP_SCORE', '0.5'))
+ROUTING_MIN_SCORE_MARGIN = float(os.getenv('ROUTING_MIN_SCORE_MARGIN', '0.05'))
+ROUTING_MAX_HISTORY_TOKENS = int(os.getenv('ROUTING_MAX_HISTORY_TOKENS', '500'))
+ROUTING_EWMA_ALPHA = float(os.getenv('ROUTING_EWMA_ALPHA', '0.2'))
+ROUTING_EXPLORE_RATE = float(os.getenv('ROUTING_EXPLORE_RATE', '0.05'))
+
+# Follow-up questions are first scored against the previous turn's top
+# candidates stored on the conversation; the full index is only searched when
+# the best candidate scores below the minimum similarity.
+RETRIEVAL_REUSE_CANDIDATES = int(os.getenv('RETRIEVAL_REUSE_CANDIDATES', '20'))
+RETRIEVAL_REUSE_MIN_SCORE = float(os.getenv('RETRIEVAL_REUSE_MIN_SCORE', '0.5'))
+
+# Retrieval router lexicons, comma-separated and lower case, English and
+# Hungarian by default: acknowledgements that need no documents, yes/no
+# confirmations and rework requests that reuse the previous turn's documents,
+# and the anaphora and question words its follow-up model scores
+def env_list(name, default):
+    return [item.strip().lower() for item in os.getenv(name, default).split(',') if item.strip()]
+
+RETRIEVAL_ROUTER_ACKNOWLEDGEMENTS = env_list('RETRIEVAL_ROUTER_ACKNOWLEDGEMENTS', (
+    "ok,okay,thanks,thank you,thank you so much,thank you very much,thx,ty,great,cool,nice,perfect,"
+    "awesome,got it,understood,i see,alright,sure,hi,hello,hey,bye,goodbye,good morning,"
+    "good afternoon,good evening,oké,köszönöm,köszönöm szépen,köszi,kösz,rendben,értem,szuper,"
+    "tökéletes,szia,sziasztok,helló,jó napot,jó reggelt,jó estét,viszlát,viszontlátásra"
+))
+RETRIEVAL_ROUTER_CONFIRMATIONS = env_list('RETRIEVAL_ROUTER_CONFIRMATIONS', (
+    "yes,yeah,yep,no,nope,igen,nem,persze"
+))
+RETRIEVAL_ROUTER_REUSE_PHRASES = env_list('RETRIEVAL_ROUTER_REUSE_PHRASES', (
+    "repeat,rephrase,reword,shorter,simpler,briefly,summarise,summarize,elaborate,more detail,"
+    "in other words,what do you mean,say that again,translate,explain that,explain it,explain this,"
+    "ismételd,fogalmazd át,röviden,rövidebben,egyszerűbben,részletesebben,bővebben,foglald össze,"
+    "magyarázd el,fordítsd le,hogy érted"
+))
+RETRIEVAL_ROUTER_ANAPHORA = env_list('RETRIEVAL_ROUTER_ANAPHORA', (
+    "it,that,this,those,these,they,them,its,above,previous,"
+    "ez,ezt,azt,ennek,annak,ezek,azok,erről,arról,előző,ugyanez"
+))
+RETRIEVAL_ROUTER_QUESTION_WORDS = env_list('RETRIEVAL_ROUTER_QUESTION_WORDS', (
+    "what,who,where,when,why,how,which,can,does,do,is,are,"
+    "mi,mit,ki,kit,hol,mikor,miért,hogyan,melyik,mennyi,lehet,van"
+))
 
 # Document processing settings
 MAX_DOCUMENTS = 3
 
+# Hierarchical chunking: PDFs are split into parent sections, which are split
+# again into small child chunks that get embedded and scored at query time.
+# The best child hits are expanded to a window of their parent's text.
+CHILD_CHUNK_SIZE = int(os.getenv('CHILD_CHUNK_SIZE', '500'))
+CHILD_CHUNK_OVERLAP = int(os.getenv('CHILD_CHUNK_OVERLAP', '50'))
+CONTEXT_WINDOW_CHARS = int(os.getenv('CONTEXT_WINDOW_CHARS', '1500'))
+
+# Extractive context compression: keep only the retrieved sentences that are
+# most similar to the query, up to a ratio of the original context and an
+# optional token target (0 disables the target). Sentence embeddings are
+# warmed at ingestion and expire from the cache after the TTL.
+CONTEXT_COMPRESSION_ENABLED = os.getenv('CONTEXT_COMPRESSION_ENABLED', 'False').lower() == 'true'
+CONTEXT_COMPRESSION_RATIO = float(os.getenv('CONTEXT_COMPRESSION_RATIO', '0.5'))
+CONTEXT_COMPRESSION_MAX_TOKENS = int(os.getenv('CONTEXT_COMPRESSION_MAX_TOKENS', '0'))
+SENTENCE_EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv('SENTENCE_EMBEDDING_CACHE_TTL_SECONDS', str(7 * 86400)))
+
+# Conversation history: once the messages not yet covered by the rolling
+# summary exceed the token threshold, the summary is refreshed in the
+# background and only the HISTORY_RECENT_MESSAGES most recent messages are
+# sent verbatim. Each refresh folds at most HISTORY_SUMMARY_FOLD_MESSAGES
+# messages per LLM call.
+HISTORY_MAX_MESSAGES = 5
+HISTORY_SUMMARY_TOKEN_THRESHOLD = int(os.getenv('HISTORY_SUMMARY_TOKEN_THRESHOLD', '1000'))
+HISTORY_RECENT_MESSAGES = int(os.getenv('HISTORY_RECENT_MESSAGES', '2'))
+HISTORY_SUMMARY_FOLD_MESSAGES = int(os.getenv('HISTORY_SUMMARY_FOLD_MESSAGES', '20'))
+
+# System prompt layout: "classic" places the retrieved information between the
+# static sections, "cache_friendly" renders all static sections first so the
+# provider's automatic prefix caching can apply (prefixes of 1024+ tokens)
+PROMPT_LAYOUT = os.getenv('PROMPT_LAYOUT', 'classic')
+
+# Answer cache for repeated questions at the start of a conversation: exact
+# match on the normalized query first, then embedding similarity above the
+# threshold. Entries are tied to the active document set and prompt version.
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'False').lower() == 'true'
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv('ANSWER_CACHE_SIMILARITY_THRESHOLD', '0.95'))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', '86400'))
+ANSWER_CACHE_MAX_CANDIDATES = int(os.getenv('ANSWER_CACHE_MAX_CANDIDATES', '500'))
+
+# Duplicate chat requests (same user, conversation and message, or the same
+# Idempotency-Key) share one pipeline execution, and completed responses are
+# replayed for the replay window. Duplicates wait at most the coalesce wait,
+# which is also when an unfinished request from a dead worker is taken over.
+CHAT_REPLAY_WINDOW_SECONDS = int(os.getenv('CHAT_REPLAY_WINDOW_SECONDS', '30'))
+CHAT_COALESCE_WAIT_SECONDS = int(os.getenv('CHAT_COALESCE_WAIT_SECONDS', '120'))
+
+# Latency budget for one chat request, and the deadlines of its upstream
+# stages (each capped by what is left of the budget). A missed embedding
+# deadline falls back to lexical retrieval, a missed LLM deadline to a
+# retrieval-only answer. With a hedge delay > 0 a second LLM request is sent
+# when the first one hasn't answered after that many seconds.
+CHAT_LATENCY_BUDGET_SECONDS = float(os.getenv('CHAT_LATENCY_BUDGET_SECONDS', '30'))
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv('EMBEDDING_TIMEOUT_SECONDS', '5'))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '25'))
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_DELAY_SECONDS', '0'))
+
+# Concurrent query embeddings are collected for up to the batch window (or
+# until the batch is full) and sent as one API call. A window of 0 disables
+# micro-batching.
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '0'))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '32'))
+
+# Admission control for expensive endpoints (per worker process): at most
+# `concurrency` requests run at once, the rest wait in a queue of `queue_size`.
+# Requests whose expected wait exceeds the target get a 429 with Retry-After,
+# and a single user can hold at most ADMISSION_MAX_PER_USER slots.
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() == 'true'
+ADMISSION_LIMITS = {
+    'chat': {
+        'concurrency': int(os.getenv('ADMISSION_CHAT_CONCURRENCY', '8')),
+        'queue_size': int(os.getenv('ADMISSION_CHAT_QUEUE_SIZE', '32')),
+    },
+    'upload_pdf': {
+        'concurrency': int(os.getenv('ADMISSION_UPLOAD_CONCURRENCY', '2')),
+        'queue_size': int(os.getenv('ADMISSION_UPLOAD_QUEUE_SIZE', '8')),
+    },
+}
+# Threads sending hedged LLM requests: two per chat request admitted at once,
+# so a request never waits in the queue behind others while its deadline runs
+LLM_HEDGE_MAX_WORKERS = int(os.getenv('LLM_HEDGE_MAX_WORKERS', str(2 * ADMISSION_LIMITS['chat']['concurrency'])))
+ADMISSION_TARGET_WAIT_SECONDS = float(os.getenv('ADMISSION_TARGET_WAIT_SECONDS', '10'))
+ADMISSION_MAX_PER_USER = int(os.getenv('ADMISSION_MAX_PER_USER', '2'))
+
+# Server-Timing response header with the duration of the pipeline stages, and
+# of the database queries when they are recorded for the slow-request log or
+# METRICS_DB_ENABLED. Browsers only show it to other origins
+# listed in SERVER_TIMING_ALLOW_ORIGIN (e.g. the frontend's URL, or *).
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'True').lower() == 'true'
+SERVER_TIMING_ALLOW_ORIGIN = os.getenv('SERVER_TIMING_ALLOW_ORIGIN', '')
+
+# Prometheus metrics served at /metrics. With METRICS_DIR set, worker processes
+# share their values through memory-mapped files in that directory (clear it
+# on deploy). METRICS_TOKEN, when set, is required as a Bearer token; without
+# it only staff users can scrape, unless DEBUG is on. METRICS_DB_ENABLED adds
+# per-request database query counts and time, which wraps every query.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_DB_ENABLED = os.getenv('METRICS_DB_ENABLED', 'False').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+# Request profiling: staff can profile a request with the X-Profile header (or
+# ?profile=), and PROFILING_SAMPLE_RATE profiles a random share of all requests
+# with the low-overhead sampling profiler. Profiles are kept in PROFILE_DIR,
+# newest PROFILE_MAX_FILES only.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILING_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+
+# Slow-request log: requests taking at least SLOW_REQUEST_MS (0 disables) are
+# stored with their stage timings, upstream call latencies and slowest SQL
+# queries. Only the newest SLOW_REQUEST_MAX_ROWS are kept.
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '5000'))
+SLOW_REQUEST_MAX_ROWS = int(os.getenv('SLOW_REQUEST_MAX_ROWS', '1000'))
+SLOW_REQUEST_MAX_QUERIES = int(os.getenv('SLOW_REQUEST_MAX_QUERIES', '20'))
+
+# Read-through cache of each user's settings, prompt and active background:
+# an in-process LRU of USER_CACHE_LOCAL_SIZE users in front of the user_data
+# cache. Saving one of these models invalidates its entries; other workers
+# notice within USER_CACHE_LOCAL_TTL_SECONDS, which needs the shared Redis
+# cache. By default it's on with Redis or a single worker.
+USER_CACHE_ENABLED = os.getenv(
+    'USER_CACHE_ENABLED', str(bool(REDIS_URL) or WEB_CONCURRENCY <= 1)
+).lower() == 'true'
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', '3600'))
+USER_CACHE_LOCAL_SIZE = int(os.getenv('USER_CACHE_LOCAL_SIZE', '1024'))
+USER_CACHE_LOCAL_TTL_SECONDS = float(os.getenv('USER_CACHE_LOCAL_TTL_SECONDS', '5'))
+USER_CACHE_LOCK_SECONDS = float(os.getenv('USER_CACHE_LOCK_SECONDS', '5'))
+
 
 
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
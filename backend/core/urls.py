@@ -4,10 +4,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from chat.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('chat.urls')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development